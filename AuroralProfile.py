@@ -33,7 +33,7 @@ def main():
     # set some default parameters bundled up as a Class
     sim = SimpleSim(filt="bg3", inpath=p.path, transcarutc="2013-03-31T09:00:21Z")
 
-    Peigen, EKpcolor, Peigenunfilt = getTranscar(sim, p.alt, p.zenithang)
+    Peigen, EKpcolor, Peigenunfilt, _, _ = getTranscar(sim, p.alt, p.zenithang)
     # %% write output (overwrites existing  HDF5 file)
     if p.outfn:
         h5fn = Path(p.outfn).expanduser()
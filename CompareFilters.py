@@ -3,9 +3,9 @@ from pathlib import Path
 from numpy import arange
 from argparse import ArgumentParser
 from matplotlib.pyplot import show
-from gridaurora.filterload import getSystemT
+from gridaurora.filterload import getSystemTs
 import gridaurora.plots as gap
-from typing import List
+from typing import Dict, List
 import seaborn as sns
 
 sns.set_style("whitegrid")
@@ -15,11 +15,17 @@ R = Path(__file__).parent
 
 
 def selftest(
-    bg3fn: Path, windfn: Path, qefn: Path, mmsLambda: List[float], obsalt_km: float, zenang_deg: float,
+    filterfns: List[Path],
+    windfn: Path,
+    qefn: Path,
+    mmsLambda: List[float],
+    obsalt_km: float,
+    zenang_deg: float,
+    products: Dict[str, List[str]],
 ):
 
     newLambda = arange(mmsLambda[0], mmsLambda[1] + mmsLambda[2], mmsLambda[2], dtype=float)
-    return getSystemT(newLambda, bg3fn, windfn, qefn, obsalt_km, zenang_deg)
+    return getSystemTs(newLambda, filterfns, windfn, qefn, obsalt_km, zenang_deg, products)
 
 
 def main():
@@ -45,22 +51,13 @@ def main():
 
     windFN = inpath / "ixonWindowT.h5"
     qeFN = inpath / "emccdQE.h5"
-    # %%
-    Ts = []
-    for f in flist:
-        T = selftest(f, windFN, qeFN, p.wlnm, p.altkm, p.zenang)
-        Ts.append(T)
-        # gap.plotT(T, p.wlnm,fname)
-    # %% Rayleigh 1924
-    Tr = 1.0
-    RayleighFilterNames = ["Hoya V-10", "Wratten 21"]
-    for r in RayleighFilterNames:
-        Tr *= Ts[r]["filter"]
-    Tr.filename = "Rayleigh 1924"
-    Ts.append(Tr)
+    # %% all filters, and Rayleigh 1924, in one pass
+    products = {"Rayleigh 1924": ["Hoya V-10", "Wratten 21"]}
+    T = selftest(flist, windFN, qeFN, p.wlnm, p.altkm, p.zenang, products)
 
+    Ts = [T.sel(filtername=f).assign_attrs(filename=f) for f in T.filtername.values]
     # %%
-    gap.comparefilters(Ts, RayleighFilterNames)
+    gap.comparefilters(Ts)
 
     show()
 
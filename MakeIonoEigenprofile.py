@@ -66,8 +66,8 @@ def main():
 
     if len(p.simtime) == 1:
         T = [parse(p.simtime[0])]
-    elif len(p.simtime) == 2:
-        T = list(rrule.rrule(rrule.HOURLY, dtstart=parse(p.simtime[0]), until=parse(p.simtime[1])))
+    elif len(p.simtime) == 2:  # hourly times, generated one at a time
+        T = rrule.rrule(rrule.HOURLY, dtstart=parse(p.simtime[0]), until=parse(p.simtime[1]))
     # %% input unit flux
     Egrid = loadregress(Path(p.inputgridfn).expanduser())
     Ebins = makebin(Egrid)[:3]
@@ -82,20 +82,20 @@ def main():
     glat, glon = p.latlon
 
     if model == "glow":
-        ver, photIon, isr, phitop, zceta, sza, prates, lrates, tezs, sion = makeeigen(
-            EK, diffnumflux, T, p.latlon, p.makeplot, p.outfn, p.zlim
-        )
-
-        writeeigen(p.outfn, EKpcolor, T, ver.z_km, diffnumflux, ver, prates, lrates, tezs, p.latlon)
         # %% plots
         # input
         doplot(p.inputgridfn, Ebins)
 
-        # output
         sim = namedtuple("sim", ["reacreq", "opticalfilter"])
         sim.reacreq = sim.opticalfilter = ""
+        # %% one time step at a time, appended to the file, so memory does not grow with the run length
+        for i, t in enumerate(T):
+            ver, photIon, isr, phitop, zceta, sza, prates, lrates, tezs, sion = makeeigen(
+                EK, diffnumflux, [t], p.latlon, p.makeplot, p.outfn, p.zlim
+            )
 
-        for t in ver:  # TODO for each time
+            writeeigen(p.outfn, EKpcolor, [t], ver.z_km, diffnumflux, ver, prates, lrates, tezs, p.latlon, append=i > 0)
+            # output
             # VER eigenprofiles, summed over wavelength
             ploteigver(
                 EKpcolor, ver.z_km, ver.sum("wavelength_nm"), (None,) * 6, sim, "{} Vol. Emis. Rate ".format(t),
@@ -108,6 +108,7 @@ def main():
             plotenerdep(tezs, t, glat, glon, p.zlim)
 
     elif model == "rees":
+        T = list(T)
         assert len(T) == 1, "only one time with rees for now."
         z = glowalt()
         q = reesiono(T, z, Ebins.loc[:, "low"], glat, glon, p.isotropic)
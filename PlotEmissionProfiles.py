@@ -52,14 +52,16 @@ def main():
     # %%
     tctime = tr.readTranscarInput(simpath / p.datcarfn)
 
-    excrates = excrates.isel(time=tReqInd)
-    t = excrates.time
+    t = excrates.time[tReqInd]
 
     if t < np.datetime64(tctime["tstartPrecip"]):
         logging.warning("you picked a time before precipitation started, so youre looking at AIRGLOW instead of AURORA!")
-
+    # all times in one pass, then pick the requested time
     tver, ver, br = calcemissions(excrates["excitation"], sim)
-    optT = getSystemT(tver.index, sim.bg3fn, sim.windowfn, sim.qefn, sim.obsalt_km, sim.zenang)
+    tver = tver.isel(time=tReqInd)
+    br = br[tReqInd]
+
+    optT = getSystemT(tver.wavelength_nm, sim.bg3fn, sim.windowfn, sim.qefn, sim.obsalt_km, sim.zenang)
     # %% write as hdf5
     if p.outfile:
         h5fn = Path(p.outfile).expanduser()
@@ -67,9 +69,9 @@ def main():
         with h5py.File(h5fn, "w") as f:
             d = f.create_dataset("/ver", data=tver.values)  # volume emission rate per beam vs. altitude and wavelength
             d.attrs["units"] = "photons cm^-3 sr^-1 s^-1 eV^-1"
-            d = f.create_dataset("/wavelength", data=tver.index)
+            d = f.create_dataset("/wavelength", data=tver.wavelength_nm)
             d.attrs["units"] = "nm"
-            d = f.create_dataset("/altitude", data=tver.columns)
+            d = f.create_dataset("/altitude", data=tver.alt_km)
             d.attrs["units"] = "km"
     # %% plots
     if p.makeplot:
@@ -3,19 +3,53 @@
 creates optical emissions from excitation rates
 """
 from pathlib import Path
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
+from typing import Deque, Dict, Iterator, Sequence, Union
 import logging
 import xarray
 import numpy as np
 import h5py
 
 #
-from gridaurora.opticalmod import opticalModel
-from gridaurora.calcemissions import calcemissions, sortelimlambda
+from gridaurora.opticalmod import opticalModel, opticalModelRates
+from gridaurora.calcemissions import loadreactions, sortelimlambda
 from transcarread import calcVERtc
 
 
-def getTranscar(sim, obsAlt_km: float, zenithang: float) -> tuple:
+PRODUCTS = {"filtered": "Peigen", "unfiltered": "Peigenunfilt", "lines": "br", "cube": "Plambda"}
+READAHEAD = 2  # beams read ahead of the consumer, per worker
+
+
+def getTranscar(
+    sim,
+    obsAlt_km: float,
+    zenithang: float,
+    workers: int = 1,
+    pool: str = "process",
+    h5fn: Path = None,
+    products: Sequence[str] = ("filtered", "unfiltered"),
+) -> tuple:
+    """
+    workers: number of beams read in parallel, 1 is serial
+    pool: "process" or "thread" pool for the parallel beam reads
+    h5fn: optional HDF5 checkpoint file. Each beam's products are written as soon as the beam
+          is finished, and beams already complete in the file are not recomputed,
+          so an interrupted run resumes where it stopped.
+    products: reductions to keep, any of
+        filtered:   Peigen, gray VER through the optical system  Nalt x Nenergy
+        unfiltered: Peigenunfilt, VER summed over wavelength  Nalt x Nenergy
+        lines:      br, column brightness of each line  Nwavelength x Nenergy
+        cube:       Plambda, the full VER  Nalt x Nwavelength x Nenergy.  Large, build only if needed.
+
+    output:
+    Peigen, EKpcolor, Peigenunfilt, br, Plambda   (None for products not requested)
+
+    beams are independent, and the output is identical to the serial run
+    """
     zeroUnusedBeams = False
+    br = Plambda = None
 
     if sim.loadver:  # from JGR2013, NOT used much
         Plambda, Ek = loadver(sim.loadverfn)
@@ -34,6 +68,7 @@ def getTranscar(sim, obsAlt_km: float, zenithang: float) -> tuple:
             Peigen[:, iEn] = opticalModel(sim, Plambda.iloc[:, :, iEn].T, obsAlt_km, zenithang)
 
         Peigenunfilt = Plambda.sum(axis=0)  # from matlab, which already did this
+        Plambda = None
     else:  # read from transcar emissions.dat (TYPICALLY USED)
         # %% load transcar simulation outputs and modulate by optT
         Ek, EKpcolor = getBeamEnergies(sim.transcarev)
@@ -48,38 +83,212 @@ def getTranscar(sim, obsAlt_km: float, zenithang: float) -> tuple:
         lowestBeamUsedInd = getbeamsused(zeroUnusedBeams, Ek, sim.minbeamev)
         nEnergy = Ek.size - lowestBeamUsedInd
 
-        PlambdaAccum: np.ndarray = None  # for later testing
-        for iEn in range(nEnergy):
+        Ek = Ek[:nEnergy]
+        op = loadreactions(sim.reactionfn).operator(sim.reacreq)
 
-            spec, tTC, tTCind = calcVERtc(sim.excratesfn, sim.transcarpath, Ek[iEn], tReq, sim)
+        names = [PRODUCTS[p] for p in products]  # KeyError for unknown products
+        config = checkpointconfig(sim, obsAlt_km, zenithang)
+        done, z, store = loadcheckpoint(h5fn, Ek, op.wavelength_nm, names, config)
+        first = np.flatnonzero(done)[0] if done.any() else None
 
-            Plambda, _, _ = calcemissions(spec, sim)
-            if Plambda is None:  # couldn't read this beam
+        todo = np.flatnonzero(~done)
+        for iEn, spec in zip(todo, readbeams(sim, Ek[todo], tReq, workers, pool)):
+            if spec is None:  # couldn't read this beam
                 logging.info(f"skipped reading beam {Ek[iEn]}")
                 continue
-            z = Plambda.alt_km
 
-            if iEn == lowestBeamUsedInd:
-                PlambdaAccum = np.zeros((Plambda.shape[0], Plambda.shape[1], nEnergy), order="F")
-                Peigen = np.zeros((z.size, nEnergy), dtype=float, order="F")
+            beam = beamproducts(sim, spec, op, names, obsAlt_km, zenithang)
 
-            PlambdaAccum[..., iEn] = Plambda  # Nalt x Nwavelength x Nenergy
-            Peigen[:, iEn] = opticalModel(sim, Plambda, obsAlt_km, zenithang)
+            if not store:
+                z = spec.alt_km.values
+                store = {k: np.zeros(v.shape + (nEnergy,), order="F") for k, v in beam.items()}
+            elif not np.array_equal(spec.alt_km.values, z):
+                raise ValueError(f"beam {Ek[iEn]} altitudes differ from the other beams")
 
-            if iEn != lowestBeamUsedInd:
-                if all(Peigen[:, iEn] == Peigen[:, lowestBeamUsedInd]):
-                    logging.error(f"all Peigen for beam {Ek[iEn]} equal Peigen: beam {Ek[lowestBeamUsedInd]}")
+            for k, v in beam.items():
+                store[k][..., iEn] = v
 
-        if PlambdaAccum is None:  # no beams at all were read
-            raise ValueError("No beams were usable")
+            if first is None:
+                first = iEn
+            elif "Peigen" in store and all(store["Peigen"][:, iEn] == store["Peigen"][:, first]):
+                logging.error(f"all Peigen for beam {Ek[iEn]} equal Peigen: beam {Ek[first]}")
 
-        Peigenunfilt = xarray.DataArray(
-            data=PlambdaAccum.sum(axis=1), coords=[("alt_km", z), ("energy_ev", Ek)],  # sum over wavelength axis=1
-        )
+            if h5fn:
+                writecheckpoint(h5fn, iEn, Ek, z, op.wavelength_nm, beam, config)
 
-    Peigen = xarray.DataArray(data=Peigen, coords=[("alt_km", z), ("energy_ev", Ek)])
+        if not store:  # no beams at all were read
+            raise ValueError("No beams were usable")
 
-    return Peigen, EKpcolor, Peigenunfilt
+        Peigen = store.get("Peigen")
+        Peigenunfilt = store.get("Peigenunfilt")
+        if Peigenunfilt is not None:
+            Peigenunfilt = xarray.DataArray(data=Peigenunfilt, coords=[("alt_km", z), ("energy_ev", Ek)])
+
+        if "br" in store:
+            br = xarray.DataArray(data=store["br"], coords=[("wavelength_nm", op.wavelength_nm), ("energy_ev", Ek)])
+        if "Plambda" in store:
+            Plambda = xarray.DataArray(
+                data=store["Plambda"], coords=[("alt_km", z), ("wavelength_nm", op.wavelength_nm), ("energy_ev", Ek)]
+            )
+
+    if Peigen is not None:
+        Peigen = xarray.DataArray(data=Peigen, coords=[("alt_km", z), ("energy_ev", Ek)])
+
+    return Peigen, EKpcolor, Peigenunfilt, br, Plambda
+
+
+def readbeams(sim, Ek: np.ndarray, tReq, workers: int = 1, pool: str = "process") -> Iterator[xarray.DataArray]:
+    """
+    excitation rates of each beam, yielded in beam order.
+    With workers > 1 the beams are read concurrently, at most READAHEAD * workers ahead of the consumer,
+    so finished beams do not pile up in memory when the consumer is the slower side.
+    """
+    if workers <= 1:
+        yield from map(_readbeam, repeat(sim), Ek, repeat(tReq))
+        return
+
+    if pool == "process":
+        Executor = ProcessPoolExecutor
+    elif pool == "thread":
+        Executor = ThreadPoolExecutor
+    else:
+        raise ValueError(f"unknown pool type {pool}, use process or thread")
+
+    pending: Deque[Future] = deque()
+    with Executor(max_workers=workers) as ex:
+        try:
+            for E in Ek:
+                if len(pending) >= READAHEAD * workers:
+                    yield pending.popleft().result()
+                pending.append(ex.submit(_readbeam, sim, E, tReq))
+
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for f in pending:
+                f.cancel()
+
+
+def _readbeam(sim, E: float, tReq) -> xarray.DataArray:
+    return calcVERtc(sim.excratesfn, sim.transcarpath, E, tReq, sim)[0]
+
+
+def beamproducts(
+    sim, spec: xarray.DataArray, op, names: Sequence[str], obsAlt_km: float, zenithang: float
+) -> Dict[str, np.ndarray]:
+    """
+    requested reductions of one beam. VER and its reductions are linear in the excitation rates,
+    so only the cube needs the Nalt x Nwavelength VER.
+    """
+    rates = spec.loc[..., op.reaction].values
+    out = {}
+
+    if "Peigen" in names:
+        out["Peigen"] = opticalModelRates(sim, spec, obsAlt_km, zenithang).values
+    if "Peigenunfilt" in names:
+        out["Peigenunfilt"] = rates @ op.weights()  # sum over wavelength
+    if "br" in names:
+        out["br"] = np.trapz(rates, spec.alt_km.values, axis=0) @ op.M
+    if "Plambda" in names:
+        out["Plambda"] = rates @ op.M
+
+    return out
+
+
+def checkpointconfig(sim, obsAlt_km: float, zenithang: float) -> Dict[str, Union[str, float]]:
+    """
+    everything besides the beams that the checkpointed products depend on:
+    observer geometry, optical filter, reactions and the input files with their modification times
+    """
+    config: Dict[str, Union[str, float]] = {
+        "obsAlt_km": float(obsAlt_km),
+        "zenithang": float(zenithang),
+        "opticalfilter": str(sim.opticalfilter),
+        "reacreq": " ".join(np.atleast_1d(sim.reacreq).astype(str)),
+    }
+
+    for k in ("reactionfn", "bg3fn", "windowfn", "qefn"):
+        fn = Path(getattr(sim, k)).expanduser()
+        config[k] = str(fn.resolve())
+        config[f"{k}_mtime"] = fn.stat().st_mtime if fn.is_file() else 0.0
+
+    return config
+
+
+def loadcheckpoint(h5fn: Path, Ek: np.ndarray, lamb: np.ndarray, names: Sequence[str], config: dict = None) -> tuple:
+    """
+    beams already completed in a getTranscar checkpoint file.
+    Completion is tracked per product, so a product new to this run is computed for every beam.
+    A checkpoint for other beam energies, wavelengths or checkpointconfig() raises ValueError.
+
+    output:
+    done: boolean per beam, True where all products in names are complete
+    z: altitude, None if nothing is complete yet
+    store: the products in names, empty if nothing is complete yet
+    """
+    done = np.zeros(Ek.size, dtype=bool)
+
+    if not h5fn:
+        return done, None, {}
+
+    h5fn = Path(h5fn).expanduser()
+    if not h5fn.is_file():
+        return done, None, {}
+
+    with h5py.File(h5fn, "r") as f:
+        if "/alt_km" not in f:
+            return done, None, {}
+
+        if not np.array_equal(f["/energy_ev"][:], Ek):
+            raise ValueError(f"{h5fn} is a checkpoint for different beam energies")
+        if not np.array_equal(f["/wavelength_nm"][:], lamb):
+            raise ValueError(f"{h5fn} is a checkpoint for different wavelengths")
+        for k, v in (config or {}).items():
+            if k not in f.attrs or f.attrs[k] != v:
+                raise ValueError(f"{h5fn} is a checkpoint for a different {k}: {f.attrs.get(k)} != {v}")
+
+        done[:] = True
+        for k in names:
+            done &= f[f"/done/{k}"][:] if f"/done/{k}" in f else False
+
+        if not done.any():
+            return done, None, {}
+
+        z = f["/alt_km"][:]
+        store = {k: np.asfortranarray(f[k][:]) for k in names}
+
+    logging.info(f"{h5fn}: resuming with {done.sum()} / {done.size} beams complete")
+
+    return done, z, store
+
+
+def writecheckpoint(
+    h5fn: Path, iEn: int, Ek: np.ndarray, z: np.ndarray, lamb: np.ndarray, beam: Dict[str, np.ndarray], config: dict = None
+):
+    """
+    stream one finished beam to the checkpoint file. Each product of the beam is marked done after it is written,
+    so an interrupted write is simply recomputed on the next run.
+    config: checkpointconfig(), stored as attributes for loadcheckpoint() to check
+    """
+    with h5py.File(Path(h5fn).expanduser(), "a") as f:
+        if "/alt_km" not in f:
+            d = f.create_dataset("/energy_ev", data=Ek)
+            d.attrs["unit"] = "eV"
+            d = f.create_dataset("/alt_km", data=z)
+            d.attrs["unit"] = "km"
+            d = f.create_dataset("/wavelength_nm", data=lamb)
+            d.attrs["unit"] = "nm"
+            f.attrs.update(config or {})
+        elif not np.array_equal(f["/alt_km"][:], z):
+            raise ValueError(f"{h5fn} is a checkpoint for different altitudes")
+
+        for k, v in beam.items():
+            if k not in f:
+                f.create_dataset(k, shape=v.shape + (Ek.size,), dtype=float, chunks=v.shape + (1,), fillvalue=0)
+            if f"/done/{k}" not in f:
+                f.create_dataset(f"/done/{k}", shape=(Ek.size,), dtype=bool, fillvalue=False)
+            f[k][..., iEn] = v
+            f[f"/done/{k}"][iEn] = True
 
 
 def getbeamsused(zeroUnusedBeams, Ek: float, minbeamenergy: float) -> int:
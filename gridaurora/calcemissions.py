@@ -1,138 +1,270 @@
 #!/usr/bin/env python
 from pathlib import Path
+import copy
 import numpy as np
 import h5py
-from typing import Tuple
+from typing import Dict, Tuple, Union
 import xarray
 
 """
 inputs:
-spec: excitation rates, 3-D , dimensions time x altitude x reaction
+spec: excitation rates, N-D, dimensions ... x altitude x reaction  e.g. time x altitude x reaction
 
 output:
-ver: a pandas DataFrame, wavelength x altitude
-br: flux-tube integrated intensity, dimension lamb
+ver: xarray.DataArray, ... x altitude x wavelength, leading dimensions (time, energy, ...) of spec are kept
+br: flux-tube integrated intensity, dimension ... x lamb
 
 See Eqn 9 of Appendix C of Zettergren PhD thesis 2007 to get a better insight on what this set of functions do.
 """
 
 
-def calcemissions(rates: xarray.DataArray, sim) -> Tuple[xarray.DataArray, np.ndarray, np.ndarray]:
+def calcemissions(
+    rates: xarray.DataArray, sim, out: np.ndarray = None, op: "EmissionOperator" = None
+) -> Tuple[xarray.DataArray, np.ndarray, np.ndarray]:
+    """
+    out: optional preallocated buffer that VER is written into, of shape rates.shape[:-1] + (op.M.shape[1],),
+         i.e. one column per line of the emission operator after NaN elimination.
+         This is not the ReactionTable.nlines() buffer of the band functions, which calcemissions does not call.
+    op: optional emission operator, e.g. restricted to a passband by opticalmod.passband().
+        Default is every line of sim.reacreq.
+    """
     if not sim.reacreq:
         return 0.0, 0.0, 0.0
 
-    ver = None
-    lamb = None
-    br = None
+    if op is None:
+        op = loadreactions(sim.reactionfn).operator(sim.reacreq)
     """
     Franck-Condon factor
     http://chemistry.illinoisstate.edu/standard/che460/handouts/460-Feb28lec-S13.pdf
     http://assign3.chem.usyd.edu.au/spectroscopy/index.php
+
+    the per-band products, concatenation and wavelength sort of getMetastable() ... getN21PG()
+    are precomputed in the emission operator, so VER is a single matrix product.
     """
-    # %% METASTABLE
-    if "metastable" in sim.reacreq:
-        ver, lamb, br = getMetastable(rates, ver, lamb, br, sim.reactionfn)
-    # %% PROMPT ATOMIC OXYGEN EMISSIONS
-    if "atomic" in sim.reacreq:
-        ver, lamb, br = getAtomic(rates, ver, lamb, br, sim.reactionfn)
-    # %% N2 1N EMISSIONS
-    if "n21ng" in sim.reacreq:
-        ver, lamb, br = getN21NG(rates, ver, lamb, br, sim.reactionfn)
-    # %% N2+ Meinel band
-    if "n2meinel" in sim.reacreq:
-        ver, lamb, br = getN2meinel(rates, ver, lamb, br, sim.reactionfn)
-    # %% N2 2P (after Vallance Jones, 1974)
-    if "n22pg" in sim.reacreq:
-        ver, lamb, br = getN22PG(rates, ver, lamb, br, sim.reactionfn)
-    # %% N2 1P
-    if "n21pg" in sim.reacreq:
-        ver, lamb, br = getN21PG(rates, ver, lamb, br, sim.reactionfn)
-    # %% Remove NaN wavelength entries
-    if ver is None:
-        raise ValueError("you have not selected any reactions to generate VER")
-    # %% sort by wavelength, eliminate NaN
-    lamb, ver, br = sortelimlambda(lamb, ver, br)
-    # %% assemble output
-    dfver = xarray.DataArray(data=ver, coords=[("alt_km", rates.alt_km), ("wavelength_nm", lamb)])
+    assert rates.dims[-2] == "alt_km", "excitation rates must be ... x altitude x reaction"
+
+    ver = np.matmul(rates.loc[..., op.reaction].values, op.M, out=out)  # all leading dimensions in one pass
+    lamb = op.wavelength_nm
+    br = np.trapz(ver, rates.alt_km, axis=-2)
+    # %% assemble output, keeping any leading (time, energy, ...) dimensions
+    coords = {k: (c.dims, c.values) for k, c in rates.coords.items() if rates.dims[-1] not in c.dims}
+    coords["wavelength_nm"] = lamb
+
+    dfver = xarray.DataArray(data=ver, dims=rates.dims[:-1] + ("wavelength_nm",), coords=coords)
 
     return dfver, ver, br
 
 
-def getMetastable(rates, ver: np.ndarray, lamb, br, reactfn: Path):
-    with h5py.File(reactfn, "r") as f:
-        A = f["/metastable/A"][:]
-        lambnew = f["/metastable/lambda"].value.ravel(order="F")  # some are not 1-D!
+GROUPS = {
+    "metastable": "metastable",
+    "atomic": "atomic",
+    "n21ng": "N2+1NG",
+    "n2meinel": "N2+Meinel",
+    "n22pg": "N2_2PG",
+    "n21pg": "N2_1PG",
+}
 
+
+class ReactionTable:
     """
-    concatenate along the reaction dimension, axis=-1
-    """
-    vnew = np.concatenate(
-        (
-            A[:2] * rates.loc[..., "no1s"].values[:, None],
-            A[2:4] * rates.loc[..., "no1d"].values[:, None],
-            A[4:] * rates.loc[..., "noii2p"].values[:, None],
-        ),
-        axis=-1,
-    )
+    Einstein coefficients A, wavelengths and Franck-Condon factors of a reaction file (e.g. vjeinfc.h5),
+    read once along with the derived upper state lifetime tau and per-line scale factors scalevec.
 
-    assert vnew.shape == (rates.shape[0], A.size)
+    each attribute is a dict keyed by band family, the same names as sim.reacreq
+    """
 
-    return catvl(rates.alt_km, ver, vnew, lamb, lambnew, br)
+    def __init__(self, reactfn: Path):
+        self.filename = Path(reactfn).expanduser()
+
+        self.A: Dict[str, np.ndarray] = {}
+        self.lamb: Dict[str, np.ndarray] = {}
+        self.fc: Dict[str, np.ndarray] = {}
+        self.tau: Dict[str, np.ndarray] = {}
+        self.scalevec: Dict[str, np.ndarray] = {}
+
+        with h5py.File(self.filename, "r") as f:
+            for fam, grp in GROUPS.items():
+                self.lamb[fam] = f[f"/{grp}/lambda"][:].ravel(order="F")  # some are not 1-D!
+                if "A" in f[grp]:
+                    self.A[fam] = f[f"/{grp}/A"][:]
+                if "fc" in f[grp]:
+                    self.fc[fam] = f[f"/{grp}/fc"][:]
+        # %% metastable and atomic are used directly
+        self.scalevec["metastable"] = self.A["metastable"]
+        self.scalevec["atomic"] = np.ones(self.lamb["atomic"].size)
+        # %% bands
+        self.fc["n2meinel"] = self.fc["n2meinel"] / self.fc["n2meinel"].sum()  # normalize, special to this case
+
+        for fam in ("n21ng", "n2meinel", "n22pg"):
+            self.tau[fam], self.scalevec[fam] = bandscale(self.A[fam], self.fc[fam])
+
+        self.tau["n21pg"], self.scalevec["n21pg"] = scale1PG(self.A["n21pg"], self.fc["n21pg"])
+
+        # %% excitation rate driving each line
+        self.reaction: Dict[str, np.ndarray] = {
+            "metastable": np.repeat(["no1s", "no1d", "noii2p"], [2, 2, self.lamb["metastable"].size - 4]),
+            "atomic": np.array(["po3p3p", "po3p5p"]),
+        }
+        for fam, reac in (("n21ng", "p1ng"), ("n2meinel", "pmein"), ("n22pg", "p2pg"), ("n21pg", "p1pg")):
+            self.reaction[fam] = np.repeat(reac, self.lamb[fam].size)
+
+        for fam in GROUPS:
+            assert self.scalevec[fam].size == self.lamb[fam].size, f"{fam} A and lambda sizes differ in {self.filename}"
+
+        # %% wavelength index over all finite lines, for O(log n) passband queries
+        lamb = np.concatenate([self.lamb[fam] for fam in GROUPS])
+        family = np.concatenate([np.repeat(fam, self.lamb[fam].size) for fam in GROUPS])
+        line = np.concatenate([np.arange(self.lamb[fam].size) for fam in GROUPS])
+
+        i = np.flatnonzero(np.isfinite(lamb))
+        i = i[lamb[i].argsort(kind="stable")]
+        self.index_lamb, self.index_family, self.index_line = lamb[i], family[i], line[i]
+
+        self.operators: Dict[Tuple[str, ...], EmissionOperator] = {}
+
+    def lines(self, lmin: float, lmax: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        lines with lmin <= wavelength <= lmax [nm] by binary search of the wavelength index
+
+        output:
+        wavelength, band family, index into self.lamb[family]
+        """
+        i, j = _between(self.index_lamb, lmin, lmax)
+
+        return self.index_lamb[i:j], self.index_family[i:j], self.index_line[i:j]
+
+    def nlines(self, reacreq) -> int:
+        """
+        number of lines the band functions produce for reacreq, including NaN wavelengths,
+        to size the out= buffer when calling getMetastable() ... getN21PG() directly, see catvl().
+        calcemissions() takes an EmissionOperator sized buffer instead.
+        """
+        return sum(self.lamb[fam].size for fam in GROUPS if fam in reacreq)
+
+    def operator(self, reacreq) -> "EmissionOperator":
+        """
+        emission operator for the requested band families, built once per reacreq
+        """
+        fams = tuple(fam for fam in GROUPS if fam in reacreq)
+
+        if fams not in self.operators:
+            self.operators[fams] = EmissionOperator(self, fams)
+
+        return self.operators[fams]
+
+
+class EmissionOperator:
+    """
+    linear map from excitation rates to volume emission rate of each spectral line
 
+    VER = rates.loc[..., reaction] @ M
 
-def getAtomic(rates, ver, lamb, br, reactfn):
-    """ prompt atomic emissions (nm)
-    844.6 777.4
+    M: Nreaction x Nwavelength, with NaN wavelengths eliminated and columns sorted by wavelength
     """
-    with h5py.File(reactfn, "r") as f:
-        lambnew = f["/atomic/lambda"].value.ravel(order="F")  # some are not 1-D!
 
-    vnew = np.concatenate((rates.loc[..., "po3p3p"].values[..., None], rates.loc[..., "po3p5p"].values[..., None]), axis=-1,)
+    def __init__(self, table: ReactionTable, fams: Tuple[str, ...]):
+        if not fams:
+            raise ValueError("you have not selected any reactions to generate VER")
 
-    return catvl(rates.alt_km, ver, vnew, lamb, lambnew, br)
+        self.families = fams
 
+        lamb = np.concatenate([table.lamb[fam] for fam in fams])
+        scalevec = np.concatenate([table.scalevec[fam] for fam in fams])
+        reaction = np.concatenate([table.reaction[fam] for fam in fams])
+        # %% same elimination and ordering as sortelimlambda()
+        mask = np.isfinite(lamb)
+        lamb, scalevec, reaction = lamb[mask], scalevec[mask], reaction[mask]
+        lambSortInd = lamb.argsort()
+        lamb, scalevec, reaction = lamb[lambSortInd], scalevec[lambSortInd], reaction[lambSortInd]
 
-def getN21NG(rates, ver, lamb, br, reactfn):
-    """
-    excitation Franck-Condon factors (derived from Vallance Jones, 1974)
-    """
-    with h5py.File(str(reactfn), "r", libver="latest") as f:
-        A = f["/N2+1NG/A"].value
-        lambdaA = f["/N2+1NG/lambda"].value.ravel(order="F")
-        franckcondon = f["/N2+1NG/fc"].value
+        self.reaction = [str(r) for r in dict.fromkeys(reaction)]  # unique, in order of appearance
+        row = np.array([self.reaction.index(r) for r in reaction])
 
-    return doBandTrapz(A, lambdaA, franckcondon, rates.loc[..., "p1ng"], lamb, ver, rates.alt_km, br)
+        self.wavelength_nm = lamb
+        self.M = np.zeros((len(self.reaction), lamb.size))
+        self.M[row, np.arange(lamb.size)] = scalevec
 
+    def weights(self, T: np.ndarray = None) -> np.ndarray:
+        """
+        one weight per reaction, M @ T, so that  rates @ weights == (rates @ M) @ T
+        i.e. transmission weighted VER summed over wavelength, without the wavelength axis.
+        T=None sums VER over wavelength unweighted.
+        """
+        if T is None:
+            return self.M.sum(axis=1)
 
-def getN2meinel(rates, ver, lamb, br, reactfn):
-    with h5py.File(str(reactfn), "r", libver="latest") as f:
-        A = f["/N2+Meinel/A"].value
-        lambdaA = f["/N2+Meinel/lambda"].value.ravel(order="F")
-        franckcondon = f["/N2+Meinel/fc"].value
-    # normalize
-    franckcondon = franckcondon / franckcondon.sum()  # special to this case
+        return self.M @ np.asarray(T)
 
-    return doBandTrapz(A, lambdaA, franckcondon, rates.loc[..., "pmein"], lamb, ver, rates.alt_km, br)
+    def between(self, lmin: float, lmax: float) -> "EmissionOperator":
+        """
+        operator restricted to lines lmin <= wavelength <= lmax [nm], by binary search
+        """
+        return self._take(slice(*_between(self.wavelength_nm, lmin, lmax)))
 
+    def passband(self, T: np.ndarray, tol: float) -> "EmissionOperator":
+        """
+        operator restricted to lines with optical system transmission T >= tol,
+        T evaluated at self.wavelength_nm.  Blocked lines are then never computed.
+        """
+        T = np.asarray(T)
+        assert T.shape == self.wavelength_nm.shape, "T must be evaluated at the operator wavelengths"
 
-def getN22PG(rates, ver, lamb, br, reactfn):
-    """ from Benesch et al, 1966a """
-    with h5py.File(str(reactfn), "r", libver="latest") as f:
-        A = f["/N2_2PG/A"].value
-        lambdaA = f["/N2_2PG/lambda"].value.ravel(order="F")
-        franckcondon = f["/N2_2PG/fc"].value
+        return self._take(T >= tol)
+
+    def _take(self, cols) -> "EmissionOperator":
+        sub = copy.copy(self)
+
+        M = self.M[:, cols]
+        rows = (M != 0).any(axis=1)  # reactions no remaining line depends on
 
-    return doBandTrapz(A, lambdaA, franckcondon, rates.loc[..., "p2pg"], lamb, ver, rates.alt_km, br)
+        sub.M = M[rows, :]
+        sub.reaction = [r for r, k in zip(self.reaction, rows) if k]
+        sub.wavelength_nm = self.wavelength_nm[cols]
 
+        return sub
 
-def getN21PG(rates, ver, lamb, br, reactfn):
 
-    with h5py.File(str(reactfn), "r", libver="latest") as fid:
-        A = fid["/N2_1PG/A"].value
-        lambnew = fid["/N2_1PG/lambda"].value.ravel(order="F")
-        franckcondon = fid["/N2_1PG/fc"].value
+def _between(lamb: np.ndarray, lmin: float, lmax: float) -> Tuple[int, int]:
+    return int(np.searchsorted(lamb, lmin, side="left")), int(np.searchsorted(lamb, lmax, side="right"))
 
-    tau1PG = 1 / np.nansum(A, axis=1)
+
+_reactiontables: Dict[Tuple[str, float], ReactionTable] = {}
+
+
+def loadreactions(reactfn: Union[Path, ReactionTable]) -> ReactionTable:
+    """
+    reaction table cached by (path, mtime), so each reaction file is parsed once per process
+    """
+    if isinstance(reactfn, ReactionTable):
+        return reactfn
+
+    reactfn = Path(reactfn).expanduser().resolve()
+    key = (str(reactfn), reactfn.stat().st_mtime)
+
+    if key not in _reactiontables:
+        for k in [k for k in _reactiontables if k[0] == key[0]]:  # file changed on disk
+            del _reactiontables[k]
+        _reactiontables[key] = ReactionTable(reactfn)
+
+    return _reactiontables[key]
+
+
+def bandscale(Aein: np.ndarray, fc: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    A and lambda dimensions:
+    axis 0 is upper state vib. level (nu')
+    axis 1 is bottom state vib level (nu'')
+    there is a Franck-Condon parameter (variable fc) for each upper state nu'
+    """
+    tau = 1 / np.nansum(Aein, axis=1)
+
+    scalevec = (Aein * tau[:, None] * fc[:, None]).ravel(order="F")
+
+    return tau, scalevec
+
+
+def scale1PG(Aein: np.ndarray, fc: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    tau1PG = 1 / np.nansum(Aein, axis=1)
     """
     solve for base concentration
     confac=[1.66;1.56;1.31;1.07;.77;.5;.33;.17;.08;.04;.02;.004;.001];  %Cartwright, 1973b, stop at nuprime==12
@@ -140,36 +272,81 @@ def getN21PG(rates, ver, lamb, br, reactfn):
     confac=array([1.66,1.86,1.57,1.07,.76,.45,.25,.14,.07,.03,.01,.004,.001])
     """
 
-    consfac = franckcondon / franckcondon.sum()  # normalize
+    consfac = fc / fc.sum()  # normalize
     losscoef = (consfac / tau1PG).sum()
-    N01pg = rates.loc[..., "p1pg"] / losscoef
 
-    scalevec = (A * consfac[:, None]).ravel(order="F")  # for clarity (verified with matlab)
+    scalevec = (Aein * consfac[:, None]).ravel(order="F") / losscoef  # for clarity (verified with matlab)
 
-    vnew = scalevec[None, None, :] * N01pg.values[..., None]
+    return tau1PG, scalevec
 
-    return catvl(rates.alt_km, ver, vnew, lamb, lambnew, br)
 
+def getMetastable(rates, ver: np.ndarray, lamb, br, reactfn: Union[Path, ReactionTable], out: np.ndarray = None):
+    table = loadreactions(reactfn)
+    A = table.scalevec["metastable"]
 
-def doBandTrapz(Aein, lambnew, fc, kin, lamb, ver, z, br):
     """
-    ver dimensions: wavelength, altitude, time
+    concatenate along the reaction dimension, axis=-1
+    """
+    vnew = np.concatenate(
+        (
+            A[:2] * rates.loc[..., "no1s"].values[..., None],
+            A[2:4] * rates.loc[..., "no1d"].values[..., None],
+            A[4:] * rates.loc[..., "noii2p"].values[..., None],
+        ),
+        axis=-1,
+    )
 
-     A and lambda dimensions:
-    axis 0 is upper state vib. level (nu')
-    axis 1 is bottom state vib level (nu'')
-    there is a Franck-Condon parameter (variable fc) for each upper state nu'
+    assert vnew.shape == rates.shape[:-1] + (A.size,)
+
+    return catvl(rates.alt_km, ver, vnew, lamb, table.lamb["metastable"], br, out)
+
+
+def getAtomic(rates, ver, lamb, br, reactfn, out: np.ndarray = None):
+    """ prompt atomic emissions (nm)
+    844.6 777.4
     """
-    tau = 1 / np.nansum(Aein, axis=1)
+    table = loadreactions(reactfn)
 
-    scalevec = (Aein * tau[:, None] * fc[:, None]).ravel(order="F")
+    vnew = np.concatenate((rates.loc[..., "po3p3p"].values[..., None], rates.loc[..., "po3p5p"].values[..., None]), axis=-1,)
+
+    return catvl(rates.alt_km, ver, vnew, lamb, table.lamb["atomic"], br, out)
+
+
+def getN21NG(rates, ver, lamb, br, reactfn, out: np.ndarray = None):
+    """
+    excitation Franck-Condon factors (derived from Vallance Jones, 1974)
+    """
+    return doBandTrapz(loadreactions(reactfn), "n21ng", rates.loc[..., "p1ng"], lamb, ver, rates.alt_km, br, out)
+
+
+def getN2meinel(rates, ver, lamb, br, reactfn, out: np.ndarray = None):
+    return doBandTrapz(loadreactions(reactfn), "n2meinel", rates.loc[..., "pmein"], lamb, ver, rates.alt_km, br, out)
 
-    vnew = scalevec[None, None, :] * kin.values[..., None]
 
-    return catvl(z, ver, vnew, lamb, lambnew, br)
+def getN22PG(rates, ver, lamb, br, reactfn, out: np.ndarray = None):
+    """ from Benesch et al, 1966a """
+    return doBandTrapz(loadreactions(reactfn), "n22pg", rates.loc[..., "p2pg"], lamb, ver, rates.alt_km, br, out)
+
+
+def getN21PG(rates, ver, lamb, br, reactfn, out: np.ndarray = None):
+    """
+    base concentration and loss coefficient are folded into the reaction table scalevec, see scale1PG()
+    """
+    return doBandTrapz(loadreactions(reactfn), "n21pg", rates.loc[..., "p1pg"], lamb, ver, rates.alt_km, br, out)
+
+
+def doBandTrapz(table: ReactionTable, fam: str, kin, lamb, ver, z, br, out: np.ndarray = None):
+    """
+    ver dimensions: wavelength, altitude, time
+
+    scalevec is precomputed per band in the ReactionTable
+    """
+    vnew = table.scalevec[fam] * kin.values[..., None]
+
+    return catvl(z, ver, vnew, lamb, table.lamb[fam], br, out)
 
 
-def catvl(z, ver, vnew, lamb, lambnew, br):
+def catvl(z, ver, vnew, lamb, lambnew, br, out: np.ndarray = None):
     """
     trapz integrates over altitude axis, axis = -2
     concatenate over reaction dimension, axis = -1
@@ -177,7 +354,14 @@ def catvl(z, ver, vnew, lamb, lambnew, br):
     br: column integrated brightness
     lamb: wavelength [nm]
     ver: volume emission rate  [photons / cm^-3 s^-3 ...]
+    out: optional preallocated ... x Nalt x ReactionTable.nlines(reacreq) buffer, for callers chaining
+         the band functions getMetastable() ... getN21PG() themselves.
+         Each band is written into the next columns of out, and ver is returned as a view of
+         the filled columns, so nothing is copied as bands accumulate.
     """
+    if out is not None:
+        return _catvlout(z, ver, vnew, lamb, lambnew, br, out)
+
     if ver is not None:
         br = np.concatenate((br, np.trapz(vnew, z, axis=-2)), axis=-1)  # must come first!
         ver = np.concatenate((ver, vnew), axis=-1)
@@ -190,6 +374,28 @@ def catvl(z, ver, vnew, lamb, lambnew, br):
     return ver, lamb, br
 
 
+def _catvlout(z, ver, vnew, lamb, lambnew, br, out: np.ndarray):
+    """
+    catvl() into the next columns of a preallocated buffer
+    """
+    i = 0 if ver is None else ver.shape[-1]
+    j = i + vnew.shape[-1]
+    if j > out.shape[-1]:
+        raise ValueError(f"output buffer has {out.shape[-1]} lines, need at least {j}")
+
+    out[..., i:j] = vnew
+    brnew = np.trapz(vnew, z, axis=-2)
+
+    if ver is not None:
+        br = np.concatenate((br, brnew), axis=-1)
+        lamb = np.concatenate((lamb, lambnew))
+    else:
+        br = brnew
+        lamb = lambnew.copy()
+
+    return out[..., :j], lamb, br
+
+
 def sortelimlambda(lamb, ver, br):
     assert lamb.ndim == 1
     assert lamb.size == ver.shape[-1]
@@ -197,12 +403,12 @@ def sortelimlambda(lamb, ver, br):
     mask = np.isfinite(lamb)
     ver = ver[..., mask]
     lamb = lamb[mask]
-    br = br[:, mask]
+    br = br[..., mask]
     # %% sort by lambda
     lambSortInd = lamb.argsort()  # lamb is made piecemeal and is overall non-monotonic
 
     return (
         lamb[lambSortInd],
         ver[..., lambSortInd],
-        br[:, lambSortInd],
+        br[..., lambSortInd],
     )  # sort by wavelength ascending order
@@ -8,10 +8,12 @@ import numpy as np
 import h5py
 from typing import Tuple
 
+from .energygrid import energygrid
+
 pi = np.pi
 
 
-def maxwellian(E: np.ndarray, E0: np.ndarray, Q0: np.ndarray) -> Tuple[np.ndarray, float]:
+def maxwellian(E: np.ndarray, E0: np.ndarray, Q0: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
     """
     input:
     ------
@@ -34,40 +36,79 @@ def maxwellian(E: np.ndarray, E0: np.ndarray, Q0: np.ndarray) -> Tuple[np.ndarra
 
     Phi = Q0 / (2 * pi * E0 ** 3) * E[:, None] * np.exp(-E[:, None] / E0)
 
-    Q = np.trapz(Phi, E, axis=0)
+    Q = energygrid(E).numberflux(Phi)
     logging.info("total maxwellian flux Q: " + (" ".join("{:.1e}".format(q) for q in Q)))
     return Phi, Q
 
 
-def fluxgen(E, E0, Q0, Wbc, bl, bm, bh, Bm, Bhf, verbose: int = 0) -> tuple:
+FLUXGEN_CHUNK_BYTES = 64_000_000
+
+
+def fluxgen(
+    E, E0, Q0, Wbc, bl, bm, bh, Bm, Bhf, verbose: int = 0, components: bool = True, chunk: int = None
+) -> tuple:
+    """
+    Strickland 1993 differential number flux for an ensemble of E0.
+
+    E0, Q0, Wbc, bl, bm, bh, Bm, Bhf: scalars or arrays broadcast to the length of E0
+    components: False to skip the E x E0 low, mid, hi, base outputs (returned as None)
+    chunk: number of E0 evaluated at once, by default sized to FLUXGEN_CHUNK_BYTES of temporaries
+
+    output:
+    -------
+    diffnumflux: E x E0, Fortran order
+    low, mid, hi, base: components of diffnumflux, or None
+    Q: total flux of each E0
+    """
+    E = np.asarray(E, dtype=float)
+    E0 = np.atleast_1d(np.asarray(E0, dtype=float))
+    N = E0.size
+    Q0, Wbc, bl, bm, bh, Bm, Bhf = (np.broadcast_to(np.asarray(a, dtype=float), (N,)) for a in (Q0, Wbc, bl, bm, bh, Bm, Bhf))
 
     Wb = Wbc * E0
 
-    isimE0 = abs(E - E0).argmin()
+    isimE0 = np.empty(N, dtype=int)  # E bin nearest each E0, found per chunk to bound the E x chunk temporary
 
-    base = gaussflux(E, Wb, E0, Q0)
-    diffnumflux = base.copy()
+    if chunk is None:
+        chunk = max(1, FLUXGEN_CHUNK_BYTES // (4 * 8 * E.size))
 
-    low = letail(E, E0, Q0, bl, verbose)
-    diffnumflux += low  # intermediate result
+    grid = energygrid(E)
+    diffnumflux = np.empty((E.size, N), order="F")
+    low, mid, hi, base = (np.empty_like(diffnumflux) for _ in range(4)) if components else (None,) * 4
+    Q = np.empty(N)
 
-    mid = midtail(E, E0, bm, Bm)
-    diffnumflux += mid  # intermediate result
+    for k in range(0, N, chunk):
+        j = slice(k, k + chunk)
+        isimE0[j] = abs(E[:, None] - E0[j]).argmin(axis=0)
 
-    hi = hitail(E, diffnumflux, isimE0, E0, Bhf, bh, verbose)
-    diffnumflux += hi
+        phi = gaussflux(E, Wb[j], E0[j], Q0[j])
+        if base is not None:
+            base[:, j] = phi
 
-    if verbose > 0:
-        diprat(E0, diffnumflux, isimE0)
+        lo = letail(E, E0[j], Q0[j], bl[j], verbose)
+        phi += lo  # intermediate result
+
+        md = midtail(E, E0[j], bm[j], Bm[j])
+        phi += md  # intermediate result
+
+        ht = hitail(E, phi, isimE0[j], E0[j], Bhf[j], bh[j], verbose)
+        phi += ht
+
+        diffnumflux[:, j] = phi
+        Q[j] = grid.numberflux(phi)
+        if components:
+            low[:, j] = lo
+            mid[:, j] = md
+            hi[:, j] = ht
 
-    Q = np.trapz(diffnumflux, E, axis=0)
     if verbose > 0:
+        diprat(E0, diffnumflux, isimE0)
         print("total flux Q: " + (" ".join("{:.1e}".format(q) for q in Q)))
 
-    return np.asfortranarray(diffnumflux), low, mid, hi, base, Q
+    return diffnumflux, low, mid, hi, base, Q
 
 
-def letail(E: np.ndarray, E0: float, Q0: float, bl: float, verbose: int = 0) -> np.ndarray:
+def letail(E: np.ndarray, E0: np.ndarray, Q0: np.ndarray, bl: np.ndarray, verbose: int = 0) -> np.ndarray:
     # for LET, 1<b<2
     # Bl = 8200.   #820 (typo?)
     Bl = 0.4 * Q0 / (2 * pi * E0 ** 2) * np.exp(-1)
@@ -75,11 +116,11 @@ def letail(E: np.ndarray, E0: float, Q0: float, bl: float, verbose: int = 0) ->
     low = Bl * (E[:, None] / E0) ** -bl
     low[E[:, None] > E0] = 0.0
     if verbose > 0:
-        print("Bl: " + (" ".join("{:0.1f}".format(b) for b in Bl)))
+        print("Bl: " + (" ".join("{:0.1f}".format(b) for b in np.atleast_1d(Bl))))
     return low
 
 
-def midtail(E: np.ndarray, E0: np.ndarray, bm: float, Bm: float):
+def midtail(E: np.ndarray, E0: np.ndarray, bm: np.ndarray, Bm: np.ndarray):
     # Bm = 1.8e4      #1.8e4
     # bm = 3.         #3
     mid = Bm * (E[:, None] / E0) ** bm
@@ -88,14 +129,12 @@ def midtail(E: np.ndarray, E0: np.ndarray, bm: float, Bm: float):
 
 
 def hitail(
-    E: np.ndarray, diffnumflux: np.ndarray, isimE0: np.ndarray, E0: np.ndarray, Bhf: np.ndarray, bh: float, verbose: int = 0,
+    E: np.ndarray, diffnumflux: np.ndarray, isimE0: np.ndarray, E0: np.ndarray, Bhf: np.ndarray, bh: np.ndarray, verbose: int = 0,
 ):
     """
     strickland 1993 said 0.2, but 0.145 gives better match to peak flux at 2500 = E0
     """
-    Bh = np.empty_like(E0)
-    for iE0 in np.arange(E0.size):
-        Bh[iE0] = Bhf[iE0] * diffnumflux[isimE0[iE0], iE0]  # 4100.
+    Bh = Bhf * diffnumflux[isimE0, np.arange(E0.size)]  # 4100.
     # bh = 4                   #2.9
     het = Bh * (E[:, None] / E0) ** -bh
     het[E[:, None] < E0] = 0.0
@@ -104,15 +143,19 @@ def hitail(
     return het
 
 
-def diprat(E0: np.ndarray, arc: np.ndarray, isimE0: np.ndarray):
-    dipratio = np.empty_like(E0)
-    for iE0 in np.arange(E0.size):
-        idip = arc[: isimE0[iE0], iE0].argmin(axis=0)
-        dipratio[iE0] = arc[idip, iE0] / arc[isimE0[iE0], iE0]
+def diprat(E0: np.ndarray, arc: np.ndarray, isimE0: np.ndarray) -> np.ndarray:
+    """
+    ratio of the flux minimum below E0 to the flux at E0
+    """
+    cols = np.arange(E0.size)
+    below = np.arange(arc.shape[0])[:, None] < isimE0
+    idip = np.where(below, arc, np.inf).argmin(axis=0)
+    dipratio = arc[idip, cols] / arc[isimE0, cols]
 
     print("dipratio: " + (" ".join(f"{d:0.2f}" for d in dipratio)))
     # if not all(0.2<dipratio<0.5):
     #    warn('dipratio outside of 0.2<dipratio<0.5')
+    return dipratio
 
 
 def gaussflux(E, Wb, E0, Q0):
@@ -120,6 +163,24 @@ def gaussflux(E, Wb, E0, Q0):
     return Qc * np.exp(-(((E[:, None] - E0) / Wb) ** 2))
 
 
+def EllisonRamaty(E: np.ndarray, E0: np.ndarray, gamma: np.ndarray, kappa: np.ndarray, C0: np.ndarray):
+    E, E0, gamma, kappa, C0 = dimhandler(E, E0, gamma, kappa, C0)
+    # %% do work
+    return C0 * E[:, None] ** (-gamma) * np.exp(-(((E[:, None] - E0) / np.gradient(E)[:, None]) ** kappa))
+
+
+def dimhandler(E, E0, gamma, kappa, C0=None):
+    # %% lite input validation
+    E = np.asarray(E)
+    E0 = np.atleast_1d(E0)
+    gamma = np.atleast_1d(gamma)
+    kappa = np.atleast_1d(kappa)
+    C0 = np.atleast_1d(C0)
+    assert E.ndim == E0.ndim == gamma.ndim == kappa.ndim == C0.ndim == 1, "E0, gamma, kappa, C0: scalar or vector. E: vector"
+
+    return E, E0, gamma, kappa, C0
+
+
 def writeh5(h5fn: Path, Phi: np.ndarray, E, fp):
     if h5fn:
         with h5py.File(h5fn, "w") as f:
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""
+quadrature weights on an energy grid, so each moment of an E x N batch of
+differential number flux spectra is a single vector-matrix product.
+"""
+import hashlib
+from typing import Dict
+import numpy as np
+import xarray
+
+
+class EnergyGrid:
+    """
+    E: energy bin centers [eV]
+    low, high: bin edges [eV], e.g. from loadtranscargrid.makebin().
+               Given edges, the weights are the bin widths, otherwise trapezoidal weights of E.
+    """
+
+    def __init__(self, E: np.ndarray, low: np.ndarray = None, high: np.ndarray = None):
+        self.E = np.asarray(E, dtype=float)
+        if self.E.ndim != 1:
+            raise ValueError("E must be a vector")
+
+        if low is not None and high is not None:
+            w = np.asarray(high, dtype=float) - np.asarray(low, dtype=float)
+            if w.shape != self.E.shape:
+                raise ValueError("bin edges must match E")
+        else:
+            dE = np.diff(self.E)
+            w = np.zeros_like(self.E)
+            w[:-1] += dE / 2
+            w[1:] += dE / 2
+
+        self.w = w
+        self.wE = w * self.E
+        self._W = np.vstack((self.w, self.wE))
+
+    @classmethod
+    def from_bins(cls, bins: xarray.DataArray) -> "EnergyGrid":
+        """
+        bins: output of loadtranscargrid.makebin(), bin centers are the midpoint of the edges
+        """
+        low = bins.loc[:, "low"].values
+        high = bins.loc[:, "high"].values
+
+        return cls((low + high) / 2, low, high)
+
+    def numberflux(self, phi: np.ndarray) -> np.ndarray:
+        """
+        phi: E x N differential number flux [cm^-2 s^-1 eV^-1 sr^-1]
+        returns total number flux Q [cm^-2 s^-1 sr^-1]
+        """
+        return self.w @ phi
+
+    def energyflux(self, phi: np.ndarray) -> np.ndarray:
+        """
+        returns energy flux [eV cm^-2 s^-1 sr^-1]
+        """
+        return self.wE @ phi
+
+    def moments(self, phi: np.ndarray) -> np.ndarray:
+        """
+        number flux and energy flux together, 2 x N
+        """
+        return self._W @ phi
+
+    def meanenergy(self, phi: np.ndarray) -> np.ndarray:
+        """
+        energy flux / number flux [eV]
+        """
+        Q, QE = self.moments(phi)
+        return QE / Q
+
+    def characteristic(self, phi: np.ndarray) -> np.ndarray:
+        """
+        characteristic energy [eV], half the mean energy, which is E0 for a Maxwellian
+        """
+        return self.meanenergy(phi) / 2
+
+
+_energygrids: Dict[str, EnergyGrid] = {}
+
+
+def energygrid(E: np.ndarray) -> EnergyGrid:
+    """
+    trapezoidal EnergyGrid of E, cached on the grid values
+    """
+    E = np.asarray(E, dtype=float)
+    key = hashlib.sha1(E.tobytes()).hexdigest()
+
+    if key not in _energygrids:
+        _energygrids[key] = EnergyGrid(E)
+
+    return _energygrids[key]
@@ -1,11 +1,18 @@
 #!/usr/bin/env python
 from pathlib import Path
+import hashlib
+import json
 import logging
+import os
+import uuid
+from typing import Dict, Mapping, Optional, Sequence, Tuple
 import numpy as np
 from scipy.interpolate import interp1d
 import h5py
 import xarray
 
+from . import extinction
+
 # consider atmosphere
 try:
     import lowtran
@@ -23,14 +30,149 @@ window: http://www.andor.com/pdfs/specifications/Andor_Camera_Windows_Supplement
 """
 
 
-def getSystemT(newLambda, bg3fn: Path, windfn: Path, qefn: Path, obsalt_km, zenang_deg, verbose: bool = False) -> xarray.Dataset:
+def getSystemT(
+    newLambda, bg3fn: Path, windfn: Path, qefn: Path, obsalt_km, zenang_deg, verbose: bool = False, atmosphere: str = "lowtran",
+) -> xarray.Dataset:
+    """
+    obsalt_km, zenang_deg: scalar, or arrays for many observer geometries at once.
+    Array inputs add obsalt_km and/or zenith_deg dimensions to atm, sysNObg3 and sys,
+    while the filter, window and QE curves are interpolated only once.
 
+    atmosphere: "lowtran" (unity if LOWTRAN is not installed), "analytic" clear-sky extinction, or "none"
+    """
     bg3fn = Path(bg3fn).expanduser()
-    windfn = Path(windfn).expanduser()
-    qefn = Path(qefn).expanduser()
 
     newLambda = np.asarray(newLambda)
-    # %% atmospheric absorption
+    atmTinterp, atmdims, atmcoords = atmgeometry(newLambda, obsalt_km, zenang_deg, verbose, atmosphere)
+    # %% BG3 filter
+    filt, fname = loadcurve(bg3fn, newLambda, bounds_error=False)
+    # %% camera window, quantum efficiency
+    wind, qe = sensorT(newLambda, windfn, qefn)
+    # %% collect results into DataArray
+
+    T = xarray.Dataset(
+        {
+            "filter": ("wavelength_nm", filt),
+            "window": ("wavelength_nm", wind),
+            "qe": ("wavelength_nm", qe),
+            "atm": (atmdims + ("wavelength_nm",), atmTinterp),
+        },
+        coords={"wavelength_nm": newLambda, **atmcoords},
+        attrs={"filename": fname},
+    )
+
+    T["sysNObg3"] = (T["window"] * T["qe"] * T["atm"]).transpose(*atmdims, "wavelength_nm")
+    T["sys"] = T["sysNObg3"] * T["filter"]
+
+    return T
+
+
+def getSystemTs(
+    newLambda, filterfns: Sequence[Path], windfn: Path, qefn: Path, obsalt_km, zenang_deg,
+    products: Optional[Mapping[str, Sequence[str]]] = None, verbose: bool = False, atmosphere: str = "lowtran",
+) -> xarray.Dataset:
+    """
+    getSystemT() for many candidate filters in one pass, for filter comparison studies.
+
+    filterfns: filter transmittance HDF5 files, each becomes an entry of the "filtername" dimension,
+               named by the file's name attribute, or the file stem if that is blank
+    products: name -> filter names to stack in series, e.g. {"Rayleigh 1924": ["Hoya V-10", "Wratten 21"]}
+              each product is appended as one more entry of "filtername".
+
+    The atmosphere, window and QE do not depend on the filter, so they are computed once and
+    sysNObg3 has no "filtername" dimension; "filter" and "sys" do.
+    """
+    newLambda = np.asarray(newLambda)
+    atmTinterp, atmdims, atmcoords = atmgeometry(newLambda, obsalt_km, zenang_deg, verbose, atmosphere)
+    wind, qe = sensorT(newLambda, windfn, qefn)
+    # %% filters
+    filt = np.empty((len(filterfns) + len(products or {}), newLambda.size))
+    names = []
+    for i, fn in enumerate(filterfns):
+        fn = Path(fn).expanduser()
+        filt[i], name = loadcurve(fn, newLambda, bounds_error=False)
+        names.append(name or fn.stem)
+    # %% filters stacked in series
+    for i, (name, parts) in enumerate((products or {}).items(), start=len(filterfns)):
+        missing = set(parts).difference(names)
+        if missing:
+            raise KeyError(f"{name}: filters {missing} are not among {names}")
+        filt[i] = np.prod([filt[names.index(p)] for p in parts], axis=0)
+        names.append(name)
+
+    if len(set(names)) != len(names):
+        raise ValueError(f"filter names must be unique: {names}")
+
+    T = xarray.Dataset(
+        {
+            "filter": (("filtername", "wavelength_nm"), filt),
+            "window": ("wavelength_nm", wind),
+            "qe": ("wavelength_nm", qe),
+            "atm": (atmdims + ("wavelength_nm",), atmTinterp),
+        },
+        coords={"filtername": names, "wavelength_nm": newLambda, **atmcoords},
+    )
+
+    T["sysNObg3"] = (T["window"] * T["qe"] * T["atm"]).transpose(*atmdims, "wavelength_nm")
+    T["sys"] = (T["sysNObg3"] * T["filter"]).transpose("filtername", *atmdims, "wavelength_nm")
+
+    return T
+
+
+def sensorT(newLambda: np.ndarray, windfn: Path, qefn: Path) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    camera window transmittance and quantum efficiency on newLambda
+    """
+    wind = loadcurve(Path(windfn).expanduser(), newLambda)[0]
+    qe = loadcurve(Path(qefn).expanduser(), newLambda)[0]
+
+    return wind, qe
+
+
+def atmgeometry(
+    newLambda: np.ndarray, obsalt_km, zenang_deg, verbose: bool = False, atmosphere: str = "lowtran"
+) -> Tuple[np.ndarray, tuple, dict]:
+    """
+    atmospheric transmittance for each observer altitude x zenith angle.
+
+    scalar inputs are squeezed out, array inputs become obsalt_km and/or zenith_deg dimensions.
+    returns the transmittance, its leading dimension names and their coordinates.
+    """
+    obsalt = np.atleast_1d(obsalt_km)
+    zenang = np.atleast_1d(zenang_deg)
+
+    if atmosphere == "lowtran":
+        atmTinterp = np.empty((obsalt.size, zenang.size, newLambda.size))
+        for i, h1 in enumerate(obsalt):
+            for j, angle in enumerate(zenang):
+                atmTinterp[i, j] = atmT(newLambda, h1, angle, verbose)
+    elif atmosphere == "analytic":
+        atmTinterp = extinction.transmittance(newLambda, zenang[None, :], obsalt[:, None])
+    elif atmosphere == "none":
+        atmTinterp = np.ones((obsalt.size, zenang.size, newLambda.size))
+    else:
+        raise ValueError(f'unknown atmosphere "{atmosphere}", choose "lowtran", "analytic" or "none"')
+
+    atmdims = []
+    atmcoords = {}
+    if np.ndim(obsalt_km) > 0:
+        atmdims.append("obsalt_km")
+        atmcoords["obsalt_km"] = obsalt
+    else:
+        atmTinterp = atmTinterp[0]
+    if np.ndim(zenang_deg) > 0:
+        atmdims.append("zenith_deg")
+        atmcoords["zenith_deg"] = zenang
+    else:
+        atmTinterp = atmTinterp[..., 0, :]
+
+    return atmTinterp, tuple(atmdims), atmcoords
+
+
+def atmT(newLambda: np.ndarray, obsalt_km: float, zenang_deg: float, verbose: bool = False) -> np.ndarray:
+    """
+    atmospheric transmittance for one observer geometry, unity if LOWTRAN is not available
+    """
     if lowtran is not None:
         c1 = {
             "model": 5,
@@ -41,11 +183,11 @@ def getSystemT(newLambda, bg3fn: Path, windfn: Path, qefn: Path, obsalt_km, zena
         }
         if verbose:
             print("loading LOWTRAN7 atmosphere model...")
-        atmT = lowtran.transmittance(c1)["transmission"].squeeze()
+        T = lowtranT(c1)
         try:
-            atmTcleaned = atmT.values.squeeze()
+            atmTcleaned = T.values.squeeze()
             atmTcleaned[atmTcleaned == 0] = np.spacing(1)  # to avoid log10(0)
-            fwl = interp1d(atmT.wavelength_nm, np.log(atmTcleaned), axis=0)
+            fwl = interp1d(T.wavelength_nm, np.log(atmTcleaned), axis=0)
         except AttributeError:  # problem with lowtran
             fwl = interp1d(newLambda, np.log(np.ones_like(newLambda)), kind="linear")
     else:
@@ -54,40 +196,425 @@ def getSystemT(newLambda, bg3fn: Path, windfn: Path, qefn: Path, obsalt_km, zena
     atmTinterp = np.exp(fwl(newLambda))
     if not np.isfinite(atmTinterp).all():
         logging.error("problem in computing LOWTRAN atmospheric attenuation, results are suspect!")
-    # %% BG3 filter
-    with h5py.File(bg3fn, "r") as f:
+
+    return atmTinterp
+
+
+SYSTEMT_CACHE_SIZE = 128
+_systemT: Dict[tuple, xarray.Dataset] = {}
+
+
+def cachedSystemT(
+    newLambda, bg3fn: Path, windfn: Path, qefn: Path, obsalt_km, zenang_deg, atmosphere: str = "lowtran"
+) -> xarray.Dataset:
+    """
+    getSystemT() memoized on (wavelength grid, filter/window/QE files, observer altitude, zenith angle),
+    so the HDF5 reads, interpolants and LOWTRAN run happen once per distinct optical setup.
+
+    a copy is returned, so callers may modify it freely.
+    """
+    newLambda = np.asarray(newLambda, dtype=float)
+
+    key = (
+        hashlib.sha1(newLambda.tobytes()).hexdigest(),
+        _filekey(bg3fn),
+        _filekey(windfn),
+        _filekey(qefn),
+        np.ndim(obsalt_km),
+        tuple(np.atleast_1d(obsalt_km).astype(float)),
+        np.ndim(zenang_deg),
+        tuple(np.atleast_1d(zenang_deg).astype(float)),
+        atmosphere,
+    )
+
+    if key not in _systemT:
+        if len(_systemT) >= SYSTEMT_CACHE_SIZE:
+            del _systemT[next(iter(_systemT))]  # oldest first
+        _systemT[key] = getSystemT(newLambda, bg3fn, windfn, qefn, obsalt_km, zenang_deg, atmosphere=atmosphere)
+
+    return _systemT[key].copy(deep=True)
+
+
+def _filekey(fn: Path) -> Tuple[str, float]:
+    fn = Path(fn).expanduser().resolve()
+    return str(fn), fn.stat().st_mtime
+
+
+LOWTRAN_CACHE_BYTES = 200_000_000
+
+
+def cachedir() -> Path:
+    """
+    on-disk cache directory, set by environment variable GRIDAURORA_CACHE, default ~/.cache/gridaurora
+    """
+    return Path(os.environ.get("GRIDAURORA_CACHE", "~/.cache/gridaurora")).expanduser()
+
+
+def lowtranT(c1: dict, usecache: bool = True) -> xarray.DataArray:
+    """
+    LOWTRAN transmittance, cached on disk by the content of its inputs c1, so each
+    (model, observer altitude, zenith angle, wavelength range) is computed once ever.
+    The cache is bounded to LOWTRAN_CACHE_BYTES, evicting least recently used entries.
+    """
+    fn = _lowtranfn(c1)
+
+    if usecache and fn.is_file():
+        try:
+            with h5py.File(fn, "r") as f:
+                T = xarray.DataArray(data=f["/T"][:], coords=[("wavelength_nm", f["/wavelength_nm"][:])])
+            os.utime(fn)  # mark as recently used
+            return T
+        except (OSError, KeyError) as e:
+            logging.warning(f"discarding unreadable LOWTRAN cache file {fn}  {e}")
+            fn.unlink()
+
+    atmT = lowtran.transmittance(c1)["transmission"].squeeze()
+
+    if usecache and isinstance(atmT, xarray.DataArray) and atmT.ndim == 1:
+        tmp = _tmpname(fn)
         try:
-            assert isinstance(f["/T"], h5py.Dataset), "we only allow one transmission curve per file"  # simple legacy behavior
-            fbg3 = interp1d(f["/wavelength"], np.log(f["/T"]), kind="linear", bounds_error=False)
+            fn.parent.mkdir(parents=True, exist_ok=True)
+            with h5py.File(tmp, "w") as f:
+                f["/wavelength_nm"] = atmT.wavelength_nm.values
+                f["/T"] = atmT.values
+                f["/T"].attrs["c1"] = json.dumps(_lowtranc1(c1))
+            tmp.replace(fn)  # atomic, concurrent runs never see a partial file
+
+            _evict(fn.parent, LOWTRAN_CACHE_BYTES)
+        except OSError as e:
+            logging.warning(f"could not cache LOWTRAN transmittance in {fn.parent}.  {e}")
+            if tmp.is_file():
+                tmp.unlink()
+
+    return atmT
+
+
+def _tmpname(fn: Path) -> Path:
+    """
+    temporary file next to fn, unique to this writer
+    """
+    return fn.parent / f"{fn.name}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+
+
+def clearlowtrancache(c1: dict = None):
+    """
+    invalidate the LOWTRAN disk cache: only the entry for c1, or everything if c1 is None
+    """
+    if c1 is not None:
+        fn = _lowtranfn(c1)
+        if fn.is_file():
+            fn.unlink()
+        return
+
+    for fn in (cachedir() / "lowtran").glob("*.h5"):
+        fn.unlink()
+
+
+def _lowtranc1(c1: dict) -> dict:
+    return {k: v.item() if isinstance(v, np.generic) else v for k, v in sorted(c1.items())}
+
+
+def _lowtranfn(c1: dict) -> Path:
+    key = json.dumps([_lowtranc1(c1), getattr(lowtran, "__version__", "")], sort_keys=True)
+
+    return cachedir() / "lowtran" / (hashlib.sha256(key.encode("utf8")).hexdigest() + ".h5")
+
+
+def _evict(path: Path, maxbytes: int):
+    """
+    delete least recently used files until the directory is within maxbytes
+    """
+    files = sorted(path.glob("*.h5"), key=lambda f: f.stat().st_mtime)
+    total = sum(f.stat().st_size for f in files)
+
+    for f in files[:-1]:  # always keep the newest
+        if total <= maxbytes:
+            break
+        total -= f.stat().st_size
+        f.unlink()
+
+
+def buildatmlut(
+    obsalt_km: float, wavelength_nm: np.ndarray, zenith_deg: np.ndarray = None, model: int = 5, fn: Path = None
+) -> xarray.DataArray:
+    """
+    tabulate LOWTRAN log-transmittance on a zenith angle x wavelength grid for one observer altitude,
+    so many lines of sight cost one table build plus interpatmlut().
+
+    zenith_deg: table zenith angles [deg], default 0..85 deg every 2.5 deg
+    fn: optional HDF5 file to save the table, read back with loadatmlut()
+    """
+    if lowtran is None:
+        raise ImportError("LOWTRAN is needed to build an atmospheric transmission table")
+
+    wavelength_nm = np.asarray(wavelength_nm, dtype=float)
+    zenith_deg = np.arange(0, 87.5, 2.5) if zenith_deg is None else np.sort(np.asarray(zenith_deg, dtype=float))
+    if zenith_deg[-1] >= 90:
+        raise ValueError("zenith angles must be below the horizon, < 90 degrees")
+
+    logT = np.empty((zenith_deg.size, wavelength_nm.size))
+    for i, z in enumerate(zenith_deg):
+        c1 = {"model": model, "h1": obsalt_km, "angle": z, "wlshort": wavelength_nm[0], "wllong": wavelength_nm[-1]}
+        atmT = lowtranT(c1)
+        T = atmT.values.copy()
+        T[T == 0] = np.spacing(1)  # to avoid log(0)
+        logT[i] = interp1d(atmT.wavelength_nm, np.log(T))(wavelength_nm)
+
+    lut = xarray.DataArray(
+        data=logT,
+        coords=[("zenith_deg", zenith_deg), ("wavelength_nm", wavelength_nm)],
+        attrs={"obsalt_km": obsalt_km, "model": model},
+    )
+
+    if fn:
+        with h5py.File(Path(fn).expanduser(), "w") as f:
+            d = f.create_dataset("/logT", data=lut.values.astype(np.float32), compression="gzip", shuffle=True)
+            d.attrs["description"] = "natural log of atmospheric transmittance"
+            d.attrs["size"] = "Nzenith x Nwavelength"
+            d.attrs["obsalt_km"] = obsalt_km
+            d.attrs["model"] = model
+            d = f.create_dataset("/zenith_deg", data=zenith_deg)
+            d.attrs["unit"] = "degrees"
+            d = f.create_dataset("/wavelength_nm", data=wavelength_nm)
+            d.attrs["unit"] = "nm"
+
+    return lut
+
+
+def loadatmlut(fn: Path) -> xarray.DataArray:
+    with h5py.File(Path(fn).expanduser(), "r") as f:
+        return xarray.DataArray(
+            data=f["/logT"][:].astype(float),
+            coords=[("zenith_deg", f["/zenith_deg"][:]), ("wavelength_nm", f["/wavelength_nm"][:])],
+            attrs={"obsalt_km": f["/logT"].attrs["obsalt_km"], "model": f["/logT"].attrs["model"]},
+        )
+
+
+def interpatmlut(lut: xarray.DataArray, zenith_deg) -> np.ndarray:
+    """
+    atmospheric transmittance at arbitrary zenith angles from a buildatmlut() table
+
+    log-transmittance is close to linear in airmass, so the table is interpolated linearly in sec(zenith).
+    Zenith angles at or below the horizon (>= 90 degrees) have zero transmittance.
+
+    output: zenith_deg.shape x Nwavelength
+    """
+    zenith_deg = np.asarray(zenith_deg, dtype=float)
+    x = 1 / np.cos(np.radians(lut.zenith_deg.values))
+    q = 1 / np.cos(np.radians(zenith_deg.ravel()))
+
+    i = np.clip(np.searchsorted(x, q), 1, x.size - 1)
+    w = np.clip((q - x[i - 1]) / (x[i] - x[i - 1]), 0, 1)[:, None]  # no extrapolation beyond the table
+
+    logT = lut.values
+    T = np.exp((1 - w) * logT[i - 1] + w * logT[i])
+    T[zenith_deg.ravel() >= 90] = 0.0
+
+    return T.reshape(zenith_deg.shape + (logT.shape[1],))
+
+
+def readcurve(fn: Path) -> Tuple[np.ndarray, np.ndarray, str]:
+    """
+    one transmission or QE curve from the precompute/ HDF5 files, which use
+    /wavelength or /lamb for wavelength and /T or /QE for the curve
+
+    output: wavelength [nm], curve, name of the curve (may be blank)
+    """
+    with h5py.File(Path(fn).expanduser(), "r") as f:
+        try:
+            lamb = f["/wavelength"][:] if "/wavelength" in f else f["/lamb"][:]
         except KeyError:
             raise KeyError("could not find /wavelength in {}".format(f.filename))
 
+        key = "/T" if "/T" in f else "/QE"
+        assert isinstance(f[key], h5py.Dataset), "we only allow one transmission curve per file"  # simple legacy behavior
+        T = f[key][:]
+
         try:
-            fname = f["T"].attrs["name"].item()
-            if isinstance(fname, bytes):
-                fname = fname.decode("utf8")
+            name = f[key].attrs["name"].item()
+            if isinstance(name, bytes):
+                name = name.decode("utf8")
         except KeyError:
-            fname = ""
-    # %% camera window
-    with h5py.File(windfn, "r") as f:
-        fwind = interp1d(f["/lamb"], np.log(f["/T"]), kind="linear")
-    # %% quantum efficiency
-    with h5py.File(qefn, "r") as f:
-        fqe = interp1d(f["/lamb"], np.log(f["/QE"]), kind="linear")
-    # %% collect results into DataArray
+            name = ""
 
-    T = xarray.Dataset(
-        {
-            "filter": ("wavelength_nm", np.exp(fbg3(newLambda))),
-            "window": ("wavelength_nm", np.exp(fwind(newLambda))),
-            "qe": ("wavelength_nm", np.exp(fqe(newLambda))),
-            "atm": ("wavelength_nm", atmTinterp),
-        },
-        coords={"wavelength_nm": newLambda},
-        attrs={"filename": fname},
-    )
+    return lamb, T, name
 
-    T["sysNObg3"] = T["window"] * T["qe"] * T["atm"]
-    T["sys"] = T["sysNObg3"] * T["filter"]
 
-    return T
+def loadcurve(fn: Path, newLambda: np.ndarray, bounds_error: bool = True) -> Tuple[np.ndarray, str]:
+    """
+    transmission curve interpolated to newLambda, from the instrument library when it holds
+    this file, otherwise read directly
+
+    bounds_error: False gives NaN outside the curve's wavelength range instead of ValueError
+    """
+    fn = Path(fn).expanduser()
+
+    lib = instrumentlib()
+    name = lib.lookup(fn) if lib is not None else None
+    if name is not None:
+        return lib.interp(name, newLambda, bounds_error), lib.label(name)
+
+    lamb, T, name = readcurve(fn)
+    with np.errstate(divide="ignore"):
+        f = interp1d(lamb, np.log(T), kind="linear", bounds_error=bounds_error)
+
+    return np.exp(f(newLambda)), name
+
+
+INSTRUMENT_STEP_NM = 0.1
+
+
+class InstrumentLibrary:
+    """
+    filter, window and QE curves resampled to one common wavelength grid, stored contiguous
+    and uncompressed in one HDF5 file, so each curve is a read-only memory map:
+    no HDF5 reads or parsing on the hot path, and the curves are zero-copy array views.
+
+    curves are loaded lazily by name, the stem of their source file e.g. BG3transmittance
+    """
+
+    def __init__(self, fn: Path):
+        self.filename = Path(fn).expanduser()
+        self._curves: Dict[str, np.ndarray] = {}
+        self._lookup: Dict[str, Optional[str]] = {}
+
+        with h5py.File(self.filename, "r") as f:
+            self._layout = {k: (d.id.get_offset(), d.shape, d.dtype) for k, d in f["/curves"].items()}
+            self.attrs = {k: dict(d.attrs) for k, d in f["/curves"].items()}
+            self._wlayout = (f["/wavelength_nm"].id.get_offset(), f["/wavelength_nm"].shape, f["/wavelength_nm"].dtype)
+
+        self.names = list(self._layout)
+        self.wavelength_nm = self._memmap(*self._wlayout)
+
+    def _memmap(self, offset: int, shape: tuple, dtype) -> np.ndarray:
+        return np.memmap(self.filename, dtype=dtype, mode="r", offset=offset, shape=shape)
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        if name not in self._curves:
+            self._curves[name] = self._memmap(*self._layout[name])
+
+        return self._curves[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._layout
+
+    def holds(self, fn: Path) -> bool:
+        """
+        True if the library was built from this version of file fn
+        """
+        fn = Path(fn).expanduser().resolve()
+        if fn.stem not in self:
+            return False
+
+        a = self.attrs[fn.stem]
+        return a["source"] == str(fn) and fn.is_file() and a["mtime"] == fn.stat().st_mtime
+
+    def lookup(self, fn: Path) -> Optional[str]:
+        """
+        name of the curve built from source file fn, None if the library lacks it.
+        Paths are resolved once each, with no file access after that.
+        """
+        key = str(fn)
+        if key not in self._lookup:
+            src = Path(fn).expanduser().resolve()
+            self._lookup[key] = src.stem if src.stem in self and self.attrs[src.stem]["source"] == str(src) else None
+
+        return self._lookup[key]
+
+    def label(self, name: str) -> str:
+        return self.attrs[name]["name"]
+
+    def interp(self, name: str, newLambda: np.ndarray, bounds_error: bool = True) -> np.ndarray:
+        newLambda = np.asarray(newLambda, dtype=float)
+        a = self.attrs[name]
+        outside = (newLambda < a["lmin"]) | (newLambda > a["lmax"])
+        if bounds_error and outside.any():
+            raise ValueError(f"requested wavelengths outside {a['lmin']} .. {a['lmax']} nm of {name}")
+
+        # linear in log(T) like getSystemT always did, touching only the bracketing samples
+        grid = self.wavelength_nm
+        curve = self[name]
+        i = np.clip(np.searchsorted(grid, newLambda), 1, grid.size - 1)
+        w = (newLambda - grid[i - 1]) / (grid[i] - grid[i - 1])
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            y0 = np.log(curve[i - 1])
+            y1 = np.log(curve[i])
+            logT = np.where(w <= 0, y0, np.where(w >= 1, y1, (1 - w) * y0 + w * y1))
+
+        T = np.exp(logT)
+        T[outside] = np.nan
+
+        return T
+
+
+def buildinstrumentlib(fns=None, fn: Path = None, step_nm: float = INSTRUMENT_STEP_NM) -> Path:
+    """
+    consolidate transmission / QE curves (default: all in gridaurora/precompute) into one
+    InstrumentLibrary file on a common wavelength grid, default cachedir()/instruments.h5
+    """
+    fns = _instrumentfiles() if fns is None else [Path(f).expanduser().resolve() for f in fns]
+    fn = cachedir() / "instruments.h5" if fn is None else Path(fn).expanduser()
+
+    curves = {f.stem: readcurve(f) for f in fns}
+    lmin = min(c[0].min() for c in curves.values())
+    lmax = max(c[0].max() for c in curves.values())
+    grid = np.round(np.arange(lmin, lmax + step_nm / 2, step_nm), 6)
+
+    fn.parent.mkdir(parents=True, exist_ok=True)
+    tmp = _tmpname(fn)
+    with h5py.File(tmp, "w") as f:
+        d = f.create_dataset("/wavelength_nm", data=grid)  # contiguous, uncompressed: memory mappable
+        d.attrs["unit"] = "nm"
+        for src, (name, (lamb, T, label)) in zip(fns, curves.items()):
+            i = lamb.argsort()
+            lamb, T = lamb[i], T[i]
+            with np.errstate(divide="ignore"):
+                logT = interp1d(lamb, np.log(T), kind="linear", bounds_error=False)(grid)
+            d = f.create_dataset(f"/curves/{name}", data=np.exp(logT))
+            d.attrs["name"] = label
+            d.attrs["source"] = str(src)
+            d.attrs["mtime"] = src.stat().st_mtime
+            d.attrs["lmin"] = lamb[0]
+            d.attrs["lmax"] = lamb[-1]
+    tmp.replace(fn)
+    _instrumentlib.pop(str(fn), None)
+
+    return fn
+
+
+_instrumentlib: Dict[str, Optional[InstrumentLibrary]] = {}
+
+
+def instrumentlib(fn: Path = None, build: bool = False) -> Optional[InstrumentLibrary]:
+    """
+    instrument library, opened on first use and checked against the source curves once per process.
+    The library is only written on request: build=True builds it if missing or stale.
+    Otherwise a missing or stale library gives None, and curves are read directly.
+    """
+    fn = cachedir() / "instruments.h5" if fn is None else Path(fn).expanduser()
+
+    if str(fn) in _instrumentlib and not build:
+        return _instrumentlib[str(fn)]
+
+    lib = None
+    try:
+        if fn.is_file():
+            lib = InstrumentLibrary(fn)
+            if not all(lib.holds(f) for f in _instrumentfiles()):
+                logging.info(f"instrument library {fn} is stale, rebuild with instrumentlib(build=True)")
+                lib = None
+        if lib is None and build:
+            lib = InstrumentLibrary(buildinstrumentlib(fn=fn))
+    except OSError as e:
+        logging.warning(f"instrument library {fn} unavailable, reading curves directly.  {e}")
+        lib = None
+
+    _instrumentlib[str(fn)] = lib
+
+    return lib
+
+
+def _instrumentfiles() -> list:
+    R = Path(__file__).resolve().parent / "precompute"
+    return [f for f in sorted(R.glob("*.h5")) if f.stem not in ("vjeinfc", "trans_jgr2013a")]
@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+"""
+batched Levenberg-Marquardt fits of differential number flux models to measured spectra.
+
+Residuals are log(model) - log(measured), and positive parameters are fit in log space,
+so every spectrum of a batch is iterated together with analytic Jacobians of the
+closed-form flux components in eFluxGen.
+Each spectrum stops iterating once it has converged, while the rest of the batch carries on.
+"""
+from typing import Callable, Dict, Sequence, Tuple
+import numpy as np
+import xarray
+
+from .eFluxGen import gaussflux, letail, midtail, hitail
+from .energygrid import energygrid
+
+pi = np.pi
+
+FIT_CHUNK = 2048
+MAXSTEP = 1.0  # largest change of any (log) parameter per iteration
+
+
+def _maxwellian(E: np.ndarray, p: Dict[str, np.ndarray]) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """
+    log flux E x N and its derivatives with respect to log(E0), log(Q0)
+    """
+    E0, Q0 = p["E0"], p["Q0"]
+    x = E[:, None] / E0
+
+    f = np.log(Q0 / (2 * pi * E0 ** 2)) + np.log(x) - x
+
+    return f, {"E0": x - 3, "Q0": np.ones_like(f)}
+
+
+def _ellisonramaty(E: np.ndarray, p: Dict[str, np.ndarray]) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """
+    log flux E x N and its derivatives with respect to log(E0), gamma, log(C0). kappa is held fixed.
+    """
+    E0, gamma, kappa, C0 = p["E0"], p["gamma"], p["kappa"], p["C0"]
+    dE = np.gradient(E)[:, None]
+    u = (E[:, None] - E0) / dE
+
+    f = np.log(C0) - gamma * np.log(E[:, None]) - u ** kappa
+
+    return f, {
+        "E0": kappa * u ** (kappa - 1) * E0 / dE,
+        "gamma": -np.broadcast_to(np.log(E[:, None]), f.shape),
+        "C0": np.ones_like(f),
+    }
+
+
+def _strickland(E: np.ndarray, p: Dict[str, np.ndarray]) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """
+    log flux E x N of fluxgen() and its derivatives with respect to the log of each parameter.
+
+    The Gaussian, low and mid tail derivatives are closed form. The high tail scales with the flux
+    at the energy bin nearest E0, whose index is held fixed within an iteration.
+    """
+    E0, Q0, Wbc, bl, bm, bh, Bm, Bhf = (p[n] for n in STRICKLAND)
+    x = E[:, None] / E0
+    lx = np.log(x)
+    cols = np.arange(E0.size)
+    isimE0 = abs(E[:, None] - E0).argmin(axis=0)
+
+    G = gaussflux(E, Wbc * E0, E0, Q0)
+    L = letail(E, E0, Q0, bl)
+    M = midtail(E, E0, bm, Bm)
+    a = (x - 1) / Wbc
+    dP = {
+        "E0": G * (2 * a * x / Wbc - 2) + L * (bl - 2) - M * bm,
+        "Q0": G + L,
+        "Wbc": G * (2 * a ** 2 - 1),
+        "bl": -bl * lx * L,
+        "bm": bm * lx * M,
+        "bh": np.zeros_like(G),
+        "Bm": M,
+        "Bhf": np.zeros_like(G),
+    }
+    P = G + L + M
+    H = hitail(E, P, isimE0, E0, Bhf, bh)
+    # %% high tail, Bh = Bhf * P(E0)
+    Pi = P[isimE0, cols]
+    dPhi = {n: d + H * d[isimE0, cols] / Pi for n, d in dP.items()}
+    dPhi["E0"] += bh * H
+    dPhi["bh"] -= bh * lx * H
+    dPhi["Bhf"] += H
+
+    Phi = P + H
+
+    return np.log(Phi), {n: d / Phi for n, d in dPhi.items()}
+
+
+STRICKLAND = ("E0", "Q0", "Wbc", "bl", "bm", "bh", "Bm", "Bhf")
+
+# model: (log flux and Jacobian, parameter names, parameters fit in log space, parameters always held fixed)
+MODELS: Dict[str, Tuple[Callable, Tuple[str, ...], Tuple[str, ...], Tuple[str, ...]]] = {
+    "strickland": (_strickland, STRICKLAND, STRICKLAND, ()),
+    "maxwellian": (_maxwellian, ("E0", "Q0"), ("E0", "Q0"), ()),
+    "ellisonramaty": (_ellisonramaty, ("E0", "gamma", "kappa", "C0"), ("E0", "kappa", "C0"), ("kappa",)),
+}
+
+DEFAULTS = {"Wbc": 0.5, "bl": 0.8, "bm": 3.0, "bh": 4.0, "Bm": 3000.0, "Bhf": 0.2, "gamma": -1.0, "kappa": 1.0, "C0": 1.0}
+
+
+def initialguess(E: np.ndarray, phi: np.ndarray, model: str) -> Dict[str, np.ndarray]:
+    """
+    E0 at the flux peak (energy flux peak for Strickland, whose low energy tail rises),
+    Q0 from the total flux, other parameters from DEFAULTS.
+    A FluxLibrary.parameters() nearest neighbour is usually a better starting point.
+    """
+    peak = np.nan_to_num(phi) * (E[:, None] if model == "strickland" else 1)
+    E0 = E[peak.argmax(axis=0)]
+    Q = energygrid(E).numberflux(np.nan_to_num(phi))
+
+    p0 = {n: np.full(E0.size, DEFAULTS[n]) for n in MODELS[model][1] if n in DEFAULTS}
+    p0["E0"] = E0
+    if model == "maxwellian":
+        p0["Q0"] = 2 * pi * E0 * Q
+    elif model == "strickland":
+        p0["Q0"] = pi * E0 * Q
+    elif model == "ellisonramaty":
+        p0["C0"] = np.nanmax(phi, axis=0) * E0 ** p0["gamma"]
+
+    return p0
+
+
+def fitflux(
+    E: np.ndarray,
+    phi: np.ndarray,
+    model: str = "strickland",
+    p0: Dict[str, np.ndarray] = None,
+    fixed: Sequence[str] = (),
+    maxiter: int = 100,
+    ftol: float = 1e-8,
+    xtol: float = 1e-8,
+    chunk: int = FIT_CHUNK,
+) -> xarray.Dataset:
+    """
+    E: energy bins [eV]
+    phi: E x Nspectra measured differential number flux. Non-positive and non-finite bins are ignored.
+    model: "strickland" (fluxgen), "maxwellian" or "ellisonramaty"
+    p0: starting parameters, scalars or Nspectra vectors. Missing ones come from initialguess().
+    fixed: parameters held at their p0 value
+    maxiter: iteration budget, per spectrum
+    ftol, xtol: a spectrum has converged when an accepted step changes its cost or its (log) parameters
+                by less than this relative amount
+    chunk: spectra fit together, bounding the Nspectra x E x Nparam Jacobian
+
+    returns Dataset over "spectrum" of the fitted parameters, final cost, "converged" and "niter"
+    """
+    try:
+        func, names, logp, alwaysfixed = MODELS[model]
+    except KeyError:
+        raise ValueError(f"unknown model {model}, choose from {list(MODELS)}")
+
+    E = np.asarray(E, dtype=float)
+    phi = np.asarray(phi, dtype=float)
+    if phi.ndim == 1:
+        phi = phi[:, None]
+    N = phi.shape[1]
+
+    start = initialguess(E, phi, model)
+    start.update(p0 or {})
+    theta = np.column_stack([np.broadcast_to(np.asarray(start[n], dtype=float), (N,)) for n in names])
+    islog = np.array([n in logp for n in names])
+    theta[:, islog] = np.log(theta[:, islog])
+
+    free = np.array([n not in fixed and n not in alwaysfixed for n in names])
+
+    cost = np.empty(N)
+    converged = np.zeros(N, bool)
+    niter = np.zeros(N, int)
+    for k in range(0, N, chunk):
+        j = slice(k, k + chunk)
+        with np.errstate(all="ignore"):  # trial steps that overflow are rejected by _levmar
+            theta[j], cost[j], converged[j], niter[j] = _levmar(
+                func, E, phi[:, j], theta[j], names, islog, free, maxiter, ftol, xtol
+            )
+
+    theta[:, islog] = np.exp(theta[:, islog])
+
+    fit = xarray.Dataset({n: ("spectrum", theta[:, i]) for i, n in enumerate(names)})
+    fit["cost"] = ("spectrum", cost)
+    fit["converged"] = ("spectrum", converged)
+    fit["niter"] = ("spectrum", niter)
+    fit.attrs["model"] = model
+
+    return fit
+
+
+def _levmar(
+    func: Callable,
+    E: np.ndarray,
+    phi: np.ndarray,
+    theta: np.ndarray,
+    names: Tuple[str, ...],
+    islog: np.ndarray,
+    free: np.ndarray,
+    maxiter: int,
+    ftol: float,
+    xtol: float,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    valid = (phi > 0) & np.isfinite(phi)
+    logphi = np.log(np.where(valid, phi, 1.0))
+    # %% residuals are Nspectra x E, Jacobians Nspectra x E x Nfree
+
+    def residual(th: np.ndarray, i: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        p = {n: np.exp(th[:, m]) if islog[m] else th[:, m] for m, n in enumerate(names)}
+        f, df = func(E, p)
+        w = valid[:, i]
+        r = np.where(w, f - logphi[:, i], 0.0).T
+        J = np.stack([df[n] for n, isfree in zip(names, free) if isfree], axis=-1)
+        J = np.where(w[..., None], J, 0.0).transpose(1, 0, 2)
+        return r, J
+
+    N = theta.shape[0]
+    P = free.sum()
+
+    i = np.arange(N)
+    r, J = residual(theta, i)
+    cost = 0.5 * (r ** 2).sum(axis=1)
+    lam = np.full(N, 1e-3)
+    active = np.isfinite(cost) & np.isfinite(J).all(axis=(1, 2))
+    converged = np.zeros(N, bool)
+    niter = np.zeros(N, int)
+
+    for _ in range(maxiter):
+        a = np.flatnonzero(active)
+        if a.size == 0:
+            break
+
+        JTJ = np.einsum("nep,neq->npq", J[a], J[a])
+        g = np.einsum("nep,ne->np", J[a], r[a])
+        D = np.einsum("npp->np", JTJ)
+        D = np.maximum(D, 1e-6 * D.max(axis=1, keepdims=True))  # parameters the data hardly constrain
+        A = JTJ + (lam[a, None] * D)[..., None] * np.eye(P)
+        step = -np.linalg.solve(A, g[..., None])[..., 0]
+        step /= np.maximum(1, abs(step).max(axis=1) / MAXSTEP)[:, None]
+
+        trial = theta[a].copy()
+        trial[:, free] += step
+        rt, Jt = residual(trial, a)
+        ct = 0.5 * (rt ** 2).sum(axis=1)
+        niter[a] += 1
+
+        better = (ct < cost[a]) & np.isfinite(Jt).all(axis=(1, 2))  # NaN cost is never better
+        b = a[better]
+        done = better & (
+            (cost[a] - ct <= ftol * cost[a]) | (abs(step).max(axis=1) <= xtol * (1 + abs(theta[a][:, free]).max(axis=1)))
+        )
+
+        theta[b] = trial[better]
+        r[b], J[b], cost[b] = rt[better], Jt[better], ct[better]
+        lam[b] /= 10
+        lam[a[~better]] *= 10
+
+        converged[a[done]] = True
+        active[a[done]] = False
+        active[lam > 1e12] = False  # no descent direction left
+
+    return theta, cost, converged, niter
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+"""
+library of precomputed differential number flux spectra over a parameter grid,
+for finding the Strickland, Maxwellian or Ellison-Ramaty parameters nearest a measured spectrum.
+
+The log10 spectra are stored in a chunked HDF5 file along with a principal component basis.
+Queries project measured spectra onto the basis and search a KD-tree of the library coefficients.
+"""
+from pathlib import Path
+import itertools
+from typing import Callable, Dict, Tuple
+import numpy as np
+import h5py
+from scipy.interpolate import interp1d
+from scipy.spatial import cKDTree
+
+from .eFluxGen import fluxgen, maxwellian, EllisonRamaty
+
+FLUXLIB_CHUNK = 4096
+FLUX_FLOOR = 1e-3  # [cm^-2 s^-1 eV^-1 sr^-1], spectra are clipped here before log10
+
+MODELS: Dict[str, Tuple[Callable, Tuple[str, ...]]] = {
+    "strickland": (
+        lambda E, p: fluxgen(E, p["E0"], p["Q0"], p["Wbc"], p["bl"], p["bm"], p["bh"], p["Bm"], p["Bhf"], components=False)[0],
+        ("E0", "Q0", "Wbc", "bl", "bm", "bh", "Bm", "Bhf"),
+    ),
+    "maxwellian": (lambda E, p: maxwellian(E, p["E0"], p["Q0"])[0], ("E0", "Q0")),
+    "ellisonramaty": (lambda E, p: EllisonRamaty(E, p["E0"], p["gamma"], p["kappa"], p["C0"]), ("E0", "gamma", "kappa", "C0")),
+}
+
+
+def paramgrid(**axes) -> Dict[str, np.ndarray]:
+    """
+    outer product of parameter axes, flattened to equal length vectors
+
+    paramgrid(E0=[500, 1000], Q0=[1e11, 1e12]) gives 4 parameter sets
+    """
+    names = list(axes)
+    grid = np.array(list(itertools.product(*(np.atleast_1d(axes[n]) for n in names))), dtype=float)
+
+    return {n: grid[:, i] for i, n in enumerate(names)}
+
+
+def logflux(phi: np.ndarray, floor: float = FLUX_FLOOR) -> np.ndarray:
+    return np.log10(np.clip(np.nan_to_num(phi, nan=floor), floor, None))
+
+
+def buildfluxlib(
+    fn: Path, E: np.ndarray, model: str, params: Dict[str, np.ndarray], nbasis: int = 12, floor: float = FLUX_FLOOR,
+) -> Path:
+    """
+    fn: HDF5 library to write
+    E: energy bins [eV]
+    model: "strickland", "maxwellian" or "ellisonramaty"
+    params: equal length vectors (or scalars) of the model parameters, e.g. from paramgrid()
+    nbasis: number of principal components indexed for search
+
+    the spectra are generated FLUXLIB_CHUNK at a time, so the parameter grid may be far larger than memory.
+    """
+    fn = Path(fn).expanduser()
+    E = np.asarray(E, dtype=float)
+
+    try:
+        func, names = MODELS[model]
+    except KeyError:
+        raise ValueError(f"unknown model {model}, choose from {list(MODELS)}")
+
+    missing = set(names).difference(params)
+    if missing:
+        raise ValueError(f"{model} needs parameters {missing}")
+
+    N = max(np.size(params[n]) for n in names)
+    params = {n: np.broadcast_to(np.asarray(params[n], dtype=float), (N,)) for n in names}
+    nbasis = min(nbasis, E.size)
+
+    with h5py.File(fn, "w") as f:
+        f["/E"] = E
+        f.attrs["model"] = model
+        f.attrs["floor"] = floor
+        for n in names:
+            f[f"/params/{n}"] = params[n]
+
+        logphi = f.create_dataset("/logphi", (N, E.size), dtype=np.float32, chunks=(min(N, FLUXLIB_CHUNK), E.size))
+        # %% spectra, and running moments for the principal components
+        s = np.zeros(E.size)
+        G = np.zeros((E.size, E.size))
+        for k in range(0, N, FLUXLIB_CHUNK):
+            j = slice(k, k + FLUXLIB_CHUNK)
+            X = logflux(func(E, {n: params[n][j] for n in names}), floor).T
+            logphi[j] = X
+            s += X.sum(axis=0)
+            G += X.T @ X
+        # %% principal components of the log spectra
+        mean = s / N
+        w, V = np.linalg.eigh(G / N - np.outer(mean, mean))
+        basis = V[:, ::-1][:, :nbasis]
+
+        f["/mean"] = mean
+        f["/basis"] = basis
+        f["/variance"] = w[::-1][:nbasis]
+        coef = f.create_dataset("/coef", (N, nbasis), dtype=float, chunks=(min(N, FLUXLIB_CHUNK), nbasis))
+        for k in range(0, N, FLUXLIB_CHUNK):
+            j = slice(k, k + FLUXLIB_CHUNK)
+            coef[j] = (logphi[j] - mean) @ basis
+
+    return fn
+
+
+class FluxLibrary:
+    """
+    nearest neighbour search of a library written by buildfluxlib()
+    """
+
+    def __init__(self, fn: Path):
+        self.filename = Path(fn).expanduser()
+
+        with h5py.File(self.filename, "r") as f:
+            self.E = f["/E"][:]
+            self.model = f.attrs["model"]
+            self.floor = f.attrs["floor"]
+            self.params = {n: f[f"/params/{n}"][:] for n in f["/params"]}
+            self.mean = f["/mean"][:]
+            self.basis = f["/basis"][:]
+            self.variance = f["/variance"][:]
+            self.tree = cKDTree(f["/coef"][:])
+
+    def __len__(self) -> int:
+        return self.tree.n
+
+    def project(self, phi: np.ndarray, E: np.ndarray = None) -> np.ndarray:
+        """
+        phi: E x Nspectra (or 1-D) measured differential number flux, optionally on its own energy grid E,
+             which should span the library energy grid; flux outside E is taken as the floor.
+        """
+        phi = np.asarray(phi, dtype=float)
+        if phi.ndim == 1:
+            phi = phi[:, None]
+
+        X = logflux(phi, self.floor)
+        if E is not None:
+            X = interp1d(np.log(E), X, axis=0, bounds_error=False, fill_value=np.log10(self.floor))(np.log(self.E))
+
+        return (X.T - self.mean) @ self.basis
+
+    def query(self, phi: np.ndarray, E: np.ndarray = None, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        k nearest library spectra to each measured spectrum
+
+        returns distance (log10 flux, in the reduced basis) and library index, each Nspectra x k
+        """
+        dist, idx = self.tree.query(self.project(phi, E), k=k)
+
+        return dist.reshape(-1, k), idx.reshape(-1, k)
+
+    def parameters(self, idx: np.ndarray) -> Dict[str, np.ndarray]:
+        return {n: p[idx] for n, p in self.params.items()}
+
+    def spectra(self, idx: np.ndarray) -> np.ndarray:
+        """
+        library differential number flux, E x len(idx)
+        """
+        u, inv = np.unique(idx, return_inverse=True)  # h5py needs increasing indices
+        with h5py.File(self.filename, "r") as f:
+            logphi = f["/logphi"][u]
+
+        return 10.0 ** logphi[inv.ravel()].T.astype(float)
@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+"""
+eigenprofile forward model: differential number flux spectra to VER and column brightness.
+
+VER is linear in the precipitating flux, so with the energy bin widths folded into the
+eigenprofiles once, a whole batch of spectra is a single chunked matrix product.
+"""
+from pathlib import Path
+from typing import Tuple
+import numpy as np
+import h5py
+import xarray
+
+from .energygrid import energygrid
+from .tucker import Tucker, modeproduct
+
+FORWARD_CHUNK_BYTES = 64_000_000
+
+
+def energywidths(E: np.ndarray, EKpcolor: np.ndarray = None) -> np.ndarray:
+    """
+    energy bin widths [eV] of the eigenprofile beams
+
+    EKpcolor: bin edges, one longer than E, as from arcexcite.getBeamEnergies() or writeeigen /Ebins.
+              If omitted, trapezoidal weights of E are used.
+    """
+    E = np.asarray(E, dtype=float)
+    if EKpcolor is None:
+        return energygrid(E).w
+
+    EKpcolor = np.asarray(EKpcolor, dtype=float)
+    if EKpcolor.size == E.size + 1:
+        return np.diff(EKpcolor)
+    if EKpcolor.size == E.size:
+        return energygrid(EKpcolor).w
+
+    raise ValueError(f"{EKpcolor.size} bin edges do not match {E.size} beam energies")
+
+
+class EigenForward:
+    """
+    P: eigenprofiles with an "energy_ev" dimension, e.g. getTranscar Peigen (alt_km x energy_ev),
+       or the Plambda cube (alt_km x wavelength_nm x energy_ev)
+    EKpcolor: energy bin edges, see energywidths()
+    """
+
+    def __init__(self, P: xarray.DataArray, EKpcolor: np.ndarray = None):
+        P = P.transpose("energy_ev", ...)
+        self.energy_ev = P.energy_ev.values
+        self.dE = energywidths(self.energy_ev, EKpcolor)
+
+        self.dims = P.dims[1:]
+        self.coords = {d: P[d].values for d in self.dims}
+        shape = P.shape[1:]
+        # %% Nenergy x Nout, so VER of a batch is one GEMM
+        Pw = P.values * self.dE.reshape((-1,) + (1,) * len(shape))
+        self.K = np.ascontiguousarray(Pw.reshape(self.energy_ev.size, -1))
+        # %% column brightness kernel, integrated over altitude like calcemissions
+        self.Kb = None
+        if "alt_km" in self.dims:
+            Pb = np.trapz(Pw, self.coords["alt_km"], axis=P.dims.index("alt_km"))
+            self.bdims = tuple(d for d in self.dims if d != "alt_km")
+            self.Kb = np.ascontiguousarray(Pb.reshape(self.energy_ev.size, -1))
+
+    @classmethod
+    def from_h5(cls, fn: Path, itime: int = 0) -> "EigenForward":
+        """
+        ver eigenprofiles of one time from a writeeigen() file.
+        A file written with a Tucker tolerance gives a TuckerForward.
+        """
+        with h5py.File(Path(fn).expanduser(), "r") as f:
+            if "/ver/eigenprofile" not in f:
+                return TuckerForward(Tucker.from_h5(f), f["/Ebins"][:], itime)
+            ver = f["/ver/eigenprofile"][itime]  # Nenergy x Nalt x Nwavelength
+            Ebins = f["/Ebins"][:]
+            z = f["/altitude"][:]
+            lamb = f["/ver/wavelength"][:]
+
+        E = Ebins[: ver.shape[0]]
+        P = xarray.DataArray(ver, coords=[("energy_ev", E), ("alt_km", z), ("wavelength_nm", lamb)])
+
+        return cls(P, Ebins)
+
+    def ver(self, phi, chunk: int = None) -> xarray.DataArray:
+        """
+        phi: differential number flux on the eigenprofile energies, Nenergy, Nenergy x Nspectra or
+             Nenergy x ny x nx (an image of spectra).
+             A DataArray keeps the names and coordinates of its dimensions other than energy_ev.
+        returns VER with the batch dimensions of phi, then the eigenprofile dimensions
+        """
+        return self._apply(self.K, self.dims, phi, chunk)
+
+    def brightness(self, phi, zenith_deg: float = 0.0, chunk: int = None) -> xarray.DataArray:
+        """
+        column brightness along a line of sight zenith_deg from vertical (plane parallel)
+        """
+        if self.Kb is None:
+            raise ValueError("eigenprofiles without an alt_km dimension have no column brightness")
+
+        return self._apply(self.Kb, self.bdims, phi, chunk) / np.cos(np.radians(zenith_deg))
+
+    def _apply(self, K: np.ndarray, dims: Tuple[str, ...], phi, chunk: int = None) -> xarray.DataArray:
+        batch, phi = self._batch(phi)
+        N = phi.shape[1]
+
+        if chunk is None:
+            chunk = max(1, FORWARD_CHUNK_BYTES // (8 * K.shape[1]))
+
+        out = np.empty((N, K.shape[1]))
+        for k in range(0, N, chunk):
+            j = slice(k, k + chunk)
+            np.matmul(phi[:, j].T, K, out=out[j])
+
+        return self._wrap(out, dims, batch)
+
+    def _wrap(self, out: np.ndarray, dims: Tuple[str, ...], batch: tuple) -> xarray.DataArray:
+        """
+        N x Nout results back to the batch dimensions of the input, then the eigenprofile dimensions
+        """
+        bdims, bshape, bcoords = batch
+        shape = tuple(self.coords[d].size for d in dims)
+        coords = {d: self.coords[d] for d in dims}
+        coords.update(bcoords)
+
+        return xarray.DataArray(out.reshape(bshape + shape), coords=coords, dims=bdims + dims)
+
+    def _batch(self, phi) -> tuple:
+        """
+        flux as Nenergy x N, with the names, shape and coordinates of the batch dimensions.
+        Every dimension after energy is a batch dimension, e.g. the y, x pixels of an image.
+        One spectrum has none.
+        """
+        if isinstance(phi, xarray.DataArray):
+            if "energy_ev" in phi.dims:
+                phi = phi.transpose("energy_ev", ...)
+            bdims = phi.dims[1:]
+            bcoords = {k: (c.dims, c.values) for k, c in phi.coords.items() if k != "energy_ev" and set(c.dims) <= set(bdims)}
+            phi = phi.values
+        else:
+            nb = np.ndim(phi) - 1
+            bdims = ("spectrum",) if nb == 1 else tuple(f"spectrum_{i}" for i in range(nb))
+            bcoords = {d: np.arange(n) for d, n in zip(bdims, np.shape(phi)[1:])}
+
+        phi = np.asarray(phi, dtype=float)
+        if phi.shape[0] != self.energy_ev.size:
+            raise ValueError(f"flux has {phi.shape[0]} energies, eigenprofiles have {self.energy_ev.size}")
+
+        return (tuple(bdims), phi.shape[1:], bcoords), phi.reshape(phi.shape[0], -1)
+
+
+class TuckerForward(EigenForward):
+    """
+    EigenForward on a Tucker compressed eigenprofile cube, without rebuilding the cube.
+
+    coefficients() and project() stay in the reduced basis, at a cost per spectrum set by the ranks
+    rather than Nenergy x Nout. ver() and brightness() expand to the full grid with two GEMMs per chunk,
+    and column brightness integrates the altitude factor once.
+
+    T: tucker.Tucker with an "energy_ev" dimension and coordinate, and optionally "time"
+    EKpcolor: energy bin edges, see energywidths()
+    itime: time index, if T has a time dimension
+    """
+
+    def __init__(self, T: Tucker, EKpcolor: np.ndarray = None, itime: int = 0):
+        core = T.core
+        factors = list(T.factors)
+        dims = list(T.dims)
+        if "time" in dims:
+            k = dims.index("time")
+            core = np.tensordot(factors.pop(k)[itime], core, axes=(0, k))
+            dims.pop(k)
+
+        if "energy_ev" not in dims or "energy_ev" not in T.coords:
+            raise ValueError("Tucker eigenprofiles need an energy_ev dimension and coordinate")
+        k = dims.index("energy_ev")
+        Ue = factors.pop(k)
+        dims.pop(k)
+        core = np.moveaxis(core, k, 0)
+
+        self.energy_ev = np.asarray(T.coords["energy_ev"])
+        self.dE = energywidths(self.energy_ev, EKpcolor)
+        self.dims = tuple(dims)
+        self.coords = {d: np.asarray(T.coords[d]) if d in T.coords else np.arange(U.shape[0]) for d, U in zip(dims, factors)}
+        # %% spectra to core coefficients is We @ phi, then C.T
+        self.We = np.ascontiguousarray((Ue * self.dE[:, None]).T)
+        self.rshape = core.shape[1:]
+        self.C = np.ascontiguousarray(core.reshape(core.shape[0], -1))
+        self.factors = factors
+        self.bfactors = None
+        if "alt_km" in self.dims:
+            a = self.dims.index("alt_km")
+            self.bdims = tuple(d for d in self.dims if d != "alt_km")
+            self.bfactors = factors.copy()
+            self.bfactors[a] = np.trapz(factors[a], self.coords["alt_km"], axis=0)[None, :]
+
+    def ver(self, phi, chunk: int = None) -> xarray.DataArray:
+        return self._apply(self.factors, self.dims, phi, chunk)
+
+    def brightness(self, phi, zenith_deg: float = 0.0, chunk: int = None) -> xarray.DataArray:
+        if self.bfactors is None:
+            raise ValueError("eigenprofiles without an alt_km dimension have no column brightness")
+
+        return self._apply(self.bfactors, self.bdims, phi, chunk) / np.cos(np.radians(zenith_deg))
+
+    def coefficients(self, phi) -> np.ndarray:
+        """
+        flux spectra as coefficients of the reduced output basis, batch dimensions x r_1 x r_2 ...
+        """
+        (_, bshape, _), phi = self._batch(phi)
+
+        return (self.C.T @ (self.We @ phi)).T.reshape(bshape + self.rshape)
+
+    def project(self, obs: np.ndarray) -> np.ndarray:
+        """
+        VER (N x Nout...) onto the reduced output basis. The factors are orthonormal, so model-data
+        misfit in these coefficients equals the full misfit, less the part no flux can explain.
+        """
+        obs = np.asarray(obs, dtype=float).reshape((-1,) + tuple(U.shape[0] for U in self.factors))
+
+        return modeproduct(obs, [U.T for U in self.factors], skip=1)
+
+    def _apply(self, factors, dims: Tuple[str, ...], phi, chunk: int = None) -> xarray.DataArray:
+        batch, phi = self._batch(phi)
+        N = phi.shape[1]
+
+        shape = tuple(U.shape[0] for U in factors)
+        if chunk is None:
+            chunk = max(1, FORWARD_CHUNK_BYTES // (8 * int(np.prod(shape))))
+        # %% core expanded on all but the last output dimension, so each chunk is two plain GEMMs
+        G = modeproduct(self.C.reshape((-1,) + self.rshape), factors[:-1], skip=1)
+        G = G.reshape(G.shape[0], -1)
+        G = np.ascontiguousarray((self.We.T @ G))  # Nenergy x (N_1 ... r_last)
+        Ulast = factors[-1].T
+
+        out = np.empty((N, int(np.prod(shape))))
+        for k in range(0, N, chunk):
+            j = slice(k, k + chunk)
+            np.matmul((phi[:, j].T @ G).reshape(-1, Ulast.shape[0]), Ulast, out=out[j].reshape(-1, Ulast.shape[1]))
+
+        return self._wrap(out, dims, batch)
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+"""
+non-negative, Tikhonov regularized inversion of VER or brightness to precipitating flux
+through the eigenprofile basis, for many pixels at once.
+
+    min_x  1/2 ||A x - b||^2 + lam/2 dref^2 ||L x||^2   subject to x >= 0
+
+solved by ADMM. A is the eigenprofile matrix with the energy bin widths folded in (forward.EigenForward).
+The penalty acts on the flux spectrum x itself, so "gradient" and "curvature" smooth the spectrum.
+dref is the geometric mean norm of the eigenprofiles, which makes lam comparable between instruments.
+For conditioning, ADMM iterates on y = d x, the fluxes scaled by the norm d of each eigenprofile.
+The y-update matrix is Cholesky factored once, and its inverse reused as one GEMM per iteration
+for every pixel, iteration and frame. Pixels leave the working set as they converge.
+"""
+from typing import Union
+import numpy as np
+import xarray
+from scipy.linalg import cho_factor, cho_solve
+
+from .forward import EigenForward
+
+RELAX = 1.6  # ADMM over-relaxation, Boyd et al 2011 section 3.4.3
+
+
+def regularizer(L: Union[str, np.ndarray, None], n: int) -> np.ndarray:
+    """
+    L: None or "identity" (ridge), "gradient" or "curvature" finite differences across energy, or a matrix with n columns
+    """
+    if L is None or (isinstance(L, str) and L == "identity"):
+        return np.eye(n)
+    if isinstance(L, str):
+        if L == "gradient":
+            return np.diff(np.eye(n), 1, axis=0)
+        if L == "curvature":
+            return np.diff(np.eye(n), 2, axis=0)
+        raise ValueError(f"unknown regularizer {L}, use identity, gradient, curvature or a matrix")
+
+    L = np.atleast_2d(L)
+    if L.shape[1] != n:
+        raise ValueError(f"regularizer must have {n} columns")
+    return L
+
+
+class EigenInversion:
+    """
+    P: eigenprofiles with an "energy_ev" dimension, e.g. getTranscar Peigen (alt_km x energy_ev)
+    EKpcolor: energy bin edges, see forward.energywidths()
+    lam: Tikhonov weight
+    L: regularizer, see regularizer()
+    rho: ADMM penalty, by default the geometric mean of the extreme eigenvalues of the normal equations
+    brightness: invert column brightness rather than VER profiles
+    """
+
+    def __init__(
+        self,
+        P: xarray.DataArray,
+        EKpcolor: np.ndarray = None,
+        lam: float = 1e-5,
+        L: Union[str, np.ndarray] = None,
+        rho: float = None,
+        brightness: bool = False,
+    ):
+        self.forward = EigenForward(P, EKpcolor)
+        fw = self.forward
+
+        K = fw.Kb if brightness else fw.K  # Nenergy x Nobs
+        if K is None:
+            raise ValueError("eigenprofiles without an alt_km dimension have no column brightness")
+        self.dims = fw.bdims if brightness else fw.dims
+        n = K.shape[0]
+
+        self.d = np.linalg.norm(K, axis=1)
+        self.d[self.d == 0] = 1.0
+        self.AT = np.ascontiguousarray(K / self.d[:, None])  # scaled A^T
+
+        # %% penalty on x = y / d
+        dref = np.exp(np.log(self.d).mean())
+        Ls = regularizer(L, n) * (dref / self.d)
+        H = self.AT @ self.AT.T + lam * Ls.T @ Ls
+        if rho is None:
+            w = np.linalg.eigvalsh(H)
+            rho = np.sqrt(max(w[0], 1e-8 * w[-1]) * w[-1])
+        self.rho = rho
+        self.Minv = cho_solve(cho_factor(H + rho * np.eye(n)), np.eye(n))
+
+    def solve(
+        self, b, warm: xarray.Dataset = None, maxiter: int = 200, tol: float = 1e-4
+    ) -> xarray.Dataset:
+        """
+        b: observations, one pixel (Nobs) or a batch (..., Nobs), e.g. an Ny x Nx x Nalt frame,
+           as from EigenForward.ver() / brightness()
+        warm: a previous solve() result, e.g. the last video frame, to start from
+        maxiter: ADMM iteration budget
+        tol: relative primal and dual residual for convergence of each pixel
+
+        returns Dataset with
+        flux: energy_ev x batch dimensions differential number flux, as EigenForward.ver() takes it
+        dual: scaled ADMM dual variable, for warm starts
+        converged, niter: per pixel, in the batch shape of b
+        residual: ||A x - b|| per pixel
+        """
+        (bdims, bshape, bcoords), B = self._batch(b)
+        N = B.shape[1]
+        n = self.d.size
+
+        ATb = self.AT @ B
+        if warm is not None:
+            z = warm["flux"].values.reshape(n, -1) * self.d[:, None]
+            u = warm["dual"].values.reshape(n, -1)
+            if z.shape[1] != N:
+                raise ValueError(f"warm start has {z.shape[1]} pixels, the data have {N}")
+        else:
+            z = np.zeros((n, N))
+            u = np.zeros((n, N))
+
+        converged = np.zeros(N, bool)
+        niter = np.full(N, maxiter)
+        # %% working set of unconverged pixels
+        act = np.arange(N)
+        c = self.Minv @ ATb
+        zc, uc = z, u.copy()
+        for i in range(maxiter):
+            x = c + self.rho * (self.Minv @ (zc - uc))
+            zold = zc
+            xh = RELAX * x + (1 - RELAX) * zold  # over-relaxation
+            zc = np.maximum(xh + uc, 0)
+            uc += xh - zc
+
+            r = np.linalg.norm(x - zc, axis=0)
+            s = self.rho * np.linalg.norm(zc - zold, axis=0)
+            eps = tol * (1 + np.linalg.norm(zc, axis=0))
+            done = (r <= eps) & (s <= eps)
+            if done.any():
+                j = act[done]
+                z[:, j] = zc[:, done]
+                u[:, j] = uc[:, done]
+                niter[j] = i + 1
+                converged[j] = True
+
+                keep = ~done
+                act = act[keep]
+                zc, uc, c = zc[:, keep], uc[:, keep], c[:, keep]
+                if act.size == 0:
+                    break
+
+        z[:, act] = zc
+        u[:, act] = uc
+
+        flux = z / self.d[:, None]
+        residual = np.linalg.norm(self.AT.T @ z - B, axis=0)
+
+        coords = {"energy_ev": self.forward.energy_ev}
+        coords.update(bcoords)
+        edims = ("energy_ev",) + bdims
+        return xarray.Dataset(
+            {
+                "flux": (edims, flux.reshape((n,) + bshape)),
+                "dual": (edims, u.reshape((n,) + bshape)),
+                "converged": (bdims, converged.reshape(bshape)),
+                "niter": (bdims, niter.reshape(bshape)),
+                "residual": (bdims, residual.reshape(bshape)),
+            },
+            coords=coords,
+        )
+
+    def _batch(self, b) -> tuple:
+        """
+        observations as Nobs x N, with the names, shape and coordinates of the batch dimensions.
+        Every dimension before the observation dimensions is a batch dimension, e.g. the y, x pixels of an image.
+        One pixel has none.
+        """
+        nobs = self.AT.shape[1]
+        if isinstance(b, xarray.DataArray):
+            bdims = tuple(d for d in b.dims if d not in self.dims)
+            b = b.transpose(*bdims, *self.dims)
+            bcoords = {k: (c.dims, c.values) for k, c in b.coords.items() if c.dims and set(c.dims) <= set(bdims)}
+            b = b.values
+        else:
+            b = np.asarray(b)
+            oshape = tuple(self.forward.coords[d].size for d in self.dims)
+            k = len(oshape)
+            if b.shape[-k:] != oshape:
+                if b.shape[-1:] != (nobs,):
+                    raise ValueError(f"observations must end in {oshape} or {nobs}, not {b.shape}")
+                k = 1
+            nb = b.ndim - k
+            bdims = ("pixel",) if nb == 1 else tuple(f"pixel_{i}" for i in range(nb))
+            bcoords = {d: np.arange(m) for d, m in zip(bdims, b.shape[:nb])}
+
+        bshape = b.shape[: len(bdims)]
+        B = np.asarray(b, dtype=float).reshape(-1, nobs).T
+        return (bdims, bshape, bcoords), B
@@ -1,24 +1,93 @@
 #!/usr/bin/env python
 import logging
+from typing import Dict
+from weakref import WeakKeyDictionary
+import numpy as np
 import xarray
-from .filterload import getSystemT
+from .filterload import cachedSystemT
+from .calcemissions import EmissionOperator, loadreactions
 
 
 def opticalModel(sim, ver: xarray.DataArray, obsAlt_km: float, zenithang: float):
     """
-    ver: Nalt x Nwavelength
+    ver: ... x Nalt x Nwavelength, e.g. Nenergy x Nalt x Nwavelength for all beams at once
 
     """
     assert isinstance(ver, xarray.DataArray)
     # %% get system optical transmission T
-    optT = getSystemT(ver.wavelength_nm, sim.bg3fn, sim.windowfn, sim.qefn, obsAlt_km, zenithang)
+    optT = cachedSystemT(ver.wavelength_nm, sim.bg3fn, sim.windowfn, sim.qefn, obsAlt_km, zenithang)
     # %% first multiply VER by T, THEN sum overall wavelengths
+    VERgray = (ver * systemT(sim, optT)).sum("wavelength_nm")
+
+    return VERgray
+
+
+def opticalModelRates(sim, rates: xarray.DataArray, obsAlt_km: float, zenithang: float) -> xarray.DataArray:
+    """
+    same as opticalModel(sim, calcemissions(rates, sim)[0], ...) but straight from excitation rates,
+    never forming the ... x Nalt x Nwavelength VER.
+
+    rates: ... x Nalt x Nreaction excitation rates
+    """
+    w = grayweights(sim, obsAlt_km, zenithang)
+
+    return xarray.DataArray(
+        data=rates.loc[..., w.reaction.values].values @ w.values,
+        dims=rates.dims[:-1],
+        coords={k: (c.dims, c.values) for k, c in rates.coords.items() if rates.dims[-1] not in c.dims},
+    )
+
+
+GRAYWEIGHTS_CACHE_SIZE = 128  # filter sets and geometries per operator
+_grayweights: "WeakKeyDictionary[EmissionOperator, Dict[tuple, xarray.DataArray]]" = WeakKeyDictionary()
+
+
+def grayweights(sim, obsAlt_km: float, zenithang: float) -> xarray.DataArray:
+    """
+    VERgray is linear in the excitation rates, so the whole emission and optical model collapses to
+    one weight per reaction:   VERgray = rates @ (M @ T)
+
+    built once per (reaction file, reacreq, filter set, observer geometry).
+    The cache holds no reference to the emission operator, so it goes when the operator does.
+    """
+    op = loadreactions(sim.reactionfn).operator(sim.reacreq)
+    cache = _grayweights.setdefault(op, {})
+
+    key = (sim.opticalfilter, str(sim.bg3fn), str(sim.windowfn), str(sim.qefn), obsAlt_km, zenithang)
+    if key not in cache:
+        if len(cache) >= GRAYWEIGHTS_CACHE_SIZE:
+            del cache[next(iter(cache))]  # oldest first
+        optT = cachedSystemT(op.wavelength_nm, sim.bg3fn, sim.windowfn, sim.qefn, obsAlt_km, zenithang)
+        cache[key] = xarray.DataArray(data=op.weights(systemT(sim, optT)), coords=[("reaction", op.reaction)])
+
+    return cache[key]
+
+
+def systemT(sim, optT: xarray.Dataset) -> np.ndarray:
+    """
+    system transmission for the sim.opticalfilter in use
+    """
     if sim.opticalfilter == "bg3":
-        VERgray = (ver * optT["sys"].values[None, :]).sum("wavelength_nm")
+        return optT["sys"].values
     elif sim.opticalfilter == "none":
-        VERgray = (ver * optT["sysNObg3"].values[None, :]).sum("wavelength_nm")
+        return optT["sysNObg3"].values
     else:
         logging.warning(f"unknown OpticalFilter type: {sim.opticalfilter}" "   falling back to using no filter at all")
-        VERgray = (ver * optT["sysNObg3"].values[None, :]).sum("wavelength_nm")
+        return optT["sysNObg3"].values
 
-    return VERgray
+
+def passband(sim, obsAlt_km: float, zenithang: float, tol: float) -> EmissionOperator:
+    """
+    emission operator of sim.reacreq keeping only lines with system transmission >= tol.
+
+    lines the optical filter blocks are then never computed:
+
+    op = passband(sim, obsAlt_km, zenithang, 1e-3)
+    ver = calcemissions(rates, sim, op=op)[0]
+    VERgray = opticalModel(sim, ver, obsAlt_km, zenithang)
+    """
+    op = loadreactions(sim.reactionfn).operator(sim.reacreq)
+
+    optT = cachedSystemT(op.wavelength_nm, sim.bg3fn, sim.windowfn, sim.qefn, obsAlt_km, zenithang)
+
+    return op.passband(systemT(sim, optT), tol)
@@ -12,7 +12,7 @@ from typing import List
 import numpy as np
 import os
 import gridaurora.ztanh as ga
-import gridaurora.opticalmod as gao
+import gridaurora.filterload as gaf
 
 if os.name == "nt":
     import pathvalidate
@@ -352,7 +352,7 @@ def comparejgr2013(altkm, zenang, bg3fn, windfn, qefn):
         reqLambda = f["/lambda"][:]
         Tjgr2013 = f["/T"][:]
 
-    optT = gao.getSystemT(reqLambda, bg3fn, windfn, qefn, altkm, zenang)
+    optT = gaf.getSystemT(reqLambda, bg3fn, windfn, qefn, altkm, zenang)
 
     ax = figure().gca()
     ax.semilogy(reqLambda, optT["sys"], "b", label="HST")
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+"""
+lazy reader for writeeigen() files.
+
+Coordinates are read up front, the eigenprofiles only when indexed:
+selecting one time, energy bin or wavelength reads (and decompresses) just the HDF5 chunks it touches.
+Tucker compressed VER (/ver/tucker) is rebuilt only for the selected elements.
+"""
+from pathlib import Path
+from typing import Dict, Tuple
+import numpy as np
+import h5py
+import xarray
+from xarray.backends import BackendArray, CachingFileManager
+from xarray.backends.locks import HDF5_LOCK
+from xarray.core import indexing
+
+from .tucker import Tucker, modeproduct
+
+
+class H5Array(BackendArray):
+    """
+    one HDF5 dataset, read on indexing through a shared file handle
+    """
+
+    def __init__(self, manager: CachingFileManager, path: str, shape: Tuple[int, ...], dtype: np.dtype):
+        self.manager = manager
+        self.path = path
+        self.shape = shape
+        self.dtype = dtype
+
+    def __getitem__(self, key: indexing.ExplicitIndexer) -> np.ndarray:
+        return indexing.explicit_indexing_adapter(key, self.shape, indexing.IndexingSupport.OUTER_1VECTOR, self._getitem)
+
+    def _getitem(self, key: tuple) -> np.ndarray:
+        # %% h5py takes one strictly increasing index list
+        take = None
+        key = list(key)
+        for i, k in enumerate(key):
+            if isinstance(k, np.ndarray):
+                key[i], inv = np.unique(k, return_inverse=True)
+                take = (i, inv)
+
+        with HDF5_LOCK, self.manager.acquire_context() as f:
+            data = f[self.path][tuple(key)]
+
+        if take is not None:
+            i, inv = take
+            data = np.take(data, inv, axis=i - sum(isinstance(k, (int, np.integer)) for k in key[:i]))
+
+        return data
+
+
+class TuckerArray(BackendArray):
+    """
+    Tucker compressed cube, only the requested elements are rebuilt from the core and factors
+    """
+
+    def __init__(self, T: Tucker):
+        self.T = T
+        self.shape = T.shape
+        self.dtype = T.core.dtype
+
+    def __getitem__(self, key: indexing.ExplicitIndexer) -> np.ndarray:
+        return indexing.explicit_indexing_adapter(key, self.shape, indexing.IndexingSupport.OUTER, self._getitem)
+
+    def _getitem(self, key: tuple) -> np.ndarray:
+        factors = [U[np.atleast_1d(k) if isinstance(k, (int, np.integer)) else k] for U, k in zip(self.T.factors, key)]
+        data = modeproduct(self.T.core, factors)
+
+        return data[tuple(0 if isinstance(k, (int, np.integer)) else slice(None) for k in key)]
+
+
+def readeigen(fn: Path) -> xarray.Dataset:
+    """
+    fn: HDF5 file from writeeigen()
+
+    returns Dataset of the lazily read ver, prates, lrates, tezs and diffnumflux in the file, named as writeeigen() takes them,
+    with coordinates time (and ut1_unix), energy_ev (and the Ebins it came from), alt_km, wavelength_nm and reaction.
+    Close the Dataset, or use it as a context manager, to close the file.
+    """
+    fn = Path(fn).expanduser()
+    manager = CachingFileManager(h5py.File, fn, mode="r")
+
+    with HDF5_LOCK, manager.acquire_context() as f:
+        coords, attrs = _coords(f)
+        variables: Dict[str, xarray.Variable] = {}
+
+        def lazy(path: str, dims: Tuple[str, ...]) -> xarray.Variable:
+            d = f[path]
+            data = indexing.LazilyIndexedArray(H5Array(manager, path, d.shape, d.dtype))
+            return xarray.Variable(dims, data, attrs={k: _str(v) for k, v in d.attrs.items()})
+
+        if "/ver/eigenprofile" in f:
+            variables["ver"] = lazy("/ver/eigenprofile", ("time", "energy_ev", "alt_km", "wavelength_nm"))
+        elif "/ver/tucker" in f:
+            T = Tucker.from_h5(f)
+            attrs["ver_relerr"] = T.relerr
+            variables["ver"] = xarray.Variable(
+                ("time", "energy_ev", "alt_km", "wavelength_nm"),
+                indexing.LazilyIndexedArray(TuckerArray(T)),
+                attrs={k: _str(v) for k, v in f["/ver/tucker"].attrs.items() if k in ("unit", "size")},
+            )
+
+        if "/prod/eigenprofile" in f:
+            dims: Tuple[str, ...] = ("time", "energy_ev", "alt_km")
+            if f["/prod/eigenprofile"].ndim == 4:
+                dims += ("reaction",)
+            variables["prates"] = lazy("/prod/eigenprofile", dims)
+
+        if "/loss/eigenprofiles" in f:
+            dims = ("time", "energy_ev", "alt_km", "loss_reaction" if "loss_reaction" in coords else "reaction")
+            variables["lrates"] = lazy("/loss/eigenprofiles", dims)
+
+        if "/energydeposition" in f:
+            variables["tezs"] = lazy("/energydeposition", ("time", "alt_km", "energy_ev"))
+
+        if "/diffnumflux" in f:
+            n = f["/diffnumflux"].ndim
+            variables["diffnumflux"] = lazy("/diffnumflux", tuple(f"diffnumflux_dim{i}" for i in range(n)))
+
+    # %% energy coordinate from the eigenprofile sizes, not the bin edges
+    for v in variables.values():
+        if "energy_ev" in v.dims:
+            Nenergy = v.shape[v.dims.index("energy_ev")]
+            coords["energy_ev"] = ("energy_ev", _energycenters(coords["Ebins"][1], Nenergy))
+            break
+
+    ds = xarray.Dataset(variables, coords=coords, attrs=attrs)
+    ds.set_close(manager.close)
+
+    return ds
+
+
+def _coords(f: h5py.File) -> Tuple[dict, dict]:
+    coords: dict = {}
+    attrs: dict = {}
+
+    if "/ut1_unix" in f:
+        ut1 = np.atleast_1d(f["/ut1_unix"][()])
+        coords["time"] = ("time", np.datetime64("1970-01-01", "ns") + (ut1 * 1e9).round().astype("timedelta64[ns]"))
+        coords["ut1_unix"] = ("time", ut1)
+
+    Ebins = f["/Ebins"][()]
+    coords["Ebins"] = (("energy_edge",) + ("bin",) * (Ebins.ndim - 1), Ebins)
+    coords["alt_km"] = ("alt_km", f["/altitude"][()])
+
+    if "/ver/wavelength" in f:
+        coords["wavelength_nm"] = ("wavelength_nm", f["/ver/wavelength"][()])
+    elif "/ver/tucker/coords/wavelength_nm" in f:
+        coords["wavelength_nm"] = ("wavelength_nm", f["/ver/tucker/coords/wavelength_nm"][()])
+
+    if "/prod/reaction" in f:
+        coords["reaction"] = ("reaction", _str(f["/prod/reaction"][()]))
+    if "/loss/reaction" in f:
+        loss = _str(f["/loss/reaction"][()])
+        if "reaction" not in coords:
+            coords["reaction"] = ("reaction", loss)
+        elif not np.array_equal(coords["reaction"][1], loss):
+            coords["loss_reaction"] = ("loss_reaction", loss)
+
+    if "/sensorloc" in f and f["/sensorloc"].shape:
+        attrs["sensorloc"] = f["/sensorloc"][()]
+
+    return coords, attrs
+
+
+def _energycenters(Ebins: np.ndarray, N: int) -> np.ndarray:
+    """
+    writeeigen /Ebins is either the bin edges (EKpcolor) or makebin() low, high, flux columns
+    """
+    if Ebins.ndim == 2:
+        return Ebins[:N, :2].mean(axis=1)
+
+    return Ebins[:N]
+
+
+def _str(v):
+    if isinstance(v, bytes):
+        return v.decode("utf8")
+    if isinstance(v, np.ndarray) and v.dtype.kind in "OS":
+        return np.array([x.decode("utf8") if isinstance(x, bytes) else x for x in v.ravel()]).reshape(v.shape)
+
+    return v
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+"""
+truncated higher order SVD (Tucker) compression of eigenprofile cubes,
+e.g. the Ntime x NEnergy x Nalt x Nwavelength VER of writeeigen().
+
+Eigenprofiles are smooth and strongly correlated across time, energy, altitude and wavelength,
+so a small core and one orthonormal factor per dimension hold them to a chosen relative error.
+forward.TuckerForward works on the core and factors without rebuilding the cube.
+"""
+from pathlib import Path
+from typing import List, Sequence, Tuple, Union
+import numpy as np
+import h5py
+import xarray
+
+TUCKER_DIMS = ("time", "energy_ev", "alt_km", "wavelength_nm")  # writeeigen /ver/eigenprofile
+
+
+def hosvd(X: np.ndarray, tol: float = 1e-3, ranks: Sequence[int] = None) -> Tuple[np.ndarray, List[np.ndarray], float]:
+    """
+    sequentially truncated HOSVD
+
+    X: N-D array
+    tol: relative error bound ||X - Xhat|| / ||X||. Each dimension may discard tol^2/ndim of the energy.
+    ranks: maximum rank per dimension
+
+    returns core, factors (N_i x r_i, orthonormal columns), relative error
+    """
+    X = np.asarray(X, dtype=float)
+    if ranks is None:
+        ranks = X.shape
+    if len(ranks) != X.ndim:
+        raise ValueError(f"{len(ranks)} ranks for a {X.ndim}-D array")
+
+    total = np.sum(X ** 2)
+    budget = tol ** 2 * total / X.ndim
+
+    core = X
+    factors = []
+    for k in range(X.ndim):
+        Xk = np.moveaxis(core, k, 0).reshape(core.shape[k], -1)
+        w, V = np.linalg.eigh(Xk @ Xk.T)  # ascending
+        w = np.clip(w, 0, None)
+        discard = np.cumsum(w)  # energy left out when keeping the largest N-1, N-2, ... vectors
+        r = core.shape[k] - np.count_nonzero(discard <= budget)
+        r = min(max(r, 1), ranks[k])
+
+        U = V[:, ::-1][:, :r]
+        factors.append(U)
+        core = np.moveaxis(np.tensordot(U.T, np.moveaxis(core, k, 0), axes=1), 0, k)
+    # %% orthogonal projection, so the error is what the core did not keep
+    relerr = np.sqrt(max(total - np.sum(core ** 2), 0) / total) if total > 0 else 0.0
+
+    return core, factors, relerr
+
+
+def modeproduct(core: np.ndarray, factors: Sequence[np.ndarray], skip: int = 0) -> np.ndarray:
+    """
+    core x_1 U_1 x_2 U_2 ..., leaving the first skip axes of core alone
+    """
+    for k, U in enumerate(factors, start=skip):
+        core = np.moveaxis(np.tensordot(U, np.moveaxis(core, k, 0), axes=1), 0, k)
+
+    return core
+
+
+class Tucker:
+    """
+    core: r_1 x r_2 x ... core tensor
+    factors: N_i x r_i factor per dimension
+    dims, coords: names and coordinates of the full cube
+    relerr: ||X - reconstruct()|| / ||X||, reported by hosvd()
+    """
+
+    def __init__(
+        self, core: np.ndarray, factors: Sequence[np.ndarray], dims: Sequence[str], coords: dict = None, relerr: float = np.nan
+    ):
+        if len(factors) != core.ndim or len(dims) != core.ndim:
+            raise ValueError("need one factor and dimension name per core dimension")
+
+        self.core = core
+        self.factors = list(factors)
+        self.dims = tuple(dims)
+        self.coords = coords if coords is not None else {}
+        self.relerr = relerr
+
+    @classmethod
+    def fromarray(cls, X: Union[xarray.DataArray, np.ndarray], tol: float = 1e-3, ranks: Sequence[int] = None) -> "Tucker":
+        """
+        X: eigenprofile cube. An ndarray is taken to be Ntime x NEnergy x Nalt x Nwavelength like writeeigen().
+        """
+        if isinstance(X, xarray.DataArray):
+            dims = X.dims
+            coords = {d: X[d].values for d in dims if d in X.coords}
+            X = X.values
+        else:
+            dims = TUCKER_DIMS[: np.ndim(X)]
+            coords = {}
+
+        core, factors, relerr = hosvd(X, tol, ranks)
+
+        return cls(core, factors, dims, coords, relerr)
+
+    @classmethod
+    def from_h5(cls, fn: Union[Path, h5py.File], group: str = "/ver/tucker") -> "Tucker":
+        if not isinstance(fn, h5py.File):
+            with h5py.File(Path(fn).expanduser(), "r") as f:
+                return cls.from_h5(f, group)
+
+        g = fn[group]
+        dims = [d.decode("utf8") if isinstance(d, bytes) else d for d in g.attrs["dims"]]
+        factors = [g[f"factor{k}"][:] for k in range(len(dims))]
+        coords = {d: g[f"coords/{d}"][:] for d in dims if f"coords/{d}" in g}
+
+        return cls(g["core"][:], factors, dims, coords, float(g.attrs["relerr"]))
+
+    def to_h5(self, fn: Union[Path, h5py.File], group: str = "/ver/tucker"):
+        """
+        write to group, replacing any Tucker cube already there
+        """
+        if not isinstance(fn, h5py.File):
+            with h5py.File(Path(fn).expanduser(), "a") as f:
+                return self.to_h5(f, group)
+
+        if group in fn:
+            del fn[group]
+        g = fn.create_group(group)
+        g.attrs["dims"] = [d.encode("utf8") for d in self.dims]
+        g.attrs["relerr"] = self.relerr
+        g.attrs["description"] = "Tucker (truncated HOSVD) compression, cube = core x_1 factor0 x_2 factor1 ..."
+        g.create_dataset("core", data=self.core)
+        for k, U in enumerate(self.factors):
+            g.create_dataset(f"factor{k}", data=U)
+        for d, c in self.coords.items():
+            if np.asarray(c).dtype.kind in "biuf":
+                g.create_dataset(f"coords/{d}", data=c)
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return tuple(U.shape[0] for U in self.factors)
+
+    @property
+    def ranks(self) -> Tuple[int, ...]:
+        return self.core.shape
+
+    @property
+    def nbytes(self) -> int:
+        return self.core.nbytes + sum(U.nbytes for U in self.factors)
+
+    @property
+    def ratio(self) -> float:
+        """
+        compression ratio versus the float64 cube
+        """
+        return float(8 * np.prod(self.shape) / self.nbytes)
+
+    def reconstruct(self) -> xarray.DataArray:
+        return xarray.DataArray(
+            modeproduct(self.core, self.factors), coords={d: c for d, c in self.coords.items() if d in self.dims}, dims=self.dims
+        )
@@ -1,16 +1,50 @@
+import logging
 import h5py
+import numpy as np
 from pathlib import Path
+from typing import Sequence, Tuple
 from xarray import DataArray
 from . import to_ut1unix
+from .tucker import Tucker
+
+try:
+    import hdf5plugin
+except ImportError:
+    hdf5plugin = None
 
 """
 FIXME: refactor to xarray and .to_netcdf()
 """
+EIGEN_CHUNK_BYTES = 256_000  # within the default 1 MB HDF5 chunk cache
+COMPRESSORS = ("gzip", "lzf", "lz4", None)
 
 
 def writeeigen(
-    fn: Path, Ebins, t, z, diffnumflux=None, ver=None, prates=None, lrates=None, tezs=None, latlon=None,
+    fn: Path,
+    Ebins,
+    t,
+    z,
+    diffnumflux=None,
+    ver=None,
+    prates=None,
+    lrates=None,
+    tezs=None,
+    latlon=None,
+    tol: float = None,
+    append: bool = False,
+    compression: str = "gzip",
+    dtype=None,
+    scaleoffset: int = None,
 ):
+    """
+    tol: store VER as a Tucker basis (/ver/tucker, see tucker.Tucker) to this relative error,
+         instead of the full /ver/eigenprofile
+    append: add these times to an existing file, so a long run can write one time step at a time.
+            The time dimension is unlimited and each time step is whole chunks, see eigenchunks().
+    compression: "gzip", "lzf" (fast, in h5py), "lz4" (Blosc, needs hdf5plugin) or None, all with byte shuffle
+    dtype: storage type of the eigenprofiles, e.g. numpy.float32
+    scaleoffset: keep this many decimal digits with the HDF5 scale-offset filter (lossy, float32 is usually enough)
+    """
     if not fn:
         return
 
@@ -19,56 +53,169 @@ def writeeigen(
     if fn.suffix != ".h5":
         return
 
+    if tol is not None and append:
+        raise ValueError("Tucker compressed VER cannot be appended to")
+
     print("writing to", fn)
 
-    ut1_unix = to_ut1unix(t)
+    ut1_unix = np.atleast_1d(to_ut1unix(t))
+    filters = h5filters(compression, scaleoffset)
 
-    with h5py.File(fn, "w") as f:
+    with h5py.File(fn, "a" if append else "w") as f:
         bdt = h5py.special_dtype(vlen=bytes)
-        d = f.create_dataset("/sensorloc", data=latlon)
-        d.attrs["unit"] = "degrees"
-        d.attrs["description"] = "geographic coordinates"
-        # %% input precipitation flux
-        d = f.create_dataset("/Ebins", data=Ebins)
-        d.attrs["unit"] = "eV"
-        d.attrs["description"] = "Energy bin edges"
-        d = f.create_dataset("/altitude", data=z)
-        d.attrs["unit"] = "km"
-
-        d = f.create_dataset("/ut1_unix", data=ut1_unix)
-        d.attrs["unit"] = "sec. since Jan 1, 1970 midnight"  # float
+        if "/Ebins" in f:
+            if f["/altitude"].shape != np.shape(z) or not np.allclose(f["/altitude"][:], z):
+                raise ValueError(f"altitude grid does not match {fn}")
+            if f["/Ebins"].shape != np.shape(Ebins) or not np.allclose(f["/Ebins"][:], Ebins):
+                raise ValueError(f"energy bins do not match {fn}")
+        else:
+            d = f.create_dataset("/sensorloc", data=latlon)
+            d.attrs["unit"] = "degrees"
+            d.attrs["description"] = "geographic coordinates"
+            # %% input precipitation flux
+            d = f.create_dataset("/Ebins", data=Ebins)
+            d.attrs["unit"] = "eV"
+            d.attrs["description"] = "Energy bin edges"
+            d = f.create_dataset("/altitude", data=z)
+            d.attrs["unit"] = "km"
 
-        if diffnumflux is not None:
-            d = f.create_dataset("/diffnumflux", data=diffnumflux)
-            d.attrs["unit"] = "cm^-2 s^-1 eV^-1"
-            d.attrs["description"] = 'primary electron flux at "top" of modeled ionosphere'
+            if diffnumflux is not None:
+                d = f.create_dataset("/diffnumflux", data=diffnumflux)
+                d.attrs["unit"] = "cm^-2 s^-1 eV^-1"
+                d.attrs["description"] = 'primary electron flux at "top" of modeled ionosphere'
+
+        # %% check every time series before extending any of them, so a mismatch leaves the file readable
+        series = {
+            "/ut1_unix": ut1_unix,
+            "/ver/eigenprofile": ver if tol is None else None,
+            "/prod/eigenprofile": prates,
+            "/loss/eigenprofiles": lrates,
+            "/energydeposition": tezs,
+        }
+        if "/ut1_unix" in f:
+            for path, data in series.items():
+                data = data if isinstance(data, (DataArray, np.ndarray)) else None
+                if (data is None) != (path not in f):
+                    raise ValueError(f"{fn} {'has' if path in f else 'lacks'} {path}, append the same variables")
+                if data is not None:
+                    _checkappend(f[path], data.shape)
+
+        d = _append(f, "/ut1_unix", ut1_unix, (1024,), {})
+        d.attrs["unit"] = "sec. since Jan 1, 1970 midnight"  # float
         # %% VER
         if isinstance(ver, DataArray):
-            d = f.create_dataset("/ver/eigenprofile", data=ver.values, compression="gzip")
+            if tol is None:
+                d = _append(f, "/ver/eigenprofile", ver.values, eigenchunks(ver.shape, dtype, (2,)), filters, dtype)
+            else:
+                T = Tucker.fromarray(ver.values, tol)
+                T.coords = {
+                    "time": ut1_unix,
+                    "energy_ev": np.asarray(Ebins)[: ver.shape[1]],
+                    "alt_km": z,
+                    "wavelength_nm": ver.wavelength_nm,
+                }
+                T.to_h5(f)
+                d = f["/ver/tucker"]
+                logging.info(f"VER Tucker ranks {T.ranks}, {T.ratio:.1f}x smaller, relative error {T.relerr:.2e}")
             d.attrs["unit"] = "photons cm^-3 sr^-1 s^-1"
             d.attrs["size"] = "Ntime x NEnergy x Nalt x Nwavelength"
 
-            d = f.create_dataset("/ver/wavelength", data=ver.wavelength_nm)
-            d.attrs["unit"] = "Angstrom"
+            if "/ver/wavelength" not in f:
+                d = f.create_dataset("/ver/wavelength", data=ver.wavelength_nm)
+                d.attrs["unit"] = "Angstrom"
         # %% prod
         if isinstance(prates, DataArray):
-            d = f.create_dataset("/prod/eigenprofile", data=prates.values, compression="gzip")
+            d = _append(f, "/prod/eigenprofile", prates.values, eigenchunks(prates.shape, dtype, (2,)), filters, dtype)
             d.attrs["unit"] = "particle cm^-3 sr^-1 s^-1"
             if prates.ndim == 3:
                 d.attrs["size"] = "Ntime x NEnergy x Nalt"
             else:  # ndim==4
                 d.attrs["size"] = "Ntime x NEnergy x Nalt x Nreaction"
-                d = f.create_dataset("/prod/reaction", data=prates.reaction, dtype=bdt)
+                if "/prod/reaction" not in f:
+                    d = f.create_dataset("/prod/reaction", data=prates.reaction, dtype=bdt)
             d.attrs["description"] = "reaction species state"
         # %% loss
         if isinstance(lrates, DataArray):
-            d = f.create_dataset("/loss/eigenprofiles", data=lrates.values, compression="gzip")
+            d = _append(f, "/loss/eigenprofiles", lrates.values, eigenchunks(lrates.shape, dtype, (2,)), filters, dtype)
             d.attrs["unit"] = "particle cm^-3 sr^-1 s^-1"
             d.attrs["size"] = "Ntime x NEnergy x Nalt x Nreaction"
-            d = f.create_dataset("/loss/reaction", data=lrates.reaction, dtype=bdt)
+            if "/loss/reaction" not in f:
+                d = f.create_dataset("/loss/reaction", data=lrates.reaction, dtype=bdt)
             d.attrs["description"] = "reaction species state"
         # %% energy deposition
         if isinstance(tezs, DataArray):
-            d = f.create_dataset("/energydeposition", data=tezs.values, compression="gzip")
+            d = _append(f, "/energydeposition", tezs.values, eigenchunks(tezs.shape, dtype, (1,)), filters, dtype)
             d.attrs["unit"] = "ergs cm^-3 s^-1"
             d.attrs["size"] = "Ntime x Nalt x NEnergies"
+
+
+def eigenchunks(shape: Sequence[int], dtype=None, whole: Sequence[int] = (), nbytes: int = EIGEN_CHUNK_BYTES) -> Tuple[int, ...]:
+    """
+    HDF5 chunk shape of a Ntime x ... dataset: one time per chunk, so appending a time step writes whole chunks.
+    The axes in whole (altitude) are kept entire, and the others grow in turn up to nbytes,
+    so reading one energy or one wavelength touches a similarly small number of chunks.
+    """
+    itemsize = np.dtype(dtype if dtype is not None else float).itemsize
+    chunk = [1] + [s if i in whole else 1 for i, s in enumerate(shape) if i > 0]
+    free = [i for i in range(1, len(shape)) if i not in whole]
+
+    grown = True
+    while grown:
+        grown = False
+        for i in free:
+            c = min(2 * chunk[i], shape[i])
+            if c > chunk[i] and itemsize * np.prod(chunk) // chunk[i] * c <= nbytes:
+                chunk[i] = c
+                grown = True
+
+    return tuple(int(c) for c in chunk)
+
+
+def h5filters(compression: str = "gzip", scaleoffset: int = None) -> dict:
+    """
+    h5py create_dataset() keywords for a compressor from COMPRESSORS
+    """
+    if compression == "gzip":
+        filters = {"compression": "gzip", "compression_opts": 4, "shuffle": True}
+    elif compression == "lzf":
+        filters = {"compression": "lzf", "shuffle": True}
+    elif compression == "lz4":
+        if hdf5plugin is None:
+            raise ImportError("lz4 compression needs hdf5plugin:  pip install hdf5plugin")
+        filters = dict(hdf5plugin.Blosc(cname="lz4", clevel=5, shuffle=hdf5plugin.Blosc.SHUFFLE))
+    elif compression is None:
+        filters = {}
+    else:
+        raise ValueError(f"unknown compression {compression}, choose from {COMPRESSORS}")
+
+    if scaleoffset is not None:
+        filters["scaleoffset"] = scaleoffset
+
+    return filters
+
+
+def _append(f: h5py.File, path: str, data, chunks: Tuple[int, ...], filters: dict, dtype=None) -> h5py.Dataset:
+    """
+    create path with an unlimited first (time) dimension, or extend it by data
+    """
+    data = np.asarray(data, dtype=dtype)
+
+    if path not in f:
+        return f.create_dataset(path, data=data, maxshape=(None,) + data.shape[1:], chunks=chunks, **filters)
+
+    d = f[path]
+    _checkappend(d, data.shape)
+
+    n = d.shape[0]
+    d.resize(n + data.shape[0], axis=0)
+    d[n:] = data
+    logging.info(f"{path}: {n} + {data.shape[0]} times")
+
+    return d
+
+
+def _checkappend(d: h5py.Dataset, shape: Tuple[int, ...]):
+    if d.shape[1:] != shape[1:]:
+        raise ValueError(f"{d.name} is {d.shape[1:]} per time, new data are {shape[1:]}")
+    if d.maxshape[0] is not None:
+        raise ValueError(f"{d.name} was not written appendable")
@@ -0,0 +1,10 @@
+#!/usr/bin/env python
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def cachedir(monkeypatch, tmp_path_factory):
+    """
+    keep the on-disk caches (LOWTRAN, instrument library) out of the home directory
+    """
+    monkeypatch.setenv("GRIDAURORA_CACHE", str(tmp_path_factory.mktemp("cache")))
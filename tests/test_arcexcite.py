@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+from pathlib import Path
+from types import ModuleType, SimpleNamespace
+import sys
+import pytest
+from pytest import approx
+
+np = pytest.importorskip("numpy")
+xarray = pytest.importorskip("xarray")
+pytest.importorskip("h5py")
+
+R = Path(__file__).resolve().parents[1]
+reactfn = R / "gridaurora/precompute/vjeinfc.h5"
+
+REACTIONS = ["no1s", "no1d", "noii2p", "po3p3p", "po3p5p", "p1ng", "pmein", "p2pg", "p1pg"]
+ALLREAC = ["metastable", "atomic", "n21ng", "n2meinel", "n22pg", "n21pg"]
+PRODUCTS = ("filtered", "unfiltered", "lines", "cube")
+z = np.arange(90, 300, 5.0)
+Ek = np.logspace(2, 4, 8)
+
+calls: list = []
+
+
+def calcVERtc(excratesfn, transcarpath, E, tReq, sim):
+    """
+    stands in for transcarread.calcVERtc: excitation rates that depend on the beam energy
+    """
+    calls.append(E)
+    if E == sim.fail:
+        raise RuntimeError(f"interrupted at beam {E}")
+
+    rng = np.random.default_rng(int(E))
+    zpk = 200 - 30 * np.log10(E / 100)
+    rates = np.exp(-(((z[:, None] - zpk) / 20) ** 2)) * rng.random(len(REACTIONS)) * E
+    spec = xarray.DataArray(rates, coords=[("alt_km", z), ("reaction", REACTIONS)])
+
+    return spec, None, None
+
+
+def cachedSystemT(lamb, *args, **kwargs):
+    lamb = np.asarray(lamb)
+    T = np.exp(-(((lamb - 550) / 150) ** 2))
+    return xarray.Dataset({"sys": ("wavelength_nm", T), "sysNObg3": ("wavelength_nm", np.sqrt(T))}, coords={"wavelength_nm": lamb})
+
+
+@pytest.fixture
+def gae(monkeypatch):
+    monkeypatch.setitem(sys.modules, "transcarread", ModuleType("transcarread"))
+    sys.modules["transcarread"].calcVERtc = calcVERtc  # type: ignore
+
+    import gridaurora.arcexcite as gae
+    import gridaurora.opticalmod as gom
+
+    monkeypatch.setattr(gae, "calcVERtc", calcVERtc)
+    monkeypatch.setattr(gom, "cachedSystemT", cachedSystemT)
+    calls.clear()
+
+    return gae
+
+
+@pytest.fixture
+def sim(tmp_path):
+    csv = tmp_path / "BT_E1E2prev.csv"
+    np.savetxt(csv, np.column_stack((Ek, np.append(Ek[1:], 2e4))), delimiter=",")
+
+    return SimpleNamespace(
+        loadver=False,
+        transcarev=csv,
+        transcarutc=None,
+        minbeamev=0,
+        reactionfn=reactfn,
+        reacreq=ALLREAC,
+        excratesfn=None,
+        transcarpath=None,
+        opticalfilter="bg3",
+        bg3fn="bg3",
+        windowfn="window",
+        qefn="qe",
+        fail=None,
+    )
+
+
+def test_products(gae, sim):
+    gac = pytest.importorskip("gridaurora.calcemissions")
+    gom = pytest.importorskip("gridaurora.opticalmod")
+
+    Peigen, EKpcolor, Peigenunfilt, br, Plambda = gae.getTranscar(sim, 0.0, 12.5, products=PRODUCTS)
+    assert EKpcolor == approx(np.append(Ek, 2e4))
+    assert Plambda.dims == ("alt_km", "wavelength_nm", "energy_ev")
+
+    for i, E in enumerate(Ek):
+        ver, v, b = gac.calcemissions(calcVERtc(None, None, E, None, sim)[0], sim)
+        assert Plambda[..., i].values == approx(v)
+        assert br[:, i].values == approx(b)
+        assert Peigenunfilt[:, i].values == approx(v.sum(axis=1))
+        assert Peigen[:, i].values == approx(gom.opticalModel(sim, ver, 0.0, 12.5).values)
+    # %% same tuple for any products, None where not requested
+    Peigen, _, Peigenunfilt, br, Plambda = gae.getTranscar(sim, 0.0, 12.5, products=("lines",))
+    assert Peigen is None and Peigenunfilt is None and Plambda is None
+    assert br.dims == ("wavelength_nm", "energy_ev")
+    assert len(gae.getTranscar(sim, 0.0, 12.5)) == 5
+
+
+@pytest.mark.parametrize("pool", ["thread", "process"])
+def test_parallel(gae, sim, pool):
+    ref = gae.getTranscar(sim, 0.0, 12.5, products=PRODUCTS)
+    out = gae.getTranscar(sim, 0.0, 12.5, workers=3, pool=pool, products=PRODUCTS)
+
+    for r, o in zip(ref, out):
+        assert np.asarray(o) == approx(np.asarray(r))
+
+    # %% beams are read a bounded number ahead of the consumer
+    beams = gae.readbeams(sim, Ek, None, workers=2, pool="thread")
+    calls.clear()
+    next(beams)
+    assert len(calls) <= gae.READAHEAD * 2
+    assert len(list(beams)) == Ek.size - 1
+
+
+def test_resume(gae, sim, tmp_path):
+    ref = gae.getTranscar(sim, 0.0, 12.5, products=PRODUCTS)
+    h5fn = tmp_path / "checkpoint.h5"
+    # %% interrupted run, then resume
+    sim.fail = Ek[5]
+    with pytest.raises(RuntimeError):
+        gae.getTranscar(sim, 0.0, 12.5, h5fn=h5fn)
+
+    sim.fail = None
+    calls.clear()
+    Peigen, _, Peigenunfilt, _, _ = gae.getTranscar(sim, 0.0, 12.5, h5fn=h5fn)
+    assert calls == list(Ek[5:])
+    assert Peigen.values == approx(ref[0].values)
+    assert Peigenunfilt.values == approx(ref[2].values)
+    # %% a product new to the checkpoint is computed for every beam, even across an interruption
+    sim.fail = Ek[3]
+    with pytest.raises(RuntimeError):
+        gae.getTranscar(sim, 0.0, 12.5, h5fn=h5fn, products=("filtered", "unfiltered", "lines"))
+
+    sim.fail = None
+    calls.clear()
+    Peigen, _, _, br, _ = gae.getTranscar(sim, 0.0, 12.5, h5fn=h5fn, products=("filtered", "unfiltered", "lines"))
+    assert calls == list(Ek[3:])
+    assert br.values == approx(ref[3].values)
+    assert (br != 0).all()
+    assert Peigen.values == approx(ref[0].values)
+
+
+def test_resume_config(gae, sim, tmp_path):
+    h5fn = tmp_path / "checkpoint.h5"
+    sim.fail = Ek[3]
+    with pytest.raises(RuntimeError):
+        gae.getTranscar(sim, 0.0, 12.5, h5fn=h5fn)
+    # %% other geometry, filter or reactions than the checkpoint
+    sim.fail = None
+    with pytest.raises(ValueError):
+        gae.getTranscar(sim, 0.0, 30.0, h5fn=h5fn)
+    with pytest.raises(ValueError):
+        gae.getTranscar(sim, 0.5, 12.5, h5fn=h5fn)
+
+    sim.opticalfilter = "none"
+    with pytest.raises(ValueError):
+        gae.getTranscar(sim, 0.0, 12.5, h5fn=h5fn)
+
+    sim.opticalfilter = "bg3"
+    sim.reacreq = ALLREAC[:2]
+    with pytest.raises(ValueError):
+        gae.getTranscar(sim, 0.0, 12.5, h5fn=h5fn)
+    # %% same configuration resumes
+    sim.reacreq = ALLREAC
+    calls.clear()
+    gae.getTranscar(sim, 0.0, 12.5, h5fn=h5fn)
+    assert calls == list(Ek[3:])
+
+
+if __name__ == "__main__":
+    pytest.main(["-x", __file__])
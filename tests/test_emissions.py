@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+from pathlib import Path
+from types import SimpleNamespace
+import numpy as np
+import xarray
+import pytest
+from pytest import approx
+import gridaurora.calcemissions as gac
+
+R = Path(__file__).resolve().parents[1]
+dpath = R / "gridaurora/precompute"
+reactfn = dpath / "vjeinfc.h5"
+
+REACTIONS = ["no1s", "no1d", "noii2p", "po3p3p", "po3p5p", "p1ng", "pmein", "p2pg", "p1pg"]
+ALLREAC = ["metastable", "atomic", "n21ng", "n2meinel", "n22pg", "n21pg"]
+
+
+def excitation(z: np.ndarray) -> xarray.DataArray:
+    rng = np.random.default_rng(0)
+    return xarray.DataArray(
+        data=rng.random((z.size, len(REACTIONS))) * 1e3, coords=[("alt_km", z), ("reaction", REACTIONS)],
+    )
+
+
+def test_reactiontable():
+    table = gac.loadreactions(reactfn)
+    assert gac.loadreactions(reactfn) is table
+    assert gac.loadreactions(table) is table
+
+    for fam in ALLREAC:
+        assert table.scalevec[fam].size == table.lamb[fam].size
+
+    assert table.fc["n2meinel"].sum() == approx(1.0)
+    assert table.tau["n21ng"] == approx(1 / np.nansum(table.A["n21ng"], axis=1))
+
+
+def test_calcemissions():
+    z = np.arange(90, 300, 5.0)
+    sim = SimpleNamespace(reacreq=ALLREAC, reactionfn=reactfn)
+
+    ver, v, br = gac.calcemissions(excitation(z), sim)
+
+    lamb = ver.wavelength_nm.values
+    assert np.isfinite(lamb).all()
+    assert (np.diff(lamb) >= 0).all()
+    assert ver.shape == (z.size, lamb.size)
+    assert br.shape == (lamb.size,)
+    assert np.isfinite(v).all()
+    assert br == approx(np.trapz(v, z, axis=0))
+
+
+def test_operator():
+    """
+    emission operator matches the band by band concatenation
+    """
+    z = np.arange(90, 300, 5.0)
+    rates = excitation(z)
+    sim = SimpleNamespace(reacreq=ALLREAC, reactionfn=reactfn)
+
+    ver, lamb, br = None, None, None
+    for f in (gac.getMetastable, gac.getAtomic, gac.getN21NG, gac.getN2meinel, gac.getN22PG, gac.getN21PG):
+        ver, lamb, br = f(rates, ver, lamb, br, reactfn)
+    lamb, ver, br = gac.sortelimlambda(lamb, ver, br)
+
+    op = gac.loadreactions(reactfn).operator(ALLREAC)
+    assert gac.loadreactions(reactfn).operator(ALLREAC) is op
+    assert op.M.shape == (len(REACTIONS), lamb.size)
+
+    tver, v, tbr = gac.calcemissions(rates, sim)
+    assert tver.wavelength_nm.values == approx(lamb)
+    assert v == approx(ver, rel=1e-12)
+    assert tbr == approx(br, rel=1e-12)
+
+    with pytest.raises(ValueError):
+        gac.loadreactions(reactfn).operator(["bogus"])
+
+
+def test_batched():
+    """
+    time x energy x altitude x reaction in one call
+    """
+    z = np.arange(90, 300, 5.0)
+    rates2 = excitation(z)
+    sim = SimpleNamespace(reacreq=ALLREAC, reactionfn=reactfn)
+
+    scale = xarray.DataArray(np.arange(1.0, 7.0).reshape(2, 3), coords=[("time", [0, 1]), ("energy_ev", [100.0, 1e3, 1e4])])
+    rates = (scale * rates2).transpose("time", "energy_ev", "alt_km", "reaction")
+
+    ver, v, br = gac.calcemissions(rates, sim)
+    ver2, v2, br2 = gac.calcemissions(rates2, sim)
+
+    assert ver.dims == ("time", "energy_ev", "alt_km", "wavelength_nm")
+    assert ver.energy_ev.values == approx([100.0, 1e3, 1e4])
+    assert br.shape == (2, 3, v2.shape[-1])
+    assert ver.isel(time=1, energy_ev=2).values == approx(6 * v2)
+    assert br[0, 1] == approx(2 * br2)
+
+
+def test_outbuffer():
+    z = np.arange(90, 300, 5.0)
+    rates = excitation(z)
+    table = gac.loadreactions(reactfn)
+    bands = (gac.getMetastable, gac.getAtomic, gac.getN21NG, gac.getN2meinel, gac.getN22PG, gac.getN21PG)
+
+    out = np.empty((z.size, table.nlines(ALLREAC)))
+    ver, lamb, br = None, None, None
+    ver0, lamb0, br0 = None, None, None
+    for f in bands:
+        ver, lamb, br = f(rates, ver, lamb, br, table, out=out)
+        ver0, lamb0, br0 = f(rates, ver0, lamb0, br0, table)
+
+    assert np.shares_memory(ver, out)
+    assert ver.shape == out.shape
+    assert ver == approx(ver0, nan_ok=True)
+    assert lamb == approx(lamb0, nan_ok=True)
+    assert br == approx(br0, nan_ok=True)
+
+    with pytest.raises(ValueError):
+        gac.getAtomic(rates, ver, lamb, br, table, out=out)
+    # %% single product into caller buffer
+    sim = SimpleNamespace(reacreq=ALLREAC, reactionfn=reactfn)
+    out = np.empty((z.size, table.operator(ALLREAC).M.shape[1]))
+    tver, v, tbr = gac.calcemissions(rates, sim, out=out)
+    assert v is out
+
+
+def test_wavelength_index():
+    table = gac.loadreactions(reactfn)
+
+    lamb, fam, line = table.lines(421, 430)
+    assert lamb == approx([423.65, 426.8, 427.81])
+    assert list(fam) == ["n21ng", "n22pg", "n21ng"]
+    assert table.lamb["n21ng"][line[0]] == approx(423.65)
+
+    op = table.operator(ALLREAC)
+    sub = op.between(421, 430)
+    assert sub.wavelength_nm == approx(lamb)
+    assert np.shares_memory(sub.wavelength_nm, op.wavelength_nm)
+    assert set(sub.reaction) == {"p1ng", "p2pg"}
+
+
+def test_passband():
+    gao = pytest.importorskip("gridaurora.opticalmod")
+
+    z = np.arange(90, 300, 5.0)
+    rates = excitation(z)
+    sim = SimpleNamespace(
+        reacreq=ALLREAC,
+        reactionfn=reactfn,
+        opticalfilter="bg3",
+        bg3fn=dpath / "BG3transmittance.h5",
+        windowfn=dpath / "ixonWindowT.h5",
+        qefn=dpath / "emccdQE.h5",
+    )
+
+    full = gac.loadreactions(reactfn).operator(ALLREAC)
+    op = gao.passband(sim, 0, 0, 1e-3)
+    assert 0 < op.wavelength_nm.size < full.wavelength_nm.size
+
+    ver = gac.calcemissions(rates, sim)[0]
+    sver = gac.calcemissions(rates, sim, op=op)[0]
+    assert sver.shape == (z.size, op.wavelength_nm.size)
+
+    gray = gao.opticalModel(sim, ver, 0, 0)
+    sgray = gao.opticalModel(sim, sver, 0, 0)
+    assert sgray.values == approx(gray.values, rel=1e-2)
+
+
+def test_grayweights():
+    """
+    fused rates -> gray VER
+    """
+    gao = pytest.importorskip("gridaurora.opticalmod")
+
+    z = np.arange(90, 300, 5.0)
+    rates = excitation(z)
+    sim = SimpleNamespace(
+        reacreq=ALLREAC,
+        reactionfn=reactfn,
+        opticalfilter="bg3",
+        bg3fn=dpath / "BG3transmittance.h5",
+        windowfn=dpath / "ixonWindowT.h5",
+        qefn=dpath / "emccdQE.h5",
+    )
+
+    ver = gac.calcemissions(rates, sim)[0]
+    gray = gao.opticalModel(sim, ver, 0, 0)
+
+    w = gao.grayweights(sim, 0, 0)
+    assert gao.grayweights(sim, 0, 0) is w
+    assert gao.grayweights(sim, 0, 30) is not w
+    assert gao.opticalModelRates(sim, rates, 0, 0).values == approx(gray.values, rel=1e-10)
+
+    op = gac.loadreactions(reactfn).operator(ALLREAC)
+    assert op in gao._grayweights
+    assert rates.loc[..., op.reaction].values @ op.weights() == approx(ver.sum("wavelength_nm").values, rel=1e-10)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -30,5 +30,228 @@ def test_opticalfilter():
         assert ((0 <= T[f]) & (T[f] <= 1)).all()
 
 
+def test_systemt_geometries():
+    gaf = pytest.importorskip("gridaurora.filterload")
+
+    bg3fn = dpath / "BG3transmittance.h5"
+    windfn = dpath / "ixonWindowT.h5"
+    qefn = dpath / "emccdQE.h5"
+    testlambda = [427.8, 555.7, 630.0, 777.4]
+
+    T = gaf.getSystemT(testlambda, bg3fn, windfn, qefn, [0, 0.5], [0, 30, 60])
+    assert T["sys"].dims == ("obsalt_km", "zenith_deg", "wavelength_nm")
+    assert T["filter"].dims == ("wavelength_nm",)
+
+    T1 = gaf.getSystemT(testlambda, bg3fn, windfn, qefn, 0.5, 30)
+    assert T["sys"].sel(obsalt_km=0.5, zenith_deg=30).values == approx(T1["sys"].values, nan_ok=True)
+
+    T = gaf.getSystemT(testlambda, bg3fn, windfn, qefn, 0, [0, 30])
+    assert T["atm"].dims == ("zenith_deg", "wavelength_nm")
+
+
+def test_systemts():
+    gaf = pytest.importorskip("gridaurora.filterload")
+
+    fns = [dpath / "BG3transmittance.h5", dpath / "HoyaV10transmittance.h5", dpath / "Wratten21transmittance.h5"]
+    windfn = dpath / "ixonWindowT.h5"
+    qefn = dpath / "emccdQE.h5"
+    testlambda = [427.8, 555.7, 630.0, 777.4]
+
+    T = gaf.getSystemTs(testlambda, fns, windfn, qefn, 0, [0, 30], products={"Rayleigh 1924": ["Hoya V-10", "Wratten 21"]})
+    assert list(T.filtername.values) == ["Schott BG3", "Hoya V-10", "Wratten 21", "Rayleigh 1924"]
+    assert T["sys"].dims == ("filtername", "zenith_deg", "wavelength_nm")
+    assert T["sysNObg3"].dims == ("zenith_deg", "wavelength_nm")
+
+    for fn in fns:
+        T1 = gaf.getSystemT(testlambda, fn, windfn, qefn, 0, [0, 30])
+        assert T["sys"].sel(filtername=T1.filename).values == approx(T1["sys"].values, nan_ok=True)
+
+    rayleigh = T["filter"].sel(filtername="Hoya V-10") * T["filter"].sel(filtername="Wratten 21")
+    assert T["filter"].sel(filtername="Rayleigh 1924").values == approx(rayleigh.values, nan_ok=True)
+
+    with pytest.raises(KeyError):
+        gaf.getSystemTs(testlambda, fns, windfn, qefn, 0, 0, products={"bad": ["Wratten 99"]})
+
+
+def test_systemts_unnamed(tmp_path):
+    gaf = pytest.importorskip("gridaurora.filterload")
+    np = pytest.importorskip("numpy")
+    h5py = pytest.importorskip("h5py")
+
+    fns = []
+    for stem, T in (("red", [0.1, 0.9]), ("green", [0.8, 0.2])):
+        fn = tmp_path / f"{stem}.h5"
+        with h5py.File(fn, "w") as f:
+            f["/wavelength"] = [400.0, 800.0]
+            f["/T"] = T
+        fns.append(fn)
+
+    windfn = dpath / "ixonWindowT.h5"
+    qefn = dpath / "emccdQE.h5"
+    T = gaf.getSystemTs([500.0, 600.0], fns, windfn, qefn, 0, 0, products={"both": ["red", "green"]})
+    assert list(T.filtername.values) == ["red", "green", "both"]
+    assert T["filter"].sel(filtername="both").values == approx(
+        (T["filter"].sel(filtername="red") * T["filter"].sel(filtername="green")).values
+    )
+    assert np.isfinite(T["filter"]).all()
+
+
+def test_analytic_atmosphere():
+    gaf = pytest.importorskip("gridaurora.filterload")
+    gae = pytest.importorskip("gridaurora.extinction")
+    np = pytest.importorskip("numpy")
+
+    assert gae.rayleigh(550.0) == approx(0.0973, rel=0.01)
+    assert gae.ozone(600.0) == approx(0.041, rel=0.02)
+    assert gae.airmass([0, 60, 90]) == approx([1.0, 1.9927, 37.92], rel=0.002)
+
+    lamb = np.arange(350.0, 900.0, 0.1)
+    T = gae.transmittance(lamb, np.array([0, 30, 60, 89])[:, None], [0, 3])
+    assert T.shape == (4, 2, lamb.size)
+    assert ((0 < T) & (T < 1)).all()
+    assert (np.diff(T[:, 0, lamb.size // 2]) < 0).all()  # lower in the sky, more extinction
+    assert (T[:, 1] > T[:, 0]).all()  # higher observer, less air
+    assert T[0, 0, lamb.searchsorted(427.8)] < T[0, 0, lamb.searchsorted(777.4)]  # bluer light is scattered more
+
+    bg3fn = dpath / "BG3transmittance.h5"
+    windfn = dpath / "ixonWindowT.h5"
+    qefn = dpath / "emccdQE.h5"
+    testlambda = [427.8, 555.7, 630.0, 777.4]
+
+    Ta = gaf.getSystemT(testlambda, bg3fn, windfn, qefn, [0, 3], [0, 30, 60], atmosphere="analytic")
+    assert Ta["atm"].dims == ("obsalt_km", "zenith_deg", "wavelength_nm")
+    assert Ta["atm"].sel(obsalt_km=3, zenith_deg=30).values == approx(gae.transmittance(testlambda, 30, 3))
+
+    Tn = gaf.getSystemT(testlambda, bg3fn, windfn, qefn, 0, 0, atmosphere="none")
+    assert (Tn["atm"] == 1).all()
+    assert (Ta["sys"].sel(obsalt_km=0, zenith_deg=0) < Tn["sys"]).all()
+
+    with pytest.raises(ValueError):
+        gaf.getSystemT(testlambda, bg3fn, windfn, qefn, 0, 0, atmosphere="modtran")
+
+
+def test_instrumentlib(monkeypatch, tmp_path):
+    gaf = pytest.importorskip("gridaurora.filterload")
+    np = pytest.importorskip("numpy")
+
+    monkeypatch.setenv("GRIDAURORA_CACHE", str(tmp_path))
+
+    assert gaf.instrumentlib() is None
+    assert not (tmp_path / "instruments.h5").exists()
+
+    lib = gaf.instrumentlib(build=True)
+    assert (tmp_path / "instruments.h5").is_file()
+    assert gaf.instrumentlib() is lib
+    assert lib.lookup(dpath / "BG3transmittance.h5") == "BG3transmittance"
+    assert lib.lookup(tmp_path / "BG3transmittance.h5") is None
+    assert "BG3transmittance" in lib
+    assert lib.label("BG3transmittance") == "Schott BG3"
+    assert isinstance(lib["emccdQE"], np.memmap)
+    assert lib.holds(dpath / "ixonWindowT.h5")
+
+    testlambda = np.array([250, 427.8, 555.7, 630.0, 777.4])
+    for f in ("BG3transmittance", "ixonWindowT", "emccdQE"):
+        lamb, T, name = gaf.readcurve(dpath / f"{f}.h5")
+        direct = np.exp(np.interp(testlambda, np.sort(lamb), np.log(T[lamb.argsort()])))
+        assert lib.interp(f, testlambda) == approx(direct, rel=1e-3)
+
+    assert np.isnan(gaf.loadcurve(dpath / "Wratten21transmittance.h5", [800.0], bounds_error=False)[0]).all()
+    with pytest.raises(ValueError):
+        gaf.loadcurve(dpath / "Wratten21transmittance.h5", [800.0])
+
+
+def test_cachedsystemt(monkeypatch):
+    gaf = pytest.importorskip("gridaurora.filterload")
+
+    bg3fn = dpath / "BG3transmittance.h5"
+    windfn = dpath / "ixonWindowT.h5"
+    qefn = dpath / "emccdQE.h5"
+    testlambda = [427.8, 555.7, 630.0]
+
+    calls = []
+    getSystemT = gaf.getSystemT
+    monkeypatch.setattr(gaf, "getSystemT", lambda *args, **kwargs: calls.append(args) or getSystemT(*args, **kwargs))
+
+    T1 = gaf.cachedSystemT(testlambda, bg3fn, windfn, qefn, 0, 12.5)
+    T1["sys"][:] = 0
+    T2 = gaf.cachedSystemT(testlambda, bg3fn, windfn, qefn, 0, 12.5)
+    assert len(calls) == 1
+    assert T2["sys"].values == approx(getSystemT(testlambda, bg3fn, windfn, qefn, 0, 12.5)["sys"].values)
+
+    gaf.cachedSystemT(testlambda, bg3fn, windfn, qefn, 0, 15)
+    assert len(calls) == 2
+
+
+def test_lowtrancache(monkeypatch, tmp_path):
+    gaf = pytest.importorskip("gridaurora.filterload")
+    xarray = pytest.importorskip("xarray")
+    np = pytest.importorskip("numpy")
+
+    calls = []
+
+    def transmittance(c1):
+        calls.append(c1)
+        wl = np.linspace(c1["wlshort"], c1["wllong"], 50)
+        return xarray.Dataset({"transmission": (("angle", "wavelength_nm"), 0.5 + wl[None, :] / 2e3)}, coords={"wavelength_nm": wl})
+
+    monkeypatch.setenv("GRIDAURORA_CACHE", str(tmp_path))
+    monkeypatch.setattr(gaf, "lowtran", type("lowtran", (), {"transmittance": staticmethod(transmittance)}))
+
+    c1 = {"model": 5, "h1": 0.0, "angle": 10.0, "wlshort": np.float64(400), "wllong": 700.0}
+    T1 = gaf.lowtranT(c1)
+    T2 = gaf.lowtranT(dict(c1))
+    assert len(calls) == 1
+    assert T2.values == approx(T1.values)
+    assert T2.wavelength_nm.values == approx(T1.wavelength_nm.values)
+
+    gaf.lowtranT({**c1, "angle": 20.0})
+    assert len(calls) == 2
+
+    gaf.clearlowtrancache(c1)
+    gaf.lowtranT(c1)
+    assert len(calls) == 3
+    # %% size bounded
+    monkeypatch.setattr(gaf, "LOWTRAN_CACHE_BYTES", 0)
+    gaf.lowtranT({**c1, "angle": 30.0})
+    assert len(list((tmp_path / "lowtran").glob("*.h5"))) == 1
+
+    gaf.clearlowtrancache()
+    assert not list((tmp_path / "lowtran").glob("*.h5"))
+    # %% unwritable cache directory still gives the transmittance
+    (tmp_path / "file").touch()
+    monkeypatch.setenv("GRIDAURORA_CACHE", str(tmp_path / "file"))
+    assert gaf.lowtranT(c1).values == approx(T1.values)
+    assert len(calls) == 5
+
+
+def test_atmlut(monkeypatch, tmp_path):
+    gaf = pytest.importorskip("gridaurora.filterload")
+    xarray = pytest.importorskip("xarray")
+    np = pytest.importorskip("numpy")
+
+    def transmittance(c1):
+        wl = np.linspace(c1["wlshort"], c1["wllong"], 301)
+        tau = 0.2 * (400 / wl) ** 4
+        T = np.exp(-tau / np.cos(np.radians(c1["angle"])))
+        return xarray.Dataset({"transmission": (("angle", "wavelength_nm"), T[None, :])}, coords={"wavelength_nm": wl})
+
+    monkeypatch.setenv("GRIDAURORA_CACHE", str(tmp_path))
+    monkeypatch.setattr(gaf, "lowtran", type("lowtran", (), {"transmittance": staticmethod(transmittance)}))
+
+    wl = np.linspace(400, 700, 31)
+    lut = gaf.buildatmlut(0, wl, np.arange(0, 85, 5.0), fn=tmp_path / "lut.h5")
+    lut2 = gaf.loadatmlut(tmp_path / "lut.h5")
+    assert lut2.values == approx(lut.values, rel=1e-6)
+
+    zen = np.array([[3.3, 47.1], [61.0, 79.9]])
+    T = gaf.interpatmlut(lut2, zen)
+    assert T.shape == (2, 2, wl.size)
+
+    tau = 0.2 * (400 / wl) ** 4
+    assert T[1, 0] == approx(np.exp(-tau / np.cos(np.radians(61.0))), rel=1e-5)
+    # %% below the horizon
+    assert gaf.interpatmlut(lut2, [90.0, 95.0, 120.0, 180.0]) == approx(0)
+
+
 if __name__ == "__main__":
     pytest.main([__file__])
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+import pytest
+from pytest import approx
+
+np = pytest.importorskip("numpy")
+
+E = np.logspace(2, 4.35, num=200, base=10)
+P = {
+    "E0": np.array([1000.0, 3000.0]),
+    "Q0": np.array([1e12, 5e11]),
+    "Wbc": np.array([0.5, 0.3]),
+    "bl": np.array([0.8, 0.9]),
+    "bm": np.array([3.0, 2.5]),
+    "bh": np.array([4.0, 3.5]),
+    "Bm": np.array([3000.0, 4000.0]),
+    "Bhf": np.array([0.2, 0.3]),
+    "gamma": np.array([-1.0, -0.5]),
+    "kappa": np.array([2.0, 2.0]),
+    "C0": np.array([1.0, 2.0]),
+}
+
+
+@pytest.mark.parametrize("model", ["strickland", "maxwellian", "ellisonramaty"])
+def test_jacobian(model):
+    gff = pytest.importorskip("gridaurora.fluxfit")
+
+    func, names, logp, fixed = gff.MODELS[model]
+    p = {n: P[n] for n in names}
+    f, df = func(E, p)
+
+    for n in set(names).difference(fixed):
+        h = 1e-6
+        q = dict(p)
+        q[n] = p[n] * np.exp(h) if n in logp else p[n] + h
+        assert (func(E, q)[0] - f) / h == approx(df[n], rel=1e-3, abs=1e-4 * abs(df[n]).max())
+
+
+def test_fitflux():
+    gff = pytest.importorskip("gridaurora.fluxfit")
+    gef = pytest.importorskip("gridaurora.eFluxGen")
+
+    rng = np.random.default_rng(0)
+    N = 50
+    E0 = rng.uniform(500, 4000, N)
+    Q0 = 10 ** rng.uniform(10.5, 12, N)
+    # %% Maxwellian, noisy
+    phi = gef.maxwellian(E, E0, Q0)[0] * np.exp(0.05 * rng.standard_normal((E.size, N)))
+    fit = gff.fitflux(E, phi, "maxwellian")
+    assert fit["converged"].all()
+    assert fit["E0"].values == approx(E0, rel=0.03)
+    assert fit["Q0"].values == approx(Q0, rel=0.1)
+    # %% Strickland, the tail shapes held at their starting values
+    Wbc = rng.uniform(0.25, 1, N)
+    Bhf = rng.uniform(0.1, 0.4, N)
+    phi = gef.fluxgen(E, E0, Q0, Wbc, 0.8, 3.0, 4.0, 3000.0, Bhf, components=False)[0]
+    fit = gff.fitflux(E, phi, "strickland", p0={"bl": 0.8, "bm": 3.0, "bh": 4.0, "Bm": 3000.0}, fixed=("bl", "bm", "bh", "Bm"))
+    assert fit["bl"].values == approx(0.8)
+    assert fit["converged"].mean() > 0.9
+    good = fit["cost"].values < 0.2  # the high tail steps as E0 crosses energy bins
+    assert good.mean() > 0.9
+    assert fit["E0"].values[good] == approx(E0[good], rel=0.02)
+    assert fit["Wbc"].values[good] == approx(Wbc[good], rel=0.05)
+
+    with pytest.raises(ValueError):
+        gff.fitflux(E, phi, "kappa")
+
+
+if __name__ == "__main__":
+    pytest.main(["-x", __file__])
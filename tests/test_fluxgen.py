@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+import pytest
+from pytest import approx
+
+np = pytest.importorskip("numpy")
+
+E = np.logspace(2, 4.35, num=200, base=10)
+E0 = np.array([1e4, 5250, 3500, 2250, 1000, 750, 500])
+Wbc = np.array([0.25, 0.375, 0.4, 0.5, 0.75, 0.9, 1.1])
+bm = np.array([3, 2.5, 2.5, 2.5, 3.0, 3.0, 3.0])
+Bm0 = np.array([6500, 5500, 4750, 4000, 3000, 2500, 2000])
+Bhf = np.array([0.5, 0.3, 0.215, 0.15, 0.125, 0.125, 0.125])
+
+
+def test_fluxgen():
+    gef = pytest.importorskip("gridaurora.eFluxGen")
+
+    Phi, low, mid, hi, base, Q = gef.fluxgen(E, E0, 1e12, Wbc, 0.8, bm, 4.0, Bm0, Bhf)
+    assert Phi.shape == (E.size, E0.size)
+    assert Phi.flags.f_contiguous
+    assert (low + mid + hi + base) == approx(Phi)
+    assert Q == approx(np.trapz(Phi, E, axis=0))
+    # %% one E0 at a time
+    for i in range(E0.size):
+        Phi1, *_ = gef.fluxgen(E, E0[i], 1e12, Wbc[i], 0.8, bm[i], 4.0, Bm0[i], Bhf[i])
+        assert Phi1[:, 0] == approx(Phi[:, i])
+        iE0 = abs(E - E0[i]).argmin()
+        assert hi[E >= E0[i], i] == approx(Bhf[i] * (Phi - hi)[iE0, i] * (E[E >= E0[i]] / E0[i]) ** -4.0)
+    # %% chunked, without components
+    Phic, low, mid, hi, base, Qc = gef.fluxgen(E, E0, 1e12, Wbc, 0.8, bm, 4.0, Bm0, Bhf, components=False, chunk=3)
+    assert low is mid is hi is base is None
+    assert Phic == approx(Phi)
+    assert Qc == approx(Q)
+
+
+def test_diprat():
+    gef = pytest.importorskip("gridaurora.eFluxGen")
+
+    arc = np.array([[3.0, 1.0], [1.0, 4.0], [2.0, 8.0], [4.0, 2.0]])
+    assert gef.diprat(np.array([1.0, 2.0]), arc, np.array([2, 3])) == approx([0.5, 0.5])
+
+
+def test_energygrid():
+    gef = pytest.importorskip("gridaurora.eFluxGen")
+    geg = pytest.importorskip("gridaurora.energygrid")
+
+    E = np.logspace(0, 5.5, 2000)
+    Phi, Q = gef.maxwellian(E, E0, 1e12)
+    grid = geg.energygrid(E)
+    assert geg.energygrid(E.copy()) is grid
+
+    assert Q == approx(np.trapz(Phi, E, axis=0))
+    assert grid.numberflux(Phi) == approx(1e12 / (2 * np.pi * E0), rel=1e-4)
+    assert grid.moments(Phi)[1] == approx(grid.energyflux(Phi))
+    assert grid.meanenergy(Phi) == approx(2 * E0, rel=1e-4)
+    assert grid.characteristic(Phi[:, 2]) == approx(E0[2], rel=1e-4)
+    # %% transcar style bins
+    xarray = pytest.importorskip("xarray")
+    low = E[:-1]
+    high = E[1:]
+    bins = xarray.DataArray(np.column_stack((low, high, np.ones_like(low))), dims=["energy", "type"])
+    bins["type"] = ["low", "high", "flux"]
+    binned = geg.EnergyGrid.from_bins(bins)
+    assert binned.w == approx(high - low)
+    assert binned.numberflux(np.ones(low.size)) == approx(E[-1] - E[0])
+
+
+if __name__ == "__main__":
+    pytest.main(["-x", __file__])
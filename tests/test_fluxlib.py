@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+import pytest
+from pytest import approx
+
+np = pytest.importorskip("numpy")
+
+
+def test_fluxlib(tmp_path):
+    glib = pytest.importorskip("gridaurora.fluxlib")
+    gef = pytest.importorskip("gridaurora.eFluxGen")
+
+    E = np.logspace(2, 4.35, num=81, base=10)
+    params = glib.paramgrid(E0=np.logspace(2.7, 4, 25), Q0=np.logspace(10, 12, 9), Wbc=[0.25, 0.5, 1.0], Bhf=[0.125, 0.3])
+    N = params["E0"].size
+
+    fn = glib.buildfluxlib(tmp_path / "strickland.h5", E, "strickland", dict(params, bl=0.8, bm=3.0, bh=4.0, Bm=3000.0))
+    lib = glib.FluxLibrary(fn)
+    assert len(lib) == N
+    assert lib.params["bl"] == approx(np.full(N, 0.8))
+    # %% library members find themselves
+    i = np.array([3, 700, 17, N - 1])
+    phi = lib.spectra(i)
+    assert phi.shape == (E.size, i.size)
+    dist, idx = lib.query(phi, k=3)
+    assert dist.shape == idx.shape == (i.size, 3)
+    assert (idx[:, 0] == i).all()
+    # %% measured spectra, on another energy grid
+    Em = np.logspace(2, 4.35, 40)
+    phim = gef.fluxgen(Em, [1000.0, 4000.0], 1.1e11, [0.5, 0.25], 0.8, 3.0, 4.0, 3000.0, 0.3, components=False)[0]
+    best = lib.parameters(lib.query(phim, Em)[1][:, 0])
+    assert best["E0"] == approx([1000, 4000], rel=0.15)
+    assert best["Wbc"] == approx([0.5, 0.25])
+    assert best["Q0"] == approx(1e11, rel=0.5)
+
+    with pytest.raises(ValueError):
+        glib.buildfluxlib(tmp_path / "bad.h5", E, "maxwellian", {"E0": 1000.0})
+
+
+if __name__ == "__main__":
+    pytest.main(["-x", __file__])
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+from datetime import datetime
+import pytest
+from pytest import approx
+
+np = pytest.importorskip("numpy")
+xarray = pytest.importorskip("xarray")
+
+z = np.linspace(90, 300, 50)
+E = np.logspace(2, 4.3, 12)
+EKpcolor = np.append(E, 25000.0)
+lamb = np.array([427.8, 557.7, 630.0])
+
+
+def eigenprofiles():
+    rng = np.random.default_rng(0)
+    coords = [("alt_km", z), ("wavelength_nm", lamb), ("energy_ev", E)]
+    return xarray.DataArray(rng.random((z.size, lamb.size, E.size)), coords=coords)
+
+
+def test_forward():
+    gfw = pytest.importorskip("gridaurora.forward")
+
+    P = eigenprofiles()
+    fw = gfw.EigenForward(P, EKpcolor)
+    assert fw.dE == approx(np.diff(EKpcolor))
+
+    phi = np.random.default_rng(1).random((E.size, 7))
+    ref = np.einsum("zwe,en->nzw", P.values * fw.dE, phi)
+
+    ver = fw.ver(phi, chunk=3)
+    assert ver.dims == ("spectrum", "alt_km", "wavelength_nm")
+    assert ver.values == approx(ref)
+    assert fw.ver(phi[:, 2]).values == approx(ref[2])
+
+    br = fw.brightness(phi)
+    assert br.dims == ("spectrum", "wavelength_nm")
+    assert br.values == approx(np.trapz(ref, z, axis=1))
+    assert fw.brightness(phi, zenith_deg=60).values == approx(2 * br.values)
+    # %% time series of spectra, gray eigenprofiles
+    t = np.arange(7.0)
+    flux = xarray.DataArray(phi.T, coords=[("time", t), ("energy_ev", E)])
+    Peigen = P.sum("wavelength_nm")
+    ver = gfw.EigenForward(Peigen, EKpcolor).ver(flux)
+    assert ver.dims == ("time", "alt_km")
+    assert ver.time.values == approx(t)
+    assert ver.values == approx(ref.sum(axis=-1))
+
+    # %% an image of spectra keeps its shape and coordinates
+    img = phi[:, :6].reshape(E.size, 2, 3)
+    ver = fw.ver(img)
+    assert ver.dims == ("spectrum_0", "spectrum_1", "alt_km", "wavelength_nm")
+    assert ver.values == approx(ref[:6].reshape(2, 3, z.size, lamb.size))
+    flux = xarray.DataArray(img.transpose(1, 2, 0), coords=[("y", [10, 20]), ("x", [1, 2, 3]), ("energy_ev", E)])
+    flux.coords["lat"] = (("y", "x"), np.arange(6.0).reshape(2, 3))
+    br = fw.brightness(flux)
+    assert br.dims == ("y", "x", "wavelength_nm")
+    assert br.lat.values == approx(flux.lat.values)
+    assert br.values == approx(np.trapz(ref[:6], z, axis=1).reshape(2, 3, lamb.size))
+
+    with pytest.raises(ValueError):
+        fw.ver(phi[1:])
+
+
+def test_forward_h5(tmp_path):
+    gfw = pytest.importorskip("gridaurora.forward")
+    gwe = pytest.importorskip("gridaurora.writeeigen")
+
+    P = eigenprofiles()
+    ver = P.transpose("energy_ev", "alt_km", "wavelength_nm").expand_dims(time=[datetime(2013, 4, 14, 8, 54)])
+    fn = tmp_path / "eigen.h5"
+    gwe.writeeigen(fn, EKpcolor, ver.time.values.astype(datetime), z, ver=ver, latlon=(65.1, -147.5))
+
+    fw = gfw.EigenForward.from_h5(fn)
+    phi = np.ones(E.size)
+    assert fw.ver(phi).values == approx(gfw.EigenForward(P, EKpcolor).ver(phi).values)
+
+
+if __name__ == "__main__":
+    pytest.main(["-x", __file__])
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+import pytest
+from pytest import approx
+
+np = pytest.importorskip("numpy")
+xarray = pytest.importorskip("xarray")
+pytest.importorskip("scipy")
+
+z = np.linspace(90, 300, 80)
+E = np.logspace(2, 4.3, 15)
+EKpcolor = np.append(E, 25000.0)
+
+
+def eigenprofiles():
+    """
+    gaussian eigenprofiles, peaking lower for harder electrons
+    """
+    zpk = 200 - 40 * np.log10(E / 100)
+    return xarray.DataArray(np.exp(-(((z[:, None] - zpk) / 15) ** 2)) * 1e-3, coords=[("alt_km", z), ("energy_ev", E)])
+
+
+def spectra(N: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    phi = rng.uniform(0, 1e2, (E.size, N))
+    phi[rng.integers(0, E.size, N), np.arange(N)] += rng.uniform(1e3, 1e5, N)
+    return phi
+
+
+def test_inversion():
+    ginv = pytest.importorskip("gridaurora.inversion")
+    gfw = pytest.importorskip("gridaurora.forward")
+
+    P = eigenprofiles()
+    fw = gfw.EigenForward(P, EKpcolor)
+    phi = spectra(50)
+    ver = fw.ver(phi)
+
+    inv = ginv.EigenInversion(P, EKpcolor, lam=1e-8)
+    r = inv.solve(ver, maxiter=2000)
+    assert r.flux.dims == ("energy_ev", "spectrum")
+    assert r.converged.all()
+    assert (r.flux >= 0).all()
+    assert np.median(r.residual / np.linalg.norm(ver.values, axis=1)) < 1e-3
+    assert fw.ver(r.flux).values == approx(ver.values, rel=0.02, abs=1e-3 * ver.values.max())
+    # %% one pixel, plain arrays
+    r1 = inv.solve(ver.values[3], maxiter=2000)
+    assert r1.flux.dims == ("energy_ev",)
+    assert r1.flux.values == approx(r.flux[:, 3].values, rel=1e-2, abs=1e-2 * phi[:, 3].max())
+    assert inv.solve(ver.values).flux.dims == ("energy_ev", "pixel")
+    # %% next frame starts from this one
+    ver2 = fw.ver(phi * 1.02)
+    cold = inv.solve(ver2, maxiter=2000)
+    warm = inv.solve(ver2, warm=r, maxiter=2000)
+    assert warm.niter.sum() < cold.niter.sum()
+    assert warm.flux.values == approx(cold.flux.values, rel=0.05, abs=1e-2 * phi.max())
+    # %% iteration budget
+    short = inv.solve(ver2, maxiter=3)
+    assert short.niter.max() <= 3
+    assert not short.converged.all()
+
+    with pytest.raises(ValueError):
+        inv.solve(ver2, warm=r1)
+    with pytest.raises(ValueError):
+        inv.solve(ver.values[:, :-1])
+
+
+def test_frame():
+    """
+    an image of VER profiles keeps its pixel dimensions and coordinates
+    """
+    ginv = pytest.importorskip("gridaurora.inversion")
+    gfw = pytest.importorskip("gridaurora.forward")
+
+    P = eigenprofiles()
+    fw = gfw.EigenForward(P, EKpcolor)
+    phi = spectra(6).reshape(E.size, 2, 3)
+    ver = fw.ver(phi).values  # 2 x 3 x Nalt
+
+    inv = ginv.EigenInversion(P, EKpcolor, lam=1e-8)
+    r = inv.solve(ver, maxiter=2000)
+    assert r.flux.dims == ("energy_ev", "pixel_0", "pixel_1")
+    assert r.flux.shape == phi.shape
+    assert r.converged.shape == (2, 3)
+    assert r.flux.values == approx(phi, rel=0.02, abs=1e-2 * phi.max())
+
+    lat = np.arange(6.0).reshape(2, 3)
+    frame = xarray.DataArray(ver, coords={"alt_km": z, "lat": (("y", "x"), lat)}, dims=("y", "x", "alt_km"))
+    rf = inv.solve(frame, maxiter=2000)
+    assert rf.flux.dims == ("energy_ev", "y", "x")
+    assert rf.residual.dims == ("y", "x")
+    assert rf.lat.values == approx(lat)
+    assert rf.flux.values == approx(r.flux.values)
+    # %% the next frame starts from this one
+    assert (inv.solve(frame, warm=rf).niter <= 2).all()
+
+
+def test_regularizer():
+    ginv = pytest.importorskip("gridaurora.inversion")
+
+    assert ginv.regularizer(None, 4) == approx(np.eye(4))
+    assert ginv.regularizer("gradient", 4) @ np.ones(4) == approx(0)
+    assert ginv.regularizer("curvature", 4) @ np.arange(4.0) == approx(0)
+    with pytest.raises(ValueError):
+        ginv.regularizer("tv", 4)
+    with pytest.raises(ValueError):
+        ginv.regularizer(np.eye(3), 4)
+    # %% smoothing pulls a spike towards its neighbours, and straightens the flux spectrum itself
+    P = eigenprofiles()
+    fw = pytest.importorskip("gridaurora.forward").EigenForward(P, EKpcolor)
+    phi = np.zeros(E.size)
+    phi[7] = 1e4
+    D2 = ginv.regularizer("curvature", E.size)
+    ridge = ginv.EigenInversion(P, EKpcolor, lam=1e-8).solve(fw.ver(phi), maxiter=2000)
+    smooth = ginv.EigenInversion(P, EKpcolor, lam=1e2, L="curvature").solve(fw.ver(phi), maxiter=2000)
+    assert smooth.flux[7] < ridge.flux[7]
+    assert np.linalg.norm(D2 @ smooth.flux.values) < 0.1 * np.linalg.norm(smooth.flux.values)
+    assert np.linalg.norm(D2 @ ridge.flux.values) > 0.5 * np.linalg.norm(ridge.flux.values)
+    # %% column brightness needs altitude
+    with pytest.raises(ValueError):
+        ginv.EigenInversion(P.isel(alt_km=0), EKpcolor, brightness=True)
+
+
+if __name__ == "__main__":
+    pytest.main(["-x", __file__])
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+from datetime import datetime, timedelta
+import pytest
+from pytest import approx
+
+np = pytest.importorskip("numpy")
+xarray = pytest.importorskip("xarray")
+
+t = [datetime(2013, 4, 14, 8) + timedelta(hours=h) for h in range(3)]
+E = np.logspace(2, 4.3, 6)
+EKpcolor = np.append(E, 25000.0)
+z = np.linspace(90, 300, 20)
+lamb = np.array([427.8, 557.7, 630.0, 844.6])
+reaction = ["no1d", "no1s", "noii2p"]
+
+
+def eigenfile(fn, tol=None):
+    gwe = pytest.importorskip("gridaurora.writeeigen")
+
+    rng = np.random.default_rng(0)
+    dims = [("time", t), ("energy_ev", E), ("alt_km", z)]
+    ver = xarray.DataArray(rng.random((len(t), E.size, z.size, lamb.size)), coords=dims + [("wavelength_nm", lamb)])
+    prates = xarray.DataArray(rng.random((len(t), E.size, z.size, len(reaction))), coords=dims + [("reaction", reaction)])
+    lrates = prates * 0.5
+    tezs = xarray.DataArray(rng.random((len(t), z.size, E.size)), dims=["time", "alt_km", "energy_ev"])
+    gwe.writeeigen(fn, EKpcolor, t, z, np.eye(E.size), ver, prates, lrates, tezs, latlon=(65.1, -147.5), tol=tol)
+
+    return ver, prates, lrates, tezs
+
+
+def test_readeigen(tmp_path, monkeypatch):
+    gre = pytest.importorskip("gridaurora.readeigen")
+
+    fn = tmp_path / "eigen.h5"
+    ver, prates, lrates, tezs = eigenfile(fn)
+
+    reads = []
+    getitem = gre.H5Array._getitem
+
+    def spy(self, key):
+        reads.append((self.path, key))
+        return getitem(self, key)
+
+    monkeypatch.setattr(gre.H5Array, "_getitem", spy)
+
+    with gre.readeigen(fn) as ds:
+        assert not reads
+        assert ds.time.values[1] == np.datetime64(t[1])
+        assert ds.ut1_unix[0] == approx((t[0] - datetime(1970, 1, 1)).total_seconds())
+        assert ds.energy_ev.values == approx(E)
+        assert ds.Ebins.values == approx(EKpcolor)
+        assert ds.alt_km.values == approx(z)
+        assert ds.wavelength_nm.values == approx(lamb)
+        assert list(ds.reaction.values) == reaction
+        assert ds.sensorloc == approx([65.1, -147.5])
+        assert ds.ver.dims == ("time", "energy_ev", "alt_km", "wavelength_nm")
+        assert ds.ver.attrs["unit"] == "photons cm^-3 sr^-1 s^-1"
+        # %% one wavelength reads only that wavelength
+        assert ds.ver.sel(wavelength_nm=557.7).values == approx(ver.sel(wavelength_nm=557.7).values)
+        assert len(reads) == 1
+        assert reads[0][0] == "/ver/eigenprofile"
+        assert reads[0][1][-1] == 1
+
+        assert ds.ver.isel(time=2, energy_ev=[4, 1]).values == approx(ver.isel(time=2, energy_ev=[4, 1]).values)
+        assert ds.prates.values == approx(prates.values)
+        assert ds.lrates.isel(reaction=-1).values == approx(lrates.isel(reaction=-1).values)
+        assert ds.tezs.values == approx(tezs.values)
+        assert ds.diffnumflux.values == approx(np.eye(E.size))
+
+
+def test_readeigen_tucker(tmp_path):
+    gre = pytest.importorskip("gridaurora.readeigen")
+
+    fn = tmp_path / "eigen.h5"
+    ver = eigenfile(fn, tol=1e-6)[0]
+
+    with gre.readeigen(fn) as ds:
+        assert ds.ver_relerr <= 1e-6
+        assert ds.wavelength_nm.values == approx(lamb)
+        assert ds.ver.isel(time=1, wavelength_nm=[3, 0]).values == approx(ver.isel(time=1, wavelength_nm=[3, 0]).values)
+        assert ds.ver.values == approx(ver.values)
+
+
+if __name__ == "__main__":
+    pytest.main(["-x", __file__])
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+from datetime import datetime, timedelta
+import pytest
+from pytest import approx
+
+np = pytest.importorskip("numpy")
+xarray = pytest.importorskip("xarray")
+
+t = [datetime(2013, 4, 14, 8) + timedelta(hours=h) for h in range(4)]
+E = np.logspace(2, 4.3, 15)
+EKpcolor = np.append(E, 25000.0)
+z = np.linspace(90, 400, 60)
+lamb = np.linspace(300, 900, 12)
+
+
+def eigenprofiles():
+    """
+    each wavelength a mix of three source profiles that vary in time, plus a little noise
+    """
+    rng = np.random.default_rng(0)
+    zpk = 200 - 40 * np.log10(E / 100)
+    src = np.stack([np.exp(-(((z[:, None] - zpk - s) / w) ** 2)) for s, w in ((0, 15), (20, 20), (60, 45))])
+    X = np.einsum("tk,wk,kze->tezw", rng.random((len(t), 3)), rng.random((lamb.size, 3)), src)
+    X *= 1 + 1e-3 * rng.standard_normal(X.shape)
+    coords = [("time", np.arange(len(t))), ("energy_ev", E), ("alt_km", z), ("wavelength_nm", lamb)]
+    return xarray.DataArray(X, coords=coords)
+
+
+def test_tucker(tmp_path):
+    gt = pytest.importorskip("gridaurora.tucker")
+
+    X = eigenprofiles()
+    for tol in (1e-2, 1e-4):
+        T = gt.Tucker.fromarray(X, tol)
+        err = np.linalg.norm(T.reconstruct().values - X.values) / np.linalg.norm(X.values)
+        assert err == approx(T.relerr)
+        assert err <= tol
+
+    T = gt.Tucker.fromarray(X, 1e-2)
+    assert T.ratio > 10
+    assert T.shape == X.shape
+    for U in T.factors:
+        assert U.T @ U == approx(np.eye(U.shape[1]))
+    # %% capped ranks report their error
+    small = gt.Tucker.fromarray(X.values, ranks=(1, 1, 1, 1))
+    assert small.dims == gt.TUCKER_DIMS
+    assert small.relerr > 1e-2
+
+    fn = tmp_path / "tucker.h5"
+    T.to_h5(fn)
+    T2 = gt.Tucker.from_h5(fn)
+    assert T2.dims == T.dims
+    assert T2.relerr == T.relerr
+    assert T2.reconstruct().values == approx(T.reconstruct().values)
+    assert T2.coords["alt_km"] == approx(z)
+    # %% rewriting replaces the stored cube
+    small.to_h5(fn)
+    assert gt.Tucker.from_h5(fn).ranks == (1, 1, 1, 1)
+
+    with pytest.raises(ValueError):
+        gt.hosvd(X.values, ranks=(2, 2))
+
+
+def test_tucker_forward(tmp_path):
+    gt = pytest.importorskip("gridaurora.tucker")
+    gfw = pytest.importorskip("gridaurora.forward")
+    gwe = pytest.importorskip("gridaurora.writeeigen")
+
+    X = eigenprofiles()
+    T = gt.Tucker.fromarray(X, 1e-3)
+    fw = gfw.EigenForward(X.isel(time=2), EKpcolor)
+    tf = gfw.TuckerForward(T, EKpcolor, itime=2)
+
+    phi = np.random.default_rng(1).random((E.size, 9))
+    ref = fw.ver(phi)
+    ver = tf.ver(phi, chunk=4)
+    assert ver.dims == ref.dims
+    assert ver.values == approx(ref.values, rel=1e-2, abs=1e-2 * abs(ref.values).max())
+    assert tf.ver(phi[:, 0]).dims == ("alt_km", "wavelength_nm")
+    assert tf.brightness(phi, zenith_deg=30).values == approx(fw.brightness(phi, zenith_deg=30).values, rel=1e-2)
+    assert tf.project(ref.values) == approx(tf.coefficients(phi), rel=1e-2, abs=1e-2 * abs(ref.values).max())
+    # %% compressed writeeigen file
+    fn = tmp_path / "eigen.h5"
+    gwe.writeeigen(fn, EKpcolor, t, z, ver=X, latlon=(65.1, -147.5), tol=1e-3)
+    tf2 = gfw.EigenForward.from_h5(fn, itime=2)
+    assert isinstance(tf2, gfw.TuckerForward)
+    assert tf2.ver(phi).values == approx(ver.values)
+
+
+if __name__ == "__main__":
+    pytest.main(["-x", __file__])
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+from datetime import datetime, timedelta
+import pytest
+from pytest import approx
+
+np = pytest.importorskip("numpy")
+xarray = pytest.importorskip("xarray")
+h5py = pytest.importorskip("h5py")
+
+t = [datetime(2013, 4, 14, 8) + timedelta(hours=h) for h in range(3)]
+E = np.logspace(2, 4.3, 6)
+EKpcolor = np.append(E, 25000.0)
+z = np.linspace(90, 300, 20)
+lamb = np.array([427.8, 557.7, 630.0, 844.6])
+
+
+def eigenprofiles():
+    rng = np.random.default_rng(0)
+    coords = [("time", t), ("energy_ev", E), ("alt_km", z), ("wavelength_nm", lamb)]
+    ver = xarray.DataArray(rng.random((len(t), E.size, z.size, lamb.size)) * 1e3, coords=coords)
+    tezs = xarray.DataArray(rng.random((len(t), z.size, E.size)), dims=["time", "alt_km", "energy_ev"])
+    return ver, tezs
+
+
+def test_append(tmp_path):
+    gwe = pytest.importorskip("gridaurora.writeeigen")
+    gre = pytest.importorskip("gridaurora.readeigen")
+
+    ver, tezs = eigenprofiles()
+    fn = tmp_path / "append.h5"
+    for i in range(len(t)):
+        gwe.writeeigen(fn, EKpcolor, t[i], z, ver=ver.isel(time=[i]), tezs=tezs.isel(time=[i]), latlon=(65.1, -147.5), append=True)
+
+    with h5py.File(fn, "r") as f:
+        d = f["/ver/eigenprofile"]
+        assert d.maxshape[0] is None
+        assert d.chunks == gwe.eigenchunks(ver.shape, whole=(2,))
+        assert d.shuffle
+
+    with gre.readeigen(fn) as ds:
+        assert ds.time.size == len(t)
+        assert ds.ver.values == approx(ver.values)
+        assert ds.tezs.values == approx(tezs.values)
+
+    # %% a rejected append leaves the file as it was
+    bad = [
+        dict(z=z[1:], ver=ver[:1], tezs=tezs[:1]),
+        dict(z=z, ver=ver[:1, :, :, :2], tezs=tezs[:1]),
+        dict(z=z, ver=ver[:1], tezs=tezs[:1, :-1]),
+        dict(z=z, ver=ver[:1]),
+        dict(z=z, ver=ver[:1], tezs=tezs[:1], prates=tezs[:1]),
+    ]
+    for kw in bad:
+        with pytest.raises(ValueError):
+            gwe.writeeigen(fn, EKpcolor, t[0], latlon=(65.1, -147.5), append=True, **kw)
+        with gre.readeigen(fn) as ds:
+            assert ds.time.size == len(t)
+            assert ds.ver.shape == ver.shape
+
+    with pytest.raises(ValueError):
+        gwe.writeeigen(fn, EKpcolor, t, z, ver=ver, latlon=(65.1, -147.5), append=True, tol=1e-3)
+
+
+def test_storage(tmp_path):
+    gwe = pytest.importorskip("gridaurora.writeeigen")
+
+    assert gwe.eigenchunks((24, 33, 250, 40), np.float32, (2,)) == (1, 16, 250, 16)
+    assert gwe.eigenchunks((24, 250, 33), np.float32, (1,)) == (1, 250, 33)
+
+    ver = eigenprofiles()[0]
+    fn = tmp_path / "lzf.h5"
+    gwe.writeeigen(fn, EKpcolor, t, z, ver=ver, latlon=(65.1, -147.5), compression="lzf", dtype=np.float32, scaleoffset=2)
+    with h5py.File(fn, "r") as f:
+        d = f["/ver/eigenprofile"]
+        assert d.dtype == np.float32
+        assert d.compression == "lzf"
+        assert d.scaleoffset == 2
+        assert d[:] == approx(ver.values, abs=0.01)
+
+    with pytest.raises(ValueError):
+        gwe.h5filters("zstd")
+
+    if gwe.hdf5plugin is None:
+        with pytest.raises(ImportError):
+            gwe.h5filters("lz4")
+    else:
+        fn = tmp_path / "lz4.h5"
+        gwe.writeeigen(fn, EKpcolor, t, z, ver=ver, latlon=(65.1, -147.5), compression="lz4")
+        with h5py.File(fn, "r") as f:
+            assert f["/ver/eigenprofile"][:] == approx(ver.values)
+
+
+if __name__ == "__main__":
+    pytest.main(["-x", __file__])